@@ -1,25 +1,52 @@
 #!/usr/bin/env python3
 
 import argparse
+import asyncio
 import base64
+import collections
+import copy
+import glob
+import gzip
+import hashlib
+import heapq
+import itertools
 import json
+import logging
 import multiprocessing as mp
 import os
+import pickle
+import re
+import shutil
+import socket
+import ssl
+import struct
 import subprocess
+import tempfile
+import threading
+import time
 import traceback
+import urllib.request
+import zlib
 from functools import partial
 from multiprocessing import Lock
 from urllib.parse import urlparse
 
+import numpy as np
 import pychrome
 import tld.exceptions
 from abp.filters import parse_filterlist
 from abp.filters.parser import Filter
-from langdetect import detect
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from langdetect import DetectorFactory
+from langdetect.detector_factory import PROFILES_DIRECTORY
 from pprint import pprint
 from tld import get_fld, get_tld
 from tranco import Tranco
 
+# diagnostics of the browsers and connections that do not belong to the
+# result of a page
+logger = logging.getLogger(__name__)
+
 
 # Possible improvements:
 # - if cookie notice is displayed in iframe (e.g. forbes.com), currently the 
@@ -30,6 +57,183 @@ from tranco import Tranco
 FAILED_REASON_TIMEOUT = 'Page.navigate timeout'
 FAILED_REASON_STATUS_CODE = 'status code'
 FAILED_REASON_LOADING = 'loading failed'
+FAILED_REASON_CANCELLED = 'cancelled'
+FAILED_REASON_UNREACHABLE = 'unreachable'
+FAILED_REASON_NOT_ARCHIVED = 'not archived'
+
+# the next protocol and subdomain is tried if a page fails for these reasons
+FALLBACK_FAILED_REASONS = [FAILED_REASON_LOADING, FAILED_REASON_TIMEOUT]
+
+# if the fallbacks are raced, every variant starts this number of seconds
+# after the previous one or as soon as all previous ones failed
+FALLBACK_HEAD_START = 0.25
+
+# if a variant commits its navigation, it waits at most this number of
+# seconds for the previous variants that are still loading, so that the
+# result does not depend on which variant was a bit faster
+FALLBACK_GRACE_PERIOD = 1
+
+# the pre-flight check connects to the protocol and subdomain variants of all
+# pages before they are scanned, only reachable variants are scanned
+PREFLIGHT_TIMEOUT = 5
+PREFLIGHT_CONCURRENCY = 100
+PREFLIGHT_PORTS = {'http': 80, 'https': 443}
+
+# the fleet launches chromium instances with these arguments (see
+# `run-chromium.sh`) and checks their health every interval (in seconds), an
+# instance is restarted if its process exited or it did not answer the given
+# number of checks in a row
+CHROMIUM_PATHS = ['/usr/bin/chromium', '/usr/bin/chromium-browser', '/Applications/Chromium.app/Contents/MacOS/Chromium']
+CHROMIUM_ARGUMENTS = [
+    '--enable-automation', '--no-first-run', '--disk-cache-size=0',
+    '--window-size=1400,950', '--window-position=0,0',
+    '--disable-features=IsolateOrigins,site-per-process',
+]
+BROWSER_START_TIMEOUT = 30
+HEALTH_CHECK_INTERVAL = 10
+HEALTH_CHECK_TIMEOUT = 5
+HEALTH_CHECK_FAILURES = 3
+
+# clients for the DevTools protocol:
+# - `pychrome`: one websocket with a receive and an event thread per tab
+# - `asyncio`: one websocket per browser on an event loop, the tabs are
+#   sessions of it and their events are handled by a pool of threads
+CDP_CLIENT_PYCHROME = 'pychrome'
+CDP_CLIENT_ASYNCIO = 'asyncio'
+CDP_CLIENTS = [CDP_CLIENT_PYCHROME, CDP_CLIENT_ASYNCIO]
+CDP_EVENT_WORKERS = 16
+
+# the key of the websocket handshake is hashed with this GUID by the server
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+# engines to detect cookie notices:
+# - `cdp`: separate protocol calls for every step and node
+# - `bundle`: one script per frame that runs all steps inside the page
+# - `snapshot`: the steps run in python on a snapshot of the page
+DETECTION_ENGINE_CDP = 'cdp'
+DETECTION_ENGINE_BUNDLE = 'bundle'
+DETECTION_ENGINE_SNAPSHOT = 'snapshot'
+DETECTION_ENGINES = [DETECTION_ENGINE_CDP, DETECTION_ENGINE_BUNDLE, DETECTION_ENGINE_SNAPSHOT]
+
+# after the load event, the scan waits until the page settled: no requests
+# are in flight and the DOM was not changed for the quiet time (in seconds),
+# but not longer than the settle timeout
+SETTLE_TIMEOUT = 5
+SETTLE_QUIET_TIME = 0.5
+SETTLE_REASON_QUIET = 'quiet'
+SETTLE_REASON_TIMEOUT = 'timeout'
+
+# requests of these types stay open as long as the page, they are not
+# waited for
+SETTLE_IGNORED_RESOURCE_TYPES = ['EventSource', 'WebSocket']
+
+# resource classes that can be blocked because they do not affect the
+# detection of cookie notices, mapped to their resource types; images of the
+# class `large-image` are only blocked if their response is larger than
+# `LARGE_IMAGE_SIZE` bytes
+RESOURCE_CLASS_LARGE_IMAGE = 'large-image'
+BLOCKABLE_RESOURCE_CLASSES = {
+    'media': 'Media',
+    'font': 'Font',
+    'image': 'Image',
+    RESOURCE_CLASS_LARGE_IMAGE: 'Image',
+}
+LARGE_IMAGE_SIZE = 100000
+
+# the maximum number of seconds to wait for the effects of a click, the wait
+# ends earlier when a navigation starts or the page is quiet
+CLICK_TIMEOUT = 1
+
+# the responses of the scan of a page can be stored and served to the reloads
+# of its clicks, the bodies are kept in memory up to this number of bytes and
+# written to a temporary file afterwards
+RESPONSE_STORE_MEMORY_LIMIT = 50 * 1024 * 1024
+
+# the bodies of the recorded responses are fetched from the browser once the
+# scan is done, it keeps them up to these numbers of bytes in total and per
+# response
+RESPONSE_STORE_BROWSER_BUFFER_SIZE = 200 * 1024 * 1024
+RESPONSE_STORE_BROWSER_RESOURCE_BUFFER_SIZE = 20 * 1024 * 1024
+
+# a scanner adds the responses of the page to its response store or serves
+# the requests of the page from it, requests that are not stored go to the
+# network unless only the stored responses are replayed
+RESPONSE_STORE_RECORD = 'record'
+RESPONSE_STORE_REPLAY = 'replay'
+RESPONSE_STORE_REPLAY_ONLY = 'replay-only'
+
+# the responses of a page can be recorded into an archive file per domain
+# and replayed from it without network, the version needs to be increased
+# whenever the format changes
+RESPONSE_ARCHIVE_MAGIC = b'CNSARCHV'
+RESPONSE_ARCHIVE_VERSION = 3
+
+# these headers of stored responses are not served because the bodies are
+# stored decoded
+RESPONSE_STORE_EXCLUDED_HEADERS = ['content-encoding', 'content-length', 'transfer-encoding']
+
+# the maximum number of clicks on the clickables of a page that are done at
+# once, each in its own tab and browser context
+CLICK_CONCURRENCY = 4
+
+# the keywords that are searched in the text of the page, the preset or a
+# list of keywords is chosen with `--keywords`
+SEARCH_KEYWORD_PRESETS = {
+    'cookie': ['cookie'],
+    'multilingual': [
+        'cookie', 'consent', 'gdpr', 'rgpd', 'dsgvo', 'datenschutz', 'galletas',
+        'témoins', 'çerez', 'ciasteczk', 'eväste', 'sütik',
+    ],
+}
+SEARCH_KEYWORDS = SEARCH_KEYWORD_PRESETS.get('cookie')
+
+# the maximum length of the html and text of cookie notices and clickables,
+# longer values are truncated (0 for no limit)
+MAX_PROPERTY_LENGTH = 100000
+
+# the unique class and attribute combinations of cookie notices are searched
+# smallest first up to this number of classes or attributes, at most the
+# given number of combinations is checked for each property
+MAX_COMBINATION_SIZE = 3
+MAX_COMBINATION_QUERIES = 200
+
+# the maximum number of clickables of a cookie notice (0 for no limit), if a
+# notice has more clickables, the ones whose text or attributes contain one
+# of the keywords are kept first, then buttons before links
+MAX_CLICKABLES = 50
+CLICKABLE_KEYWORDS = [
+    'accept', 'agree', 'allow', 'consent', 'got it', 'understand', 'reject', 'decline', 'deny', 'refuse',
+    'necessary', 'essential', 'settings', 'preferences', 'manage', 'customize', 'akzeptieren', 'zustimmen',
+    'einverstanden', 'ablehnen', 'accepter', 'refuser', 'aceptar', 'rechazar', 'accetta', 'rifiuta',
+]
+
+# the language is detected on a sample of the text of the page with at most
+# this number of characters, the detection runs in a pool of worker threads
+# and is seeded so that it is deterministic
+LANGUAGE_SAMPLE_LENGTH = 2000
+LANGUAGE_DETECTION_WORKERS = 2
+LANGUAGE_DETECTION_SEED = 0
+
+# the maximum number of detected languages that are cached by the hash of
+# their text sample
+LANGUAGE_CACHE_SIZE = 10000
+
+# the name of the isolated world in which scripts of the scanner run
+ISOLATED_WORLD_NAME = 'cookie-notice-scanner'
+
+# the version of the compiled filter lists, needs to be increased whenever
+# the format changes so that outdated compiled filter lists are not used
+ABP_FILTER_CACHE_VERSION = 3
+
+# the number of rules that are joined to one selector list for `querySelectorAll`
+RULES_GROUP_SIZE = 500
+
+# a selector starting with an id or a class can only match if the page
+# contains an element with this id or class
+ABP_TOKEN_SELECTOR_REGEXP = re.compile(r'^([#.]-?[_a-zA-Z][\w-]*)(?=$|[\s.#:\[>+~])')
+
+# pseudo-classes of extended selectors that only adblockers understand
+ABP_EXTENDED_SELECTOR_REGEXP = re.compile(r':(-abp-[a-z-]+|has-text|contains|matches-css[a-z-]*|xpath|style|upward|remove)\(')
 
 
 class Webpage:
@@ -39,6 +243,9 @@ class Webpage:
         self.protocol = protocol
         self.url = f'{self.protocol}://{self.domain}'
 
+        # the variants that were checked by `ReachabilityChecker`
+        self.reachability = None
+
     def set_protocol(self, protocol):
         self.protocol = protocol
         self.url = f'{self.protocol}://{self.domain}'
@@ -49,6 +256,27 @@ class Webpage:
     def remove_subdomain(self):
         self.url = f'{self.protocol}://{self.domain}'
 
+    def set_reachability(self, reachability):
+        self.reachability = reachability
+
+    def get_fallbacks(self):
+        """Returns the protocol and subdomain variants of the webpage in the
+        order in which they are tried (see `Browser.scan_page`), only the
+        reachable ones if the reachability was checked."""
+        fallbacks = []
+        for protocol in ['https', 'http']:
+            for subdomain in [None, 'www']:
+                fallback = Webpage(rank=self.rank, domain=self.domain, protocol=protocol)
+                if subdomain is not None:
+                    fallback.set_subdomain(subdomain)
+                fallback.set_reachability(self.reachability)
+                fallbacks.append(fallback)
+
+        if self.reachability is None:
+            return fallbacks
+        reachable_urls = [variant.get('url') for variant in self.reachability if variant.get('reachable')]
+        return [fallback for fallback in fallbacks if fallback.url in reachable_urls]
+
 
 class WebpageResult:
     def __init__(self, webpage):
@@ -57,6 +285,7 @@ class WebpageResult:
         self.tld = get_tld(webpage.url)
         self.protocol = webpage.protocol
         self.url = webpage.url
+        self.reachability = webpage.reachability
 
         self.redirects = []
 
@@ -70,8 +299,12 @@ class WebpageResult:
         self.stopped_waiting = False
         self.stopped_waiting_reason = None
 
+        self.settle_time = None
+        self.settle_reason = None
+
         self.requests = []
         self.responses = []
+        self.unreplayed_requests = []
         self.cookies = {}
         self.screenshots = {}
 
@@ -80,8 +313,10 @@ class WebpageResult:
         self.is_cmp_defined = False
         self.cookie_notice_count = {}
         self.cookie_notices = {}
+        self.dom_snapshot = None
+        self.node_fact_cache = None
 
-        self._json_excluded_fields = ['_json_excluded_fields', 'screenshots']
+        self._json_excluded_fields = ['_json_excluded_fields', 'screenshots', 'dom_snapshot']
 
     def add_redirect(self, url, root_frame=True):
         self.redirects.append({
@@ -102,9 +337,23 @@ class WebpageResult:
         self.stopped_waiting = True
         self.stopped_waiting_reason = reason
 
-    def add_request(self, request_url):
+    def set_settled(self, settle_time, reason):
+        self.settle_time = settle_time
+        self.settle_reason = reason
+
+    def add_request(self, request_url, blocked=False):
         self.requests.append({
             'url': request_url,
+            'blocked': blocked,
+        })
+
+    def set_request_blocked(self, index):
+        self.requests[index]['blocked'] = True
+
+    def add_unreplayed_request(self, method, url):
+        self.unreplayed_requests.append({
+            'method': method,
+            'url': url,
         })
 
     def add_response(self, requested_url, status, mime_type, headers):
@@ -134,6 +383,12 @@ class WebpageResult:
         self.cookie_notice_count[detection_technique] = len(cookie_notices)
         self.cookie_notices[detection_technique] = cookie_notices
 
+    def set_dom_snapshot(self, dom_snapshot):
+        self.dom_snapshot = dom_snapshot
+
+    def set_node_fact_cache_statistics(self, statistics):
+        self.node_fact_cache = statistics
+
     def save_screenshots(self, directory):
         for name, screenshot in self.screenshots.items():
             self._save_screenshot(name, screenshot, directory)
@@ -152,6 +407,15 @@ class WebpageResult:
     def _get_filename_for_data(self):
         return f'{self.rank}-{self.domain}.json'
 
+    def save_dom_snapshot(self, directory):
+        if self.dom_snapshot is None:
+            return
+        with gzip.open(f'{directory}/{self._get_filename_for_dom_snapshot()}', 'wt', encoding='utf8') as file:
+            json.dump(self.dom_snapshot, file)
+
+    def _get_filename_for_dom_snapshot(self):
+        return f'{self.rank}-{self.domain}.snapshot.json.gz'
+
     def _to_json(self):
         results = {k: v for k, v in self.__dict__.items() if k not in self._json_excluded_fields}
         return json.dumps(results, indent=4, default=lambda o: o.__dict__, ensure_ascii=False)
@@ -173,6 +437,7 @@ class ClickResult:
         self.new_pages = []
         self.cookie_notice_visible_after_click = None
         self.is_page_modal = None
+        self.unreplayed_requests = []
 
     def set_cookies(self, key, cookies):
         self.cookies[key] = cookies
@@ -195,15 +460,945 @@ class ClickResult:
     def set_is_page_modal(self, is_page_modal):
         self.is_page_modal = is_page_modal
 
+    def set_unreplayed_requests(self, unreplayed_requests):
+        self.unreplayed_requests = unreplayed_requests
+
+
+class NodeFactCache:
+    """Caches facts about nodes (e.g. their name) during the scan of a page.
+
+    Facts of a node and its descendants are dropped when the node is
+    removed, facts that depend on the layout (e.g. the visibility) on every
+    change of the DOM and all facts when the document is updated. The
+    descendants and the frames of nodes are known from the nodes that the
+    browser sent (see `add_nodes`). The DOM events arrive on another
+    thread, facts that were computed while the cache was invalidated are
+    not stored.
+    """
+    # facts that can change with any change of the DOM
+    LAYOUT_FACTS = ['visibility']
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._facts = {}
+        self._children = {}
+        self._parents = {}
+        self._document_frame_ids = {}
+        self._generation = 0
+        self.hits = {}
+        self.misses = {}
+
+    def get(self, fact, node_id, compute):
+        """Returns the fact about the node, `compute` is called with the node id if it is not cached."""
+        return self.get_many(fact, [node_id], lambda node_ids: {node_id: compute(node_id) for node_id in node_ids}).get(node_id)
+
+    def get_many(self, fact, node_ids, compute_many):
+        """Returns the fact about the nodes by node id.
+
+        `compute_many` is called with the node ids that are not cached and
+        returns their facts by node id.
+        """
+        result = {}
+        missing_node_ids = []
+        with self._lock:
+            facts = self._facts.setdefault(fact, {})
+            for node_id in dict.fromkeys(node_ids):
+                if node_id in facts:
+                    result[node_id] = facts.get(node_id)
+                else:
+                    missing_node_ids.append(node_id)
+            self.hits[fact] = self.hits.get(fact, 0) + len(result)
+            self.misses[fact] = self.misses.get(fact, 0) + len(missing_node_ids)
+            generation = self._generation
+
+        if len(missing_node_ids) == 0:
+            return result
+
+        # the protocol calls are done without lock, otherwise the events
+        # could not be handled in the meantime
+        computed_facts = compute_many(missing_node_ids)
+        with self._lock:
+            if self._generation == generation:
+                self._facts.setdefault(fact, {}).update(computed_facts)
+        result.update(computed_facts)
+        return result
+
+    def add_nodes(self, parent_node_id, nodes):
+        """Stores the children of the parent node and their descendants, the
+        nodes are `DOM.Node`s."""
+        with self._lock:
+            self._add_nodes(parent_node_id, nodes)
+
+    def _add_nodes(self, parent_node_id, nodes, parent_frame_id=None):
+        children = self._children.setdefault(parent_node_id, set())
+        for node in nodes:
+            node_id = node.get('nodeId')
+            children.add(node_id)
+            self._parents[node_id] = parent_node_id
+
+            # documents belong to their own frame, the frame of a child
+            # document is known from its frame owner
+            if node.get('nodeType') == NODE_TYPE_DOCUMENT:
+                self._document_frame_ids[node_id] = node.get('frameId', parent_frame_id)
+
+            descendants = node.get('children', []) + node.get('shadowRoots', []) + node.get('pseudoElements', [])
+            if 'contentDocument' in node:
+                descendants.append(node.get('contentDocument'))
+            if 'templateContent' in node:
+                descendants.append(node.get('templateContent'))
+            if len(descendants) > 0:
+                self._add_nodes(node_id, descendants, node.get('frameId'))
+
+    def get_frame_id(self, node_id):
+        """Returns the id of the frame whose document contains the node or
+        `None` if it is not known."""
+        with self._lock:
+            while node_id is not None and node_id not in self._document_frame_ids:
+                node_id = self._parents.get(node_id)
+            return self._document_frame_ids.get(node_id)
+
+    def invalidate_node(self, node_id, parent_node_id=None):
+        """Drops the facts of the removed node and its descendants."""
+        with self._lock:
+            self._children.get(parent_node_id, set()).discard(node_id)
+            removed_node_ids = [node_id]
+            for removed_node_id in removed_node_ids:
+                removed_node_ids.extend(self._children.pop(removed_node_id, ()))
+                self._parents.pop(removed_node_id, None)
+                self._document_frame_ids.pop(removed_node_id, None)
+            for facts in self._facts.values():
+                for removed_node_id in removed_node_ids:
+                    facts.pop(removed_node_id, None)
+            self._invalidate_layout_facts()
+
+    def invalidate_fact(self, fact):
+        with self._lock:
+            self._facts.pop(fact, None)
+            self._generation += 1
+
+    def invalidate_layout(self):
+        with self._lock:
+            self._invalidate_layout_facts()
+
+    def _invalidate_layout_facts(self):
+        for fact in self.LAYOUT_FACTS:
+            self._facts.pop(fact, None)
+        self._generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._facts = {}
+            self._children = {}
+            self._parents = {}
+            self._document_frame_ids = {}
+            self._generation += 1
+
+    def get_statistics(self):
+        with self._lock:
+            return {
+                'hits': dict(self.hits),
+                'misses': dict(self.misses),
+            }
+
+
+class LanguageDetector:
+    """Detects the language of text samples in a pool of worker threads.
+
+    The language profiles are loaded once per process and the detected
+    languages are cached by the hash of the sample, both are shared by all
+    instances because the browser is copied to every process of the pool.
+    """
+    _lock = threading.Lock()
+    _executor = None
+    _factory = None
+    _cache = collections.OrderedDict()
+
+    def __init__(self, max_workers=LANGUAGE_DETECTION_WORKERS, cache_size=LANGUAGE_CACHE_SIZE):
+        self.max_workers = max_workers
+        self.cache_size = cache_size
+
+    def detect(self, sample):
+        """Starts the detection and returns a future of the language."""
+        with LanguageDetector._lock:
+            if LanguageDetector._executor is None:
+                LanguageDetector._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            return LanguageDetector._executor.submit(self._detect, sample)
+
+    def _detect(self, sample):
+        sample_hash = hashlib.sha1(sample.encode('utf8')).hexdigest()
+        with LanguageDetector._lock:
+            if sample_hash in LanguageDetector._cache:
+                LanguageDetector._cache.move_to_end(sample_hash)
+                return LanguageDetector._cache.get(sample_hash)
+            if LanguageDetector._factory is None:
+                LanguageDetector._factory = DetectorFactory()
+                LanguageDetector._factory.load_profile(PROFILES_DIRECTORY)
+                LanguageDetector._factory.seed = LANGUAGE_DETECTION_SEED
+
+        detector = LanguageDetector._factory.create()
+        detector.append(sample)
+        language = detector.detect()
+
+        with LanguageDetector._lock:
+            LanguageDetector._cache[sample_hash] = language
+            while len(LanguageDetector._cache) > self.cache_size:
+                LanguageDetector._cache.popitem(last=False)
+        return language
+
+
+class ResponseStore:
+    """Stores the responses to the GET requests of a page by their method and
+    url.
+
+    The bodies are kept in memory up to `memory_limit` bytes, further
+    bodies are appended to a temporary file, which is deleted by `close`.
+    The store is used by the threads of several scans at once.
+    """
+    def __init__(self, memory_limit=RESPONSE_STORE_MEMORY_LIMIT):
+        self.memory_limit = memory_limit
+        self.memory_size = 0
+        self._responses = {}
+        self._lock = threading.Lock()
+        self._spill_file = None
+
+    def __len__(self):
+        return len(self._responses)
+
+    def add(self, method, url, status, headers, body):
+        """Stores the response, `headers` is a list of names and values."""
+        with self._lock:
+            if self.memory_size + len(body) <= self.memory_limit:
+                self.memory_size += len(body)
+                stored_body = body
+            else:
+                if self._spill_file is None:
+                    self._spill_file = tempfile.TemporaryFile()
+                self._spill_file.seek(0, os.SEEK_END)
+                stored_body = (self._spill_file.tell(), len(body))
+                self._spill_file.write(body)
+            self._responses[(method, url)] = (status, headers, stored_body)
+
+    def get(self, method, url):
+        """Returns the status, headers and body of the response or `None`."""
+        with self._lock:
+            if (method, url) not in self._responses:
+                return None
+            status, headers, stored_body = self._responses.get((method, url))
+            if isinstance(stored_body, tuple):
+                offset, length = stored_body
+                self._spill_file.seek(offset)
+                stored_body = self._spill_file.read(length)
+            return status, headers, stored_body
+
+    def close(self):
+        with self._lock:
+            self._responses.clear()
+            if self._spill_file is not None:
+                self._spill_file.close()
+                self._spill_file = None
+
+
+class ResponseArchive:
+    """Stores the responses to the GET requests of a page by their method and
+    url in a file, like `ResponseStore`.
+
+    The file starts with a header (magic and version), followed by the
+    compressed bodies and the compressed index of the responses, and ends
+    with the offset of the index. A writable archive is written to a
+    temporary file that replaces the archive when it is closed. A readable
+    archive only loads the index and reads the bodies when they are served.
+    """
+    _header = struct.Struct('!8sH')
+    _footer = struct.Struct('!Q')
+
+    def __init__(self, filename, writable=False):
+        self.filename = filename
+        self.writable = writable
+        self._lock = threading.Lock()
+        self._index = {}
+        if writable:
+            self._file = open(f'{filename}.tmp', 'w+b')
+            self._file.write(self._header.pack(RESPONSE_ARCHIVE_MAGIC, RESPONSE_ARCHIVE_VERSION))
+        else:
+            self._file = open(filename, 'rb')
+            self._load_index()
+
+    def __len__(self):
+        return len(self._index)
+
+    def add(self, method, url, status, headers, body):
+        compressed_body = zlib.compress(body)
+        with self._lock:
+            self._file.seek(0, os.SEEK_END)
+            self._index[f'{method} {url}'] = {
+                'status': status,
+                'headers': headers,
+                'offset': self._file.tell(),
+                'length': len(compressed_body),
+            }
+            self._file.write(compressed_body)
+
+    def get(self, method, url):
+        with self._lock:
+            response = self._index.get(f'{method} {url}')
+            if response is None:
+                return None
+            self._file.seek(response.get('offset'))
+            compressed_body = self._file.read(response.get('length'))
+        return response.get('status'), response.get('headers'), zlib.decompress(compressed_body)
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+            if self.writable:
+                self._file.seek(0, os.SEEK_END)
+                index_offset = self._file.tell()
+                self._file.write(zlib.compress(json.dumps(self._index).encode('utf8')))
+                self._file.write(self._footer.pack(index_offset))
+                self._file.close()
+                os.replace(f'{self.filename}.tmp', self.filename)
+            else:
+                self._file.close()
+
+    def _load_index(self):
+        magic, version = self._header.unpack(self._file.read(self._header.size))
+        if magic != RESPONSE_ARCHIVE_MAGIC or version != RESPONSE_ARCHIVE_VERSION:
+            self._file.close()
+            raise ValueError(f'{self.filename} is not a response archive of version {RESPONSE_ARCHIVE_VERSION}')
+        self._file.seek(-self._footer.size, os.SEEK_END)
+        footer_offset = self._file.tell()
+        index_offset, = self._footer.unpack(self._file.read(self._footer.size))
+        self._file.seek(index_offset)
+        self._index = json.loads(zlib.decompress(self._file.read(footer_offset - index_offset)).decode('utf8'))
+
+
+class ReachabilityChecker:
+    """Checks which protocol and subdomain variants of webpages are reachable
+    before they are scanned, so that the browser does not wait for pages that
+    cannot load.
+
+    The host names are resolved and a TCP connection (with TLS for https) is
+    opened to each variant, optionally a HEAD request is sent. The checks of
+    all webpages run concurrently. The resolver (a coroutine function that
+    returns the addresses of a host name) and the ports can be replaced,
+    e.g. to check against local servers.
+    """
+    def __init__(self, timeout=PREFLIGHT_TIMEOUT, concurrency=PREFLIGHT_CONCURRENCY, head_request=False, resolver=None, ports=None):
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.head_request = head_request
+        self.resolver = resolver or self._resolve
+        self.ports = ports or PREFLIGHT_PORTS
+
+    def check(self, webpages):
+        """Checks the webpages and sets their reachability."""
+        asyncio.run(self.check_async(webpages))
+
+    async def check_async(self, webpages):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(*[self._check_webpage(webpage, semaphore) for webpage in webpages])
+
+    async def _check_webpage(self, webpage, semaphore):
+        fallbacks = Webpage(rank=webpage.rank, domain=webpage.domain).get_fallbacks()
+
+        # every host name is resolved once for both protocols
+        resolutions = {}
+        for fallback in fallbacks:
+            host = urlparse(fallback.url).hostname
+            if host not in resolutions:
+                resolutions[host] = asyncio.ensure_future(self._resolve_host(host, semaphore))
+
+        errors = await asyncio.gather(*[
+                self._check_url(fallback.url, resolutions.get(urlparse(fallback.url).hostname), semaphore)
+                for fallback in fallbacks
+            ])
+        webpage.set_reachability([
+                {'url': fallback.url, 'reachable': error is None, 'error': error}
+                for fallback, error in zip(fallbacks, errors)
+            ])
+
+    async def _resolve_host(self, host, semaphore):
+        async with semaphore:
+            return await asyncio.wait_for(self.resolver(host), self.timeout)
+
+    async def _resolve(self, host):
+        address_infos = await asyncio.get_event_loop().getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        return list(dict.fromkeys(address_info[4][0] for address_info in address_infos))
+
+    async def _check_url(self, url, resolution, semaphore):
+        """Returns `None` if the url is reachable, otherwise the error."""
+        parsed_url = urlparse(url)
+        try:
+            addresses = await resolution
+        except (OSError, asyncio.TimeoutError) as e:
+            return self._get_error(e)
+        if len(addresses) == 0:
+            return 'no address'
+
+        async with semaphore:
+            error = None
+            for address in addresses:
+                try:
+                    await asyncio.wait_for(self._connect(
+                            parsed_url.hostname, address, self.ports.get(parsed_url.scheme), parsed_url.scheme == 'https'), self.timeout)
+                    return None
+                except (OSError, asyncio.TimeoutError) as e:
+                    error = self._get_error(e)
+            return error
+
+    async def _connect(self, host, address, port, use_tls):
+        ssl_context = None
+        if use_tls:
+            # the browser decides whether the certificate is valid
+            ssl_context = ssl.create_default_context()
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl.CERT_NONE
+        reader, writer = await asyncio.open_connection(address, port, ssl=ssl_context, server_hostname=host if use_tls else None)
+        try:
+            if self.head_request:
+                writer.write(f'HEAD / HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n'.encode('ascii'))
+                status_line = await reader.readline()
+                if not status_line.startswith(b'HTTP/'):
+                    raise ConnectionError('no HTTP response')
+        finally:
+            writer.close()
+
+    def _get_error(self, exception):
+        return f'{type(exception).__name__}: {exception}' if str(exception) else type(exception).__name__
+
+
+class CdpConnection:
+    """An asyncio connection to the DevTools websocket of the browser.
+
+    The tabs are attached to the connection as sessions (see `attach`).
+    Commands are sent as soon as they are called and their responses are
+    matched by id, so independent commands of all sessions are pipelined.
+    Events are passed to the handler of their session on the event loop.
+    """
+    def __init__(self, websocket_url):
+        self.websocket_url = websocket_url
+        self.closed = False
+        self._reader = None
+        self._writer = None
+        self._receive_task = None
+        self._last_id = 0
+
+        # the futures of the commands and their sessions by the ids of the
+        # commands, the event handlers by the ids of the sessions
+        self._pending_commands = {}
+        self._event_handlers = {}
+
+    async def connect(self):
+        url = urlparse(self.websocket_url)
+        self._reader, self._writer = await asyncio.open_connection(url.hostname, url.port)
+        key = base64.b64encode(os.urandom(16)).decode('ascii')
+        self._writer.write((f'GET {url.path} HTTP/1.1\r\nHost: {url.netloc}\r\n' +
+                            'Upgrade: websocket\r\nConnection: Upgrade\r\n' +
+                            f'Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n').encode('ascii'))
+        response = await self._reader.readuntil(b'\r\n\r\n')
+        status_line, *header_lines = response.decode('latin1').split('\r\n')
+        if not status_line.startswith('HTTP/1.1 101'):
+            raise ConnectionError(f'websocket handshake failed: {status_line}')
+
+        # the server proves that it understood the handshake (RFC 6455)
+        headers = {}
+        for header_line in header_lines:
+            name, _, value = header_line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode('ascii')).digest()).decode('ascii')
+        if headers.get('upgrade', '').lower() != 'websocket' \
+                or 'upgrade' not in [token.strip() for token in headers.get('connection', '').lower().split(',')] \
+                or headers.get('sec-websocket-accept') != accept:
+            raise ConnectionError('websocket handshake failed: invalid upgrade response')
+        self._receive_task = asyncio.ensure_future(self._receive_loop())
+
+    async def close(self):
+        if self._writer is not None and not self.closed:
+            self._send_frame(0x8, b'')
+            self._writer.close()
+        if self._receive_task is not None:
+            self._receive_task.cancel()
+        self._close()
+
+    async def call(self, method, session_id=None, **params):
+        """Calls the method in the session (or on the browser target) and
+        returns its result."""
+        if self.closed:
+            raise ConnectionError('the connection to the browser is closed')
+
+        self._last_id += 1
+        command_id = self._last_id
+        command = {'id': command_id, 'method': method, 'params': params}
+        if session_id is not None:
+            command['sessionId'] = session_id
+        future = asyncio.get_event_loop().create_future()
+        self._pending_commands[command_id] = (future, session_id)
+        try:
+            self._send_frame(0x1, json.dumps(command).encode('utf8'))
+            response = await future
+        finally:
+            self._pending_commands.pop(command_id, None)
+
+        if 'error' in response:
+            raise pychrome.exceptions.CallMethodException(f'calling method: {method} error: {response.get("error").get("message")}')
+        return response.get('result', {})
+
+    async def attach(self, target_id, event_handler):
+        """Attaches to the target and returns the id of its session, the
+        events of the session are passed to `event_handler(method, params)`."""
+        session_id = (await self.call('Target.attachToTarget', targetId=target_id, flatten=True)).get('sessionId')
+        self._event_handlers[session_id] = event_handler
+        return session_id
+
+    def abort_session(self, session_id):
+        """Stops the events of the session and aborts its pending commands."""
+        self._event_handlers.pop(session_id, None)
+        for future, command_session_id in list(self._pending_commands.values()):
+            if command_session_id == session_id and not future.done():
+                future.set_exception(pychrome.exceptions.UserAbortException('the session was aborted'))
+
+    def _send_frame(self, opcode, payload):
+        # frames of the client are masked (RFC 6455)
+        header = bytearray([0x80 | opcode])
+        if len(payload) < 126:
+            header.append(0x80 | len(payload))
+        elif len(payload) < 1 << 16:
+            header.append(0x80 | 126)
+            header += struct.pack('!H', len(payload))
+        else:
+            header.append(0x80 | 127)
+            header += struct.pack('!Q', len(payload))
+        mask = os.urandom(4)
+        self._writer.write(bytes(header) + mask + self._mask(payload, mask))
+
+    def _mask(self, payload, mask):
+        repeated_mask = (mask * (len(payload) // 4 + 1))[:len(payload)]
+        return (int.from_bytes(payload, 'big') ^ int.from_bytes(repeated_mask, 'big')).to_bytes(len(payload), 'big')
+
+    async def _read_message(self):
+        fragments = []
+        while True:
+            first_byte, second_byte = await self._reader.readexactly(2)
+            opcode = first_byte & 0x0f
+            length = second_byte & 0x7f
+            if length == 126:
+                length = struct.unpack('!H', await self._reader.readexactly(2))[0]
+            elif length == 127:
+                length = struct.unpack('!Q', await self._reader.readexactly(8))[0]
+            mask = await self._reader.readexactly(4) if second_byte & 0x80 else None
+            payload = await self._reader.readexactly(length)
+            if mask is not None:
+                payload = self._mask(payload, mask)
+
+            if opcode == 0x8:
+                raise ConnectionError('the browser closed the connection')
+            if opcode == 0x9:
+                self._send_frame(0xa, payload)
+                continue
+            if opcode == 0xa:
+                continue
+            fragments.append(payload)
+            if first_byte & 0x80:
+                return b''.join(fragments)
+
+    async def _receive_loop(self):
+        try:
+            while True:
+                data = await self._read_message()
+                # a broken message or a failing handler does not end the
+                # connection
+                try:
+                    self._handle_message(json.loads(data))
+                except Exception:
+                    logger.exception('handling a message of the browser failed')
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            if not self.closed:
+                logger.exception('the connection to the browser failed')
+        finally:
+            self._close()
+
+    def _handle_message(self, message):
+        if 'id' in message:
+            future, _ = self._pending_commands.get(message.get('id'), (None, None))
+            if future is not None and not future.done():
+                future.set_result(message)
+        elif 'method' in message:
+            event_handler = self._event_handlers.get(message.get('sessionId'))
+            if event_handler is not None:
+                event_handler(message.get('method'), message.get('params', {}))
+
+    def _close(self):
+        self.closed = True
+        for future, _ in list(self._pending_commands.values()):
+            if not future.done():
+                future.set_exception(ConnectionError('the connection to the browser is closed'))
+
+
+class CdpClient:
+    """Runs a `CdpConnection` on an event loop in a background thread, so
+    that it can be used from the threads of the scans (see `CdpTab`).
+
+    The events of all tabs are handled in one pool of threads instead of a
+    thread per tab.
+    """
+    def __init__(self, websocket_url, event_workers=CDP_EVENT_WORKERS):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+        self.event_executor = ThreadPoolExecutor(max_workers=event_workers)
+        self.connection = CdpConnection(websocket_url)
+        self.run(self.connection.connect())
+
+    @property
+    def closed(self):
+        return self.connection.closed
+
+    def run(self, coroutine, timeout=None):
+        """Runs the coroutine on the event loop and returns its result."""
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise pychrome.exceptions.TimeoutException(f'calling the browser timed out after {timeout} seconds')
+
+    def call(self, method, session_id=None, _timeout=None, **params):
+        return self.run(self.connection.call(method, session_id, **params), _timeout)
+
+    def call_many(self, calls, session_id=None, timeout=None):
+        """Sends the calls, a list of methods and their parameters, without
+        waiting for the previous ones and returns their results."""
+        async def call_all():
+            return await asyncio.gather(*[self.connection.call(method, session_id, **params) for method, params in calls])
+        return self.run(call_all(), timeout)
+
+    def close(self):
+        self.run(self.connection.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.event_executor.shutdown(wait=False)
+
+
+class CdpTab:
+    """A tab that is a session of a `CdpClient`, it is used like a
+    `pychrome.Tab` (e.g. `tab.Page.navigate(url=url)`).
+
+    The events of the tab are handled one after another in the order in
+    which they were received.
+    """
+    def __init__(self, client, target_id):
+        self.client = client
+        self.id = target_id
+        self.type = 'page'
+        self.status = pychrome.Tab.status_initial
+        self.session_id = None
+        self.event_handlers = {}
+        self._stopped = threading.Event()
+        self._events = collections.deque()
+        self._events_lock = threading.Lock()
+        self._is_handling_events = False
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return pychrome.tab.GenericAttr(name, self)
+
+    def start(self):
+        if self.status != pychrome.Tab.status_initial:
+            return False
+        self.session_id = self.client.run(self.client.connection.attach(self.id, self._event_received))
+        self.status = pychrome.Tab.status_started
+        return True
+
+    def stop(self):
+        if self._stopped.is_set():
+            return False
+        if self.status != pychrome.Tab.status_started:
+            raise pychrome.exceptions.RuntimeException('Tab is not running')
+
+        self.status = pychrome.Tab.status_stopped
+        self._stopped.set()
+        self.client.loop.call_soon_threadsafe(self.client.connection.abort_session, self.session_id)
+        return True
+
+    def wait(self, timeout=None):
+        return self._stopped.wait(timeout)
+
+    def call_method(self, _method, *args, **kwargs):
+        if args:
+            raise pychrome.exceptions.CallMethodException('the params should be key=value format')
+        if self.status != pychrome.Tab.status_started:
+            raise pychrome.exceptions.RuntimeException('Tab is not running')
+        return self.client.call(_method, self.session_id, **kwargs)
+
+    def call_methods(self, calls):
+        """Calls the methods, a list of methods and their parameters, without
+        waiting for the previous ones and returns their results."""
+        if self.status != pychrome.Tab.status_started:
+            raise pychrome.exceptions.RuntimeException('Tab is not running')
+        return self.client.call_many(calls, self.session_id)
+
+    def set_listener(self, event, callback):
+        if not callback:
+            return self.event_handlers.pop(event, None)
+        self.event_handlers[event] = callback
+        return True
+
+    def get_listener(self, event):
+        return self.event_handlers.get(event, None)
+
+    def _event_received(self, method, params):
+        # called on the event loop, the handlers may call the browser and
+        # run in the pool of the client
+        with self._events_lock:
+            self._events.append((method, params))
+            if self._is_handling_events:
+                return
+            self._is_handling_events = True
+        self.client.event_executor.submit(self._handle_events)
+
+    def _handle_events(self):
+        while True:
+            with self._events_lock:
+                if len(self._events) == 0 or self._stopped.is_set():
+                    self._is_handling_events = False
+                    return
+                method, params = self._events.popleft()
+            event_handler = self.event_handlers.get(method)
+            if event_handler is None:
+                continue
+            try:
+                event_handler(**params)
+            except Exception:
+                logger.exception(f'callback {method} failed')
+
+
+def is_devtools_ready(debugger_url, timeout=HEALTH_CHECK_TIMEOUT):
+    """Returns whether the DevTools HTTP endpoint of a browser answers."""
+    try:
+        with urllib.request.urlopen(f'{debugger_url}/json/version', timeout=timeout) as response:
+            return 'webSocketDebuggerUrl' in json.loads(response.read().decode('utf8'))
+    except (OSError, ValueError):
+        return False
+
+
+class ChromiumInstance:
+    """A chromium process that is controlled through its debugging port.
+
+    Every start uses a new temporary profile. The port is chosen once, so that
+    the DevTools url stays the same when the instance is restarted.
+    """
+    def __init__(self, chromium_path, headless=False, port=None):
+        self.chromium_path = chromium_path
+        self.headless = headless
+        self.port = port or self._get_free_port()
+        self.debugger_url = f'http://127.0.0.1:{self.port}'
+        self.process = None
+        self.profile_directory = None
+        self.failed_health_checks = 0
+        self.restarts = 0
+
+    def start(self, timeout=BROWSER_START_TIMEOUT):
+        self.profile_directory = tempfile.mkdtemp(prefix='chromium.')
+        arguments = [self.chromium_path, f'--remote-debugging-port={self.port}', f'--user-data-dir={self.profile_directory}']
+        arguments += CHROMIUM_ARGUMENTS
+        if self.headless:
+            arguments.append('--headless')
+        self.process = subprocess.Popen(arguments, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.failed_health_checks = 0
+
+        deadline = time.monotonic() + timeout
+        while not is_devtools_ready(self.debugger_url, timeout=1):
+            if self.process.poll() is not None or time.monotonic() >= deadline:
+                self.stop()
+                raise RuntimeError(f'chromium did not start on port {self.port}')
+            time.sleep(0.1)
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self.profile_directory is not None:
+            shutil.rmtree(self.profile_directory, ignore_errors=True)
+            self.profile_directory = None
+
+    def restart(self):
+        self.stop()
+        self.restarts += 1
+        self.start()
+
+    def check_health(self):
+        """Returns whether the instance is running and answers on its
+        DevTools endpoint, counts the failed checks in a row."""
+        if self.process is None or self.process.poll() is not None:
+            return False
+        if is_devtools_ready(self.debugger_url):
+            self.failed_health_checks = 0
+        else:
+            self.failed_health_checks += 1
+        return self.failed_health_checks < HEALTH_CHECK_FAILURES
+
+    def _get_free_port(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as free_socket:
+            free_socket.bind(('127.0.0.1', 0))
+            return free_socket.getsockname()[1]
+
+
+class BrowserFleet:
+    """Launches chromium instances and restarts them when they crashed or
+    hang.
+
+    The instances are handed to the scan workers as slots: every instance has
+    `slots_per_browser` slots in a queue that is shared with the processes of
+    the pool, a worker takes a slot for one page and returns it afterwards
+    (see `scan_page_in_fleet`).
+    """
+    def __init__(self, size, chromium_path=None, headless=False, slots_per_browser=1,
+                 health_check_interval=HEALTH_CHECK_INTERVAL):
+        self.chromium_path = chromium_path or self._find_chromium()
+        self.instances = [ChromiumInstance(self.chromium_path, headless=headless) for _ in range(size)]
+        self.slots_per_browser = slots_per_browser
+        self.health_check_interval = health_check_interval
+        self._manager = None
+        self._stopped = threading.Event()
+        self._supervisor = None
+
+    def __len__(self):
+        return len(self.instances) * self.slots_per_browser
+
+    def start(self):
+        """Starts the instances and the supervisor and returns the queue of
+        slots.
+
+        The manager of the queue and the supervisor are a process and a thread,
+        the pool of the scan workers needs to be created before, so that they
+        are not forked into it. If an instance does not start, the instances
+        that were started are stopped again.
+        """
+        try:
+            for instance in self.instances:
+                instance.start()
+        except Exception:
+            for instance in self.instances:
+                instance.stop()
+            raise
+
+        self._manager = mp.Manager()
+        slots = self._manager.Queue()
+        for _ in range(self.slots_per_browser):
+            for instance in self.instances:
+                slots.put(instance.debugger_url)
+
+        self._supervisor = threading.Thread(target=self._supervise, daemon=True)
+        self._supervisor.start()
+        return slots
+
+    def stop(self):
+        self._stopped.set()
+        if self._supervisor is not None:
+            self._supervisor.join()
+        for instance in self.instances:
+            instance.stop()
+        if self._manager is not None:
+            self._manager.shutdown()
+
+    def _supervise(self):
+        while not self._stopped.wait(self.health_check_interval):
+            for instance in self.instances:
+                if self._stopped.is_set() or instance.check_health():
+                    continue
+                logger.warning(f'restarting chromium on port {instance.port}')
+                try:
+                    instance.restart()
+                except Exception:
+                    # the next check tries again
+                    logger.exception(f'restarting chromium on port {instance.port} failed')
+
+    def _find_chromium(self):
+        for chromium_path in CHROMIUM_PATHS:
+            if os.path.exists(chromium_path):
+                return chromium_path
+        chromium_path = shutil.which('chromium') or shutil.which('chromium-browser')
+        if chromium_path is None:
+            raise RuntimeError('chromium was not found')
+        return chromium_path
+
+
+# the browsers of a process of the pool by their DevTools url
+_fleet_browsers = {}
+
+
+def scan_page_in_fleet(slots, browser_options, webpage, do_click=False):
+    """Scans the webpage in the process of the pool with a browser of the
+    fleet, the browsers are created once per process and DevTools url."""
+    debugger_url = slots.get()
+    try:
+        # wait for an instance that is restarted
+        deadline = time.monotonic() + BROWSER_START_TIMEOUT
+        while not is_devtools_ready(debugger_url, timeout=1) and time.monotonic() < deadline:
+            time.sleep(0.5)
+
+        if debugger_url not in _fleet_browsers:
+            _fleet_browsers[debugger_url] = Browser(debugger_url=debugger_url, **browser_options)
+        return _fleet_browsers.get(debugger_url).scan_page(webpage, do_click)
+    finally:
+        slots.put(debugger_url)
+
 
 class Browser:
-    def __init__(self, abp_filter_filenames, debugger_url='http://127.0.0.1:9222'):
+    """Scans webpages in tabs of a chromium instance.
+
+    If `isolate_contexts` is true, every tab is opened in its own browser
+    context, so that cookies, storage and cache are not shared with other
+    tabs and the pages can be scanned concurrently. The context is disposed
+    with the tab instead of clearing the browser. The contexts are created
+    through a connection to the browser target, which is opened once per
+    process and shared by all instances because the browser is copied to
+    every process of the pool.
+
+    With the `asyncio` client, all tabs of a process are sessions of this
+    connection (see `CdpClient`) instead of having their own websockets and
+    threads. The scans still run in a thread each and wait for every call,
+    only the connection runs on an event loop.
+    """
+    _lock = threading.Lock()
+    _browser_connections = {}
+    _cdp_clients = {}
+
+    def __init__(self, abp_filter_filenames, debugger_url='http://127.0.0.1:9222', abp_filter_cache_directory=None,
+                 race_fallbacks=False, fallback_head_start=FALLBACK_HEAD_START,
+                 fallback_grace_period=FALLBACK_GRACE_PERIOD, isolate_contexts=False,
+                 cdp_client=CDP_CLIENT_PYCHROME, click_concurrency=CLICK_CONCURRENCY, cache_click_responses=False,
+                 record_directory=None, replay_directory=None, **scanner_options):
         # create a browser instance which controls chromium
         self.browser = pychrome.Browser(url=debugger_url)
+        self.debugger_url = debugger_url
+        self.race_fallbacks = race_fallbacks
+        self.fallback_head_start = fallback_head_start
+        self.fallback_grace_period = fallback_grace_period
+        self.isolate_contexts = isolate_contexts
+        self.cdp_client = cdp_client
+        self.click_concurrency = click_concurrency
+        self.cache_click_responses = cache_click_responses
+        self.record_directory = record_directory
+        self.replay_directory = replay_directory
+
+        # the browser contexts of the open tabs by the ids of the tabs
+        self._browser_contexts = {}
+
+        # options that are passed to every `WebpageScanner`
+        self.scanner_options = scanner_options
+        self.language_detector = LanguageDetector()
 
         # create helpers
         self.abp_filters = {
-                os.path.splitext(os.path.basename(abp_filter_filename))[0]: AdblockPlusFilter(abp_filter_filename) 
+                os.path.splitext(os.path.basename(abp_filter_filename))[0]: AdblockPlusFilter(abp_filter_filename, abp_filter_cache_directory)
                 for abp_filter_filename in abp_filter_filenames
             }
 
@@ -216,37 +1411,86 @@ class Browser:
         - http protocol without `www.` subdomain
         - http protocol with `www.` subdomain
 
-        The first scan whose result is not failed is returned.
-        """
-        result = self._scan_page(webpage).get_result()
-
-        # try https with subdomain www
-        if result.failed and (result.failed_reason == FAILED_REASON_LOADING or result.failed_reason == FAILED_REASON_TIMEOUT):
-            webpage.set_subdomain('www')
-            result = self._scan_page(webpage).get_result()
-        # try http without subdomain www
-        if result.failed and (result.failed_reason == FAILED_REASON_LOADING or result.failed_reason == FAILED_REASON_TIMEOUT):
-            webpage.remove_subdomain()
-            webpage.set_protocol('http')
-            result = self._scan_page(webpage).get_result()
-        # try http with www subdomain
-        if result.failed and (result.failed_reason == FAILED_REASON_LOADING or result.failed_reason == FAILED_REASON_TIMEOUT):
-            webpage.set_subdomain('www')
-            result = self._scan_page(webpage).get_result()
+        The first scan whose result is not failed is returned. If the
+        fallbacks are raced, the possibilities are started one after another
+        with a head start (see `_race_page`).
 
-        if result.failed:
-            return result
+        If the reachability of the webpage was checked before (see
+        `ReachabilityChecker`), only the reachable possibilities are tried
+        and no tab is opened if there is none.
 
-        # do the click and add the click results to the web page result
-        if do_click:
-            self.do_click(webpage, result)
-        return result
+        The responses of the scan and the clicks are either:
+        - recorded into the archive of the domain in the record directory,
+        - replayed only from the archive of the domain in the replay
+          directory, without network,
+        - or, if they are cached for the clicks, stored and served to the
+          reloads of the clicks.
+        """
+        webpages = webpage.get_fallbacks()
+        if len(webpages) == 0:
+            result = WebpageResult(webpage)
+            result.set_failed(FAILED_REASON_UNREACHABLE)
+            return result
 
-    def do_click(self, webpage, result):
-        # store click results for nodes to avoid duplicates
-        click_results = {}
+        response_store = None
+        response_store_mode = click_response_store_mode = None
+        if self.replay_directory is not None:
+            archive_filename = self._get_archive_filename(self.replay_directory, webpage)
+            if not os.path.exists(archive_filename):
+                result = WebpageResult(webpage)
+                result.set_failed(FAILED_REASON_NOT_ARCHIVED)
+                return result
+            response_store = ResponseArchive(archive_filename)
+            response_store_mode = click_response_store_mode = RESPONSE_STORE_REPLAY_ONLY
+        elif self.record_directory is not None:
+            response_store = ResponseArchive(self._get_archive_filename(self.record_directory, webpage), writable=True)
+            response_store_mode = click_response_store_mode = RESPONSE_STORE_RECORD
+        elif do_click and self.cache_click_responses:
+            response_store = ResponseStore()
+            response_store_mode = RESPONSE_STORE_RECORD
+            click_response_store_mode = RESPONSE_STORE_REPLAY
 
-        # click each element and add the click result to the webpage result
+        try:
+            if self.race_fallbacks:
+                webpage, page_scanner = self._race_page(webpages, response_store=response_store,
+                                                        response_store_mode=response_store_mode)
+                result = page_scanner.get_result()
+            else:
+                # try the next possibility if the page could not be loaded
+                for webpage in webpages:
+                    result = self._scan_page(webpage, response_store=response_store,
+                                             response_store_mode=response_store_mode).get_result()
+                    if not result.failed or result.failed_reason not in FALLBACK_FAILED_REASONS:
+                        break
+
+            if result.failed:
+                return result
+
+            # do the click and add the click results to the web page result
+            if do_click:
+                self.do_click(webpage, result, response_store=response_store,
+                              response_store_mode=click_response_store_mode)
+            return result
+        finally:
+            if response_store is not None:
+                response_store.close()
+
+    def do_click(self, webpage, result, response_store=None, response_store_mode=RESPONSE_STORE_REPLAY):
+        """Clicks each clickable of the cookie notices on a reloaded page and
+        adds the click results to the webpage result.
+
+        Up to `click_concurrency` clicks are done at once. If it is more than
+        one, every click is done in its own browser context even if the
+        contexts are not isolated otherwise, because a reload in the shared
+        context would clear the browser for the others. If a response store
+        is given, the reloads
+        use it in the given mode, by default they are served from it and
+        only requests that are not stored go to the network.
+        """
+        # the clicks of the nodes in the order in which they are found, a node
+        # is only clicked once
+        clicks = {}
+        clickables = []
         for detection_technique, cookie_notices in result.cookie_notices.items():
             for cookie_notice_index, cookie_notice in enumerate(cookie_notices):
                 if len(cookie_notice.get('clickables')) > 5:
@@ -257,93 +1501,2296 @@ class Browser:
                         })
                     continue
                 for clickable_index, clickable in enumerate(cookie_notice.get('clickables')):
-                    # check whether click was already done
-                    if clickable.get('node_id') in click_results:
-                        clickable['click_result'] = click_results.get(clickable.get('node_id'))
-                    else:
-                        # create click instruction
-                        click = Click(detection_technique, cookie_notice_index, clickable_index)
-                        # do click on web page
-                        click_result = self._scan_page(webpage=webpage, take_screenshots=False, click=click).get_click_result()
-                        # store results
-                        clickable['click_result'] = click_result
-                        click_results[clickable.get('node_id')] = click_result
-
-    def _scan_page(self, webpage, take_screenshots=True, click=None):
-        """Creates tab, scans webpage and returns result."""
-        tab = self.browser.new_tab()
-
-        # scan the page
-        page_scanner = WebpageScanner(tab=tab, abp_filters=self.abp_filters, webpage=webpage)
-        page_scanner.scan(take_screenshots=take_screenshots, click=click)
-
-        # close tab and obtain the results
-        self.browser.close_tab(tab)
+                    clickables.append(clickable)
+                    if clickable.get('node_id') not in clicks:
+                        clicks[clickable.get('node_id')] = Click(detection_technique, cookie_notice_index, clickable_index)
+
+        # do the clicks on the web page
+        click_concurrency = max(1, self.click_concurrency)
+
+        def click_page(click):
+            return self._scan_page(webpage=webpage, take_screenshots=False, click=click, response_store=response_store,
+                                   response_store_mode=response_store_mode,
+                                   isolate_context=True if click_concurrency > 1 else None).get_click_result()
+
+        with ThreadPoolExecutor(max_workers=click_concurrency) as executor:
+            click_results = dict(zip(clicks.keys(), executor.map(click_page, clicks.values())))
+
+        # add the click results to the clickables
+        for clickable in clickables:
+            clickable['click_result'] = click_results.get(clickable.get('node_id'))
+
+        unreplayed_request_count = sum(len(click_result.unreplayed_requests) for click_result in click_results.values())
+        if response_store_mode == RESPONSE_STORE_REPLAY_ONLY and unreplayed_request_count > 0:
+            result.add_warning({
+                    'message': f'{unreplayed_request_count} requests of the clicks are not in the archive and failed',
+                    'exception': 'NotArchived',
+                    'method': 'Browser.do_click',
+                })
+
+    def _race_page(self, webpages, response_store=None, response_store_mode=None):
+        """Scans the webpages (the possibilities of `scan_page`) concurrently
+        and returns the webpage and the scanner of the first one that commits
+        the navigation.
+
+        Like happy eyeballs, every possibility starts `fallback_head_start`
+        seconds after the previous one or as soon as all previous ones
+        failed. When a navigation commits, the possibility waits up to
+        `fallback_grace_period` seconds for the previous ones that are still
+        loading, so that the first possibility that loads is preferred as
+        with sequential fallbacks. Then the other scans are cancelled and
+        their tabs are closed. If all fail, the last one is returned.
+        Every possibility is scanned in its own browser context, so that the
+        cookies of the others do not end up in the result.
+        """
+        race_state_changed = threading.Condition()
+        page_scanners = {}
+        finished = set()
+        winner = None
+
+        def cancel_others(index):
+            for other_index, other_page_scanner in page_scanners.items():
+                if other_index != index and other_index not in finished:
+                    other_page_scanner.cancel()
+
+        def on_navigation_committed(index):
+            nonlocal winner
+            with race_state_changed:
+                deadline = time.monotonic() + self.fallback_grace_period
+                while winner is None and any(other_index not in finished for other_index in range(index)):
+                    now = time.monotonic()
+                    if now >= deadline:
+                        break
+                    race_state_changed.wait(deadline - now)
+                if winner is not None:
+                    return False
+                winner = index
+                cancel_others(index)
+                race_state_changed.notify_all()
+                return True
+
+        def scan_variant(index):
+            tab = None
+            page_scanner = None
+            try:
+                tab = self._new_tab(isolate_context=True)
+                page_scanner = WebpageScanner(tab=tab, abp_filters=self.abp_filters, webpage=webpages[index],
+                                              language_detector=self.language_detector, response_store=response_store,
+                                              response_store_mode=response_store_mode or RESPONSE_STORE_RECORD,
+                                              **self.scanner_options)
+                with race_state_changed:
+                    page_scanners[index] = page_scanner
+                    if winner is not None:
+                        page_scanner.cancel()
+
+                # the browser context is new and disposed with the tab
+                page_scanner.scan(clear_browser=False, on_navigation_committed=partial(on_navigation_committed, index))
+            except Exception:
+                # the calls to the tab of a cancelled scan fail
+                if page_scanner is None or not page_scanner.cancelled:
+                    raise
+            finally:
+                if tab is not None:
+                    self._close_tab(tab)
+                with race_state_changed:
+                    finished.add(index)
+                    race_state_changed.notify_all()
+
+        with ThreadPoolExecutor(max_workers=len(webpages)) as executor:
+            futures = []
+            next_start = time.monotonic()
+            with race_state_changed:
+                while winner is None:
+                    # a failure that is not a reason for a fallback ends the race
+                    for index in sorted(finished):
+                        # a scan without scanner raised an exception
+                        if index not in page_scanners or page_scanners.get(index).result.failed_reason not in FALLBACK_FAILED_REASONS:
+                            winner = index
+                            cancel_others(index)
+                            break
+                    if winner is not None or len(finished) == len(webpages):
+                        break
+                    now = time.monotonic()
+                    if len(futures) < len(webpages) and (now >= next_start or len(finished) == len(futures)):
+                        futures.append(executor.submit(scan_variant, len(futures)))
+                        next_start = now + self.fallback_head_start
+                        continue
+                    race_state_changed.wait(next_start - now if len(futures) < len(webpages) else None)
+
+        # raise exceptions of the scans
+        for future in futures:
+            future.result()
+
+        index = winner if winner is not None else len(webpages) - 1
+        return webpages[index], page_scanners.get(index)
+
+    def _clear_browser(self):
+        tab = self._new_tab()
+        try:
+            tab.start()
+            tab.Network.clearBrowserCache()
+            tab.Network.clearBrowserCookies()
+        finally:
+            self._close_tab(tab)
+
+    def _scan_page(self, webpage, take_screenshots=True, click=None, response_store=None, response_store_mode=None,
+                   isolate_context=None):
+        """Creates tab, scans webpage and returns result.
+
+        The tab is opened in its own browser context if contexts are isolated
+        or `isolate_context` is true (see `_new_tab`).
+        """
+        if isolate_context is None:
+            isolate_context = self.isolate_contexts
+        tab = self._new_tab(isolate_context=isolate_context)
+
+        # scan the page, a tab in its own browser context does not need to
+        # be cleared
+        page_scanner = WebpageScanner(tab=tab, abp_filters=self.abp_filters, webpage=webpage,
+                                      language_detector=self.language_detector, response_store=response_store,
+                                      response_store_mode=response_store_mode or RESPONSE_STORE_RECORD, **self.scanner_options)
+        page_scanner.scan(take_screenshots=take_screenshots, click=click, clear_browser=not isolate_context)
+
+        # close tab and obtain the results, the language is detected while
+        # the tab is closed
+        self._close_tab(tab)
         return page_scanner
 
+    def _get_archive_filename(self, directory, webpage):
+        return f'{directory}/{webpage.domain}.archive'
+
+    def _new_tab(self, isolate_context=None):
+        """Opens a tab, in a new browser context if contexts are isolated or
+        `isolate_context` is true."""
+        if isolate_context is None:
+            isolate_context = self.isolate_contexts
+        if not isolate_context and self.cdp_client == CDP_CLIENT_PYCHROME:
+            return self.browser.new_tab()
+
+        browser_context_id = None
+        if isolate_context:
+            browser_context_id = self._call_browser('Target.createBrowserContext').get('browserContextId')
+        target_id = self._call_browser('Target.createTarget', url='about:blank', browserContextId=browser_context_id).get('targetId')
+        self._browser_contexts[target_id] = browser_context_id
+        if self.cdp_client == CDP_CLIENT_ASYNCIO:
+            return CdpTab(self._get_cdp_client(), target_id)
+        return pychrome.Tab(id=target_id, type='page',
+                            webSocketDebuggerUrl=f'ws://{urlparse(self.debugger_url).netloc}/devtools/page/{target_id}')
+
+    def _close_tab(self, tab):
+        """Closes the tab and disposes its browser context with all its data."""
+        if tab.id not in self._browser_contexts:
+            self.browser.close_tab(tab)
+            return
+
+        browser_context_id = self._browser_contexts.pop(tab.id)
+        if tab.status == pychrome.Tab.status_started:
+            tab.stop()
+        if browser_context_id is None:
+            self._call_browser('Target.closeTarget', targetId=tab.id)
+        else:
+            self._call_browser('Target.disposeBrowserContext', browserContextId=browser_context_id)
+
+    def _call_browser(self, method, **kwargs):
+        """Calls a method on the connection to the browser target, the calls
+        of all threads are serialized if the connection is a `pychrome.Tab`."""
+        if self.cdp_client == CDP_CLIENT_ASYNCIO:
+            return self._get_cdp_client().call(method, **{k: v for k, v in kwargs.items() if v is not None})
+
+        with Browser._lock:
+            browser_connection = Browser._browser_connections.get(self.debugger_url)
+            if browser_connection is None or browser_connection.status != pychrome.Tab.status_started:
+                browser_connection = pychrome.Tab(id='browser', type='browser',
+                                                  webSocketDebuggerUrl=self.browser.version().get('webSocketDebuggerUrl'))
+                browser_connection.start()
+                Browser._browser_connections[self.debugger_url] = browser_connection
+            try:
+                return browser_connection.call_method(method, **kwargs)
+            except Exception:
+                # the browser might have been restarted, the next call
+                # connects again
+                Browser._browser_connections.pop(self.debugger_url, None)
+                browser_connection.stop()
+                raise
+
+    def _get_cdp_client(self):
+        """Returns the client of the asyncio connection to the browser,
+        which is opened again if it was closed."""
+        with Browser._lock:
+            cdp_client = Browser._cdp_clients.get(self.debugger_url)
+            if cdp_client is None or cdp_client.closed:
+                cdp_client = CdpClient(self.browser.version().get('webSocketDebuggerUrl'))
+                Browser._cdp_clients[self.debugger_url] = cdp_client
+            return cdp_client
+
 
 class AdblockPlusFilter:
-    def __init__(self, rules_filename):
-        with open(rules_filename) as filterlist:
+    """Looks up the cosmetic rules of a filter list that apply to a domain.
+
+    Rules that turned out to be invalid in the browser are excluded by the
+    filter list (its name and the hash of its content), they are shared by all
+    instances of a process because the filters are copied to every process
+    of the pool.
+    """
+    _lock = threading.Lock()
+    _invalid_rules = {}
+
+    def __init__(self, rules_filename, cache_directory=None):
+        self._rules_filename = rules_filename
+        self._cache_directory = cache_directory
+        with open(rules_filename, 'rb') as filterlist:
+            self._filter_hash = hashlib.sha1(filterlist.read()).hexdigest()
+
+        # problems that do not prevent the use of the filter, they are added
+        # to the results of the pages (see `WebpageScanner`)
+        self.warnings = []
+
+        # load the compiled filter list from the cache or compile it
+        compiled_filter = self._load_compiled_filter()
+        if compiled_filter is None:
+            compiled_filter = self._compile_filter()
+            self._save_compiled_filter(compiled_filter)
+
+        self._selectors = compiled_filter.get('selectors')
+        self._generic_rule_indexes = compiled_filter.get('generic_rule_indexes')
+        self._domain_rule_indexes = compiled_filter.get('domain_rule_indexes')
+        self._selector_tokens = compiled_filter.get('selector_tokens')
+
+        # extended selectors of adblockers would make the query fail, they
+        # are invalid from the start
+        self.add_invalid_rules(selector for selector in self._selectors if not self._is_selector_valid(selector))
+
+    def _compile_filter(self):
+        """Parses the filter list and returns everything needed to look up rules."""
+        with open(self._rules_filename) as filterlist:
             # we only need filters with type css
             # other instances are Header, Metadata, etc.
             # other type is url-pattern which is used to block script files
-            self._rules = [rule for rule in parse_filterlist(filterlist) if isinstance(rule, Filter) and rule.selector.get('type') == 'css']
+            rules = [rule for rule in parse_filterlist(filterlist) if isinstance(rule, Filter) and rule.selector.get('type') == 'css']
+
+        # index the rules once, so that the lookup for a page does not need
+        # to walk the whole list
+        generic_rule_indexes, domain_rule_indexes = self._build_index(rules)
+
+        return {
+            'version': ABP_FILTER_CACHE_VERSION,
+            'selectors': [rule.selector.get('value') for rule in rules],
+            'selector_tokens': [self._get_selector_token(rule.selector.get('value')) for rule in rules],
+            'generic_rule_indexes': generic_rule_indexes,
+            'domain_rule_indexes': domain_rule_indexes,
+        }
+
+    def _build_index(self, rules):
+        """Splits the rules into generic rules and rules restricted to domains.
+
+        Both buckets store the position of the rule in the filter list, so
+        that the applicable rules can be returned in their original order.
+        """
+        generic_rule_indexes = []
+        domain_rule_indexes = {}
+        for index, rule in enumerate(rules):
+            domains = self._get_applicable_domains(rule)
+            if len(domains) == 0:
+                generic_rule_indexes.append(index)
+            for domain in domains:
+                domain_rule_indexes.setdefault(domain, []).append(index)
+        return generic_rule_indexes, domain_rule_indexes
+
+    def get_applicable_rules(self, domain, page_tokens=None):
+        """Returns the selectors of the rules that are applicable for the given domain.
+
+        If the ids and classes of the page are given as `page_tokens` (e.g.
+        `#cookie-banner` and `.cc-window`, in lowercase), rules that require
+        an id or class that does not exist on the page are skipped.
+        """
+        domain_rule_indexes = [
+                self._domain_rule_indexes[suffix]
+                for suffix in self._get_domain_suffixes(domain)
+                if suffix in self._domain_rule_indexes
+            ]
+
+        # all buckets are sorted, merge them and skip rules that are listed
+        # for more than one suffix of the domain
+        rule_indexes = heapq.merge(self._generic_rule_indexes, *domain_rule_indexes)
+        invalid_rules = self._get_invalid_rules()
+        return [
+                self._selectors[index]
+                for index, _ in itertools.groupby(rule_indexes)
+                if self._selectors[index] not in invalid_rules
+                and (page_tokens is None or self._selector_tokens[index] is None or self._selector_tokens[index] in page_tokens)
+            ]
 
-    def get_applicable_rules(self, domain):
-        """Returns the rules of the filter that are applicable for the given domain."""
-        return [rule for rule in self._rules if self._is_rule_applicable(rule, domain)]
+    def add_invalid_rules(self, rules):
+        """Excludes the given rules from the applicable rules of all filters
+        of the same filter list in this process from now on."""
+        with AdblockPlusFilter._lock:
+            AdblockPlusFilter._invalid_rules.setdefault(self._get_filter_key(), set()).update(rules)
 
-    def _is_rule_applicable(self, rule, domain):
-        """Tests whethere a given rule is applicable for the given domain."""
-        domain_options = [(key, value) for key, value in rule.options if key == 'domain']
+    def _get_invalid_rules(self):
+        with AdblockPlusFilter._lock:
+            return frozenset(AdblockPlusFilter._invalid_rules.get(self._get_filter_key(), ()))
+
+    def _get_filter_key(self):
+        return self._get_filter_name(), self._filter_hash
+
+    def _get_applicable_domains(self, rule):
+        """Returns the domains a rule is restricted to or an empty list if it is generic."""
+        domain_options = [value for key, value in rule.options if key == 'domain']
         if len(domain_options) == 0:
-            return True
+            return []
 
         # there is only one domain option
-        _, domains = domain_options[0]
+        domains = domain_options[0]
 
         # filter exclusion rules as they should be ignored:
         # the cookie notices do exist, the ABP plugin is just not able
         # to remove them correctly
-        domains = [(opt_domain, opt_applicable) for opt_domain, opt_applicable in domains if opt_applicable == True]
-        if len(domains) == 0:
-            return True
+        return [opt_domain.lower() for opt_domain, opt_applicable in domains if opt_applicable == True]
+
+    def _get_domain_suffixes(self, domain):
+        """Returns the domain and all its parent domains, e.g. `uk.yahoo.com`, `yahoo.com` and `com`."""
+        labels = domain.lower().strip('.').split('.')
+        return ['.'.join(labels[index:]) for index in range(len(labels))]
+
+    def _is_selector_valid(self, selector):
+        """Tests whether the selector can be passed to `querySelectorAll`.
+
+        Extended selectors of adblockers (e.g. `:-abp-has()`) are not
+        supported by the browser and would make the query fail.
+        """
+        return ABP_EXTENDED_SELECTOR_REGEXP.search(selector) is None
+
+    def _get_selector_token(self, selector):
+        """Returns the id or class (e.g. `#cookie-banner`) the selector requires or `None`.
+
+        Selector lists are never reduced to a token, as each selector of the
+        list might match on its own.
+        """
+        if ',' in selector:
+            return None
+        match = ABP_TOKEN_SELECTOR_REGEXP.match(selector)
+        if match is None:
+            return None
+        return match.group(1).lower()
+
+
+    ############################################################################
+    # COMPILED FILTER CACHE
+    ############################################################################
+
+    def _get_compiled_filter_filename(self):
+        """Returns the filename of the compiled filter for the current version of the filter list.
+
+        The filename contains a hash of the content and the modification time
+        of the filter list, so a changed list is compiled again.
+        """
+        filter_hash = hashlib.sha1(self._filter_hash.encode())
+        filter_hash.update(str(os.stat(self._rules_filename).st_mtime_ns).encode())
+        return os.path.join(self._cache_directory, f'{self._get_filter_name()}.{filter_hash.hexdigest()}.pickle')
 
-        # the list of domains now only consists of domains for which the rule
-        # is applicable, we check for the domain and return False otherwise
-        for opt_domain, _ in domains:
-            if opt_domain in domain:
+    def _get_filter_name(self):
+        return os.path.splitext(os.path.basename(self._rules_filename))[0]
+
+    def _load_compiled_filter(self):
+        if self._cache_directory is None:
+            return None
+
+        try:
+            with open(self._get_compiled_filter_filename(), 'rb') as file:
+                compiled_filter = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+        if compiled_filter.get('version') != ABP_FILTER_CACHE_VERSION:
+            return None
+        return compiled_filter
+
+    def _save_compiled_filter(self, compiled_filter):
+        if self._cache_directory is None:
+            return
+
+        # the cache is optional, the compiled filter is used even if it
+        # cannot be saved
+        temporary_filename = None
+        try:
+            os.makedirs(self._cache_directory, exist_ok=True)
+            compiled_filter_filename = self._get_compiled_filter_filename()
+
+            # remove compiled versions of outdated filter lists
+            for outdated_filename in glob.glob(os.path.join(self._cache_directory, f'{self._get_filter_name()}.*.pickle')):
+                if outdated_filename != compiled_filter_filename:
+                    try:
+                        os.remove(outdated_filename)
+                    except OSError:
+                        pass
+
+            # write to a temporary file first, other scanner processes might
+            # read the compiled filter at the same time
+            fd, temporary_filename = tempfile.mkstemp(dir=self._cache_directory)
+            with os.fdopen(fd, 'wb') as file:
+                pickle.dump(compiled_filter, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_filename, compiled_filter_filename)
+            temporary_filename = None
+        except Exception as e:
+            self.warnings.append({
+                'message': f'saving the compiled filter {self._get_filter_name()} failed: {e}',
+                'exception': type(e).__name__,
+                'traceback': traceback.format_exc().splitlines(),
+                'method': '_save_compiled_filter',
+            })
+        finally:
+            if temporary_filename is not None:
+                try:
+                    os.remove(temporary_filename)
+                except OSError:
+                    pass
+
+
+############################################################################
+# DOM SNAPSHOTS
+############################################################################
+
+# the computed styles that are captured with a snapshot of the page,
+# the detection on snapshots reads them by name
+SNAPSHOT_COMPUTED_STYLES = [
+    'position', 'display', 'visibility', 'opacity', 'pointer-events', 'font-size',
+    'margin-top', 'margin-right', 'margin-bottom', 'margin-left',
+    'border-top-width', 'border-right-width', 'border-bottom-width', 'border-left-width',
+    'padding-top', 'padding-bottom',
+]
+
+# the version of the snapshot format, needs to be increased whenever the
+# format changes so that saved snapshots are not reprocessed incorrectly
+DOM_SNAPSHOT_VERSION = 1
+
+# the detection on snapshots runs in a pool of worker threads that is shared
+# by the scans of a process, the browser takes the screenshots meanwhile
+SNAPSHOT_DETECTION_WORKERS = 2
+
+NODE_TYPE_ELEMENT = 1
+NODE_TYPE_TEXT = 3
+NODE_TYPE_COMMENT = 8
+NODE_TYPE_DOCUMENT = 9
+NODE_TYPE_DOCUMENT_TYPE = 10
+
+# elements without end tag and elements whose text is not escaped in html
+HTML_VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'meta', 'param', 'source', 'track', 'wbr'}
+HTML_RAW_TEXT_ELEMENTS = {'script', 'style', 'xmp', 'iframe', 'noembed', 'noframes', 'plaintext', 'noscript'}
+
+# the display values of elements that do not start a new line in `innerText`
+INLINE_DISPLAY_VALUES = {'inline', 'inline-block', 'inline-flex', 'inline-grid', 'inline-table', 'contents'}
+
+
+def detect_cookie_notices_in_snapshot(dom_snapshot, search_strings=SEARCH_KEYWORDS, max_property_length=MAX_PROPERTY_LENGTH,
+                                      max_combination_size=MAX_COMBINATION_SIZE, max_combination_queries=MAX_COMBINATION_QUERIES,
+                                      max_clickables=MAX_CLICKABLES):
+    """Detects the cookie notices in a snapshot of the page (see `WebpageScanner.take_dom_snapshot`).
+
+    No browser is needed, so the detection can run in another process or
+    on snapshots that were saved before (see `load_dom_snapshot`).
+    """
+    if dom_snapshot.get('version') != DOM_SNAPSHOT_VERSION:
+        raise ValueError(f'unsupported snapshot version {dom_snapshot.get("version")}')
+    return DomSnapshot(dom_snapshot).detect_cookie_notices(
+            search_strings, max_property_length, max_combination_size, max_combination_queries, max_clickables)
+
+
+def load_dom_snapshot(filename):
+    with gzip.open(filename, 'rt', encoding='utf8') as file:
+        return json.load(file)
+
+
+def _parse_int(value):
+    """Parses the value like `parseInt` in JavaScript, 0 if it is not a number."""
+    match = re.match(r'\s*([+-]?\d+)', value or '')
+    return int(match.group(1)) if match else 0
+
+
+def _parse_float(value, default=0.0):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _truncate(name, value, max_length, truncated_properties):
+    if max_length and value and len(value) > max_length:
+        truncated_properties.append(name)
+        return value[:max_length]
+    return value
+
+
+def _get_unique_combinations(items, count_elements, max_size, max_queries):
+    """Returns the combinations of the items that match a single element in
+    the same order as `getUniqueCombinations` in `JS_GET_COOKIE_NOTICE_PROPERTIES`
+    and whether the search stopped because `max_queries` combinations were
+    checked.
+
+    The combinations are checked smallest first up to `max_size` items,
+    supersets of unique combinations are skipped because they are unique as
+    well.
+    """
+    result = []
+    queries = 0
+    for size in range(1, min(max_size, len(items)) + 1):
+        for combination in itertools.combinations(items, size):
+            if any(all(item in combination for item in unique_combination) for unique_combination in result):
+                continue
+            if queries >= max_queries:
+                return result, True
+            queries += 1
+            if count_elements(combination) == 1:
+                result.append(combination)
+    return result, False
+
+
+class StringMatcher:
+    """Finds any of several strings case-insensitively in one pass over a
+    text with the Aho-Corasick algorithm, like `searchForStrings` in
+    `JS_SEARCH_FOR_STRINGS`.
+    """
+    def __init__(self, search_strings):
+        self._next_states = [{}]
+        self._fail_states = [0]
+        self._is_match = [False]
+        for search_string in search_strings:
+            state = 0
+            for character in search_string.lower():
+                if character not in self._next_states[state]:
+                    self._next_states[state][character] = len(self._next_states)
+                    self._next_states.append({})
+                    self._fail_states.append(0)
+                    self._is_match.append(False)
+                state = self._next_states[state][character]
+            self._is_match[state] = True
+
+        # the fail state is the state of the longest proper suffix, the
+        # states are processed breadth-first
+        queue = collections.deque(self._next_states[0].values())
+        while len(queue) > 0:
+            state = queue.popleft()
+            for character, next_state in self._next_states[state].items():
+                fail = self._fail_states[state]
+                while fail > 0 and character not in self._next_states[fail]:
+                    fail = self._fail_states[fail]
+                if self._next_states[fail].get(character, next_state) != next_state:
+                    self._fail_states[next_state] = self._next_states[fail].get(character)
+                self._is_match[next_state] = self._is_match[next_state] or self._is_match[self._fail_states[next_state]]
+                queue.append(next_state)
+
+    def matches(self, text):
+        state = 0
+        for character in text.lower():
+            while state > 0 and character not in self._next_states[state]:
+                state = self._fail_states[state]
+            state = self._next_states[state].get(character, 0)
+            if self._is_match[state]:
                 return True
         return False
 
 
+class DomSnapshot:
+    """Runs the detection of cookie notices on a snapshot of the page.
+
+    The snapshot consists of one document per frame. Nodes are referenced
+    by a tuple of the document and the index of the node in the document.
+    """
+    def __init__(self, dom_snapshot):
+        capture = dom_snapshot.get('capture')
+        self.rule_matches = dom_snapshot.get('rule_matches', {})
+        self.documents = [
+                SnapshotDocument(index, document, capture.get('strings'), dom_snapshot.get('computed_styles'))
+                for index, document in enumerate(capture.get('documents'))
+            ]
+
+        # the first document is the document of the root frame
+        self.root_document = self.documents[0]
+
+        # the frame owners (i.e. `iframe` elements) of the documents
+        self.frame_owners = {}
+        for document in self.documents:
+            for node, content_document_index in document.content_documents.items():
+                self.frame_owners[content_document_index] = (document, node)
+
+        self.warnings = []
+
+    def detect_cookie_notices(self, search_strings, max_property_length, max_combination_size, max_combination_queries, max_clickables):
+        """Detects the cookie notices with the same steps as `JS_DETECT_COOKIE_NOTICES`.
+
+        Returns the notices for every detection technique, nodes are
+        identified by their backend node id.
+        """
+        self.warnings = []
+        visibility_caches = {document.index: {} for document in self.documents}
+        notice_indexes = {}
+        result = {
+            'techniques': {},
+            'notices': [],
+            'warnings': self.warnings,
+        }
+
+        def unique(elems):
+            return [elem for elem in dict.fromkeys(elems) if elem is not None]
+
+        def is_visible(elem):
+            document, node = elem
+            return self._try_call('is_visible', lambda: document.is_visible(node, visibility_caches.get(document.index)), None)
+
+        def filter_visible(elems):
+            return [elem for elem in elems if is_visible(elem) is not None]
+
+        def get_notice_index(elem):
+            if elem in notice_indexes:
+                return notice_indexes.get(elem)
+
+            document, node = elem
+            properties = self._try_call('get_cookie_notice_properties', lambda: self._get_cookie_notice_properties(
+                    elem, max_property_length, max_combination_size, max_combination_queries, max_clickables,
+                    visibility_caches.get(document.index)), {'clickables': []})
+            properties['backend_node_id'] = document.get_backend_node_id(node)
+            visible_node = is_visible(elem)
+            notice_indexes[elem] = len(result.get('notices'))
+            result.get('notices').append({
+                'properties': properties,
+                'visible_backend_node_id': document.get_backend_node_id(visible_node) if visible_node is not None else None,
+            })
+            return notice_indexes.get(elem)
+
+        def add_cookie_notices(detection_technique, elems):
+            result.get('techniques')[detection_technique] = [get_notice_index(elem) for elem in elems]
+
+        # find cookie notice by using the elements that matched the rules
+        backend_nodes = None
+        for filter_name, backend_node_ids in self.rule_matches.items():
+            if backend_nodes is None:
+                backend_nodes = {
+                        document.get_backend_node_id(node): (document, node)
+                        for document in self.documents
+                        for node in range(document.node_count)
+                    }
+            add_cookie_notices(filter_name, filter_visible(unique(
+                    backend_nodes.get(backend_node_id) for backend_node_id in backend_node_ids)))
+
+        # find the search strings in nodes and take the closest parent block element
+        string_matcher = StringMatcher(search_strings)
+        cookie_elems = []
+        for document in self.documents:
+            cookie_elems.extend((document, node) for node in document.search_for_strings(string_matcher))
+        cookie_elems = unique(
+                self._try_call('find_closest_block_element', lambda: self._find_closest_block_element(elem), None)
+                for elem in filter_visible(cookie_elems))
+
+        # find fixed parent elements, the frame owner is the fixed parent for
+        # elements in frames without fixed element
+        fixed_elems = [self._try_call('find_fixed_parent', lambda: self._find_fixed_parent(elem), None) for elem in cookie_elems]
+        add_cookie_notices('fixed_parent', filter_visible(unique(fixed_elems)))
+
+        # find full-width parent elements
+        full_width_elems = [
+                self._try_call('find_full_width_parent', lambda: self._find_full_width_parent(elem), None)
+                for elem in cookie_elems
+            ]
+        add_cookie_notices('full_width_parent', filter_visible(unique(full_width_elems)))
+
+        return result
+
+    def _find_closest_block_element(self, elem):
+        document, node = elem
+        block_element = document.find_closest_block_element(node)
+        return (document, block_element) if block_element is not None else None
+
+    def _find_fixed_parent(self, elem):
+        document, node = elem
+        fixed_parent = document.find_fixed_parent(node)
+        if fixed_parent != document.document_element:
+            return (document, fixed_parent)
+        # the html element of the root frame is no fixed parent
+        return self.frame_owners.get(document.index)
+
+    def _find_full_width_parent(self, elem):
+        document, node = elem
+        full_width_parent = document.find_full_width_parent(node)
+        return (document, full_width_parent) if full_width_parent is not None else None
+
+    def _get_cookie_notice_properties(self, elem, max_property_length, max_combination_size, max_combination_queries,
+                                      max_clickables, visibility_cache):
+        document, node = elem
+        clickables = []
+        clickable_nodes, are_clickables_truncated = document.find_clickables_in_element(node, max_clickables)
+        for clickable in clickable_nodes:
+            properties = self._try_call('get_properties_of_clickable', lambda: document.get_properties_of_clickable(clickable, max_property_length), {})
+            properties['is_visible'] = self._try_call('is_visible', lambda: document.is_visible(clickable, visibility_cache), None) is not None
+            properties['backend_node_id'] = document.get_backend_node_id(clickable)
+            clickables.append(properties)
+
+        properties = document.get_cookie_notice_properties(node, max_property_length, max_combination_size, max_combination_queries)
+        properties['clickables'] = clickables
+        if are_clickables_truncated:
+            properties.get('truncated_properties').append('clickables')
+
+        # the modality is checked in the root frame for all notices
+        properties['is_page_modal'] = self.root_document.is_page_modal({
+            'x': properties.get('x'),
+            'y': properties.get('y'),
+            'width': properties.get('width'),
+            'height': properties.get('height'),
+        })
+        return properties
+
+    def _try_call(self, method, f, fallback):
+        try:
+            return f()
+        except Exception as e:
+            self.warnings.append({
+                'message': str(e),
+                'exception': type(e).__name__,
+                'traceback': traceback.format_exc().splitlines(),
+                'method': 'DomSnapshot.' + method,
+            })
+            return fallback
+
+
+class SnapshotDocument:
+    """A document of a DOM snapshot whose nodes, layout and styles are stored in arrays.
+
+    The methods work like the JavaScript functions of the scanner with the
+    same name, but on the captured layout: `element_from_point` hit tests the
+    layout boxes by their paint order instead of the rendered page.
+    """
+    def __init__(self, index, document, strings, computed_styles):
+        self.index = index
+        self.strings = strings
+        nodes = document.get('nodes')
+
+        # node table
+        self.parents = np.array(nodes.get('parentIndex'), dtype=np.int64)
+        self.node_count = len(self.parents)
+        self.node_types = np.array(nodes.get('nodeType'), dtype=np.int64)
+        self.node_names = [self._get_string(name).lower() for name in nodes.get('nodeName')]
+        self.node_values = [self._get_string(value) or '' for value in nodes.get('nodeValue')]
+        self.backend_node_ids = np.array(nodes.get('backendNodeId'), dtype=np.int64)
+        self.attributes = [
+                [(self._get_string(names_and_values[i]), self._get_string(names_and_values[i + 1])) for i in range(0, len(names_and_values), 2)]
+                for names_and_values in nodes.get('attributes')
+            ]
+        self.content_documents = dict(zip(nodes.get('contentDocumentIndex', {}).get('index', []),
+                                          nodes.get('contentDocumentIndex', {}).get('value', [])))
+
+        # pseudo elements and shadow roots are not part of `childNodes`
+        excluded_nodes = set(nodes.get('pseudoType', {}).get('index', [])) | set(nodes.get('shadowRootType', {}).get('index', []))
+        self.children = [[] for _ in range(self.node_count)]
+        for node in range(self.node_count):
+            if self.parents[node] >= 0 and node not in excluded_nodes:
+                self.children[self.parents[node]].append(node)
+        self.in_tree = np.zeros(self.node_count, dtype=bool)
+        for node in self._iter_subtree(0):
+            self.in_tree[node] = True
+
+        self.document_element = next((child for child in self.children[0] if self.node_types[child] == NODE_TYPE_ELEMENT), None)
+        self.body = next((child for child in self.children[self.document_element] if self.node_names[child] == 'body'), None) \
+                if self.document_element is not None else None
+        self.in_body = np.zeros(self.node_count, dtype=bool)
+        if self.body is not None:
+            for node in self._iter_subtree(self.body):
+                self.in_body[node] = True
+            self.in_body[self.body] = False
+
+        # layout table, nodes without layout (e.g. `display: none`) have no entry
+        layout = document.get('layout')
+        layout_count = len(layout.get('nodeIndex'))
+        self.layout_nodes = np.array(layout.get('nodeIndex'), dtype=np.int64)
+        self.layout_indexes = np.full(self.node_count, -1, dtype=np.int64)
+        self.layout_indexes[self.layout_nodes[::-1]] = np.arange(layout_count - 1, -1, -1)
+        self.bounds = np.array(layout.get('bounds'), dtype=np.float64).reshape(layout_count, 4)
+        self.offset_rects = self._get_rects(layout.get('offsetRects'), layout_count)
+        self.client_rects = self._get_rects(layout.get('clientRects'), layout_count)
+        self.paint_orders = np.array(layout.get('paintOrders') or [0] * layout_count, dtype=np.int64)
+        self.layout_texts = [self._get_string(text) for text in layout.get('text')]
+
+        # style table, the values are stored by the name of the style
+        # (nodes like the document have no styles)
+        styles = np.array([
+                entry_styles if len(entry_styles) == len(computed_styles) else [-1] * len(computed_styles)
+                for entry_styles in layout.get('styles')
+            ], dtype=np.int64).reshape(layout_count, len(computed_styles))
+        self.styles = {
+                name: [self._get_string(value) for value in styles[:, column]]
+                for column, name in enumerate(computed_styles)
+            }
+        self.numeric_styles = {
+                name: np.array([_parse_int(value) for value in self.styles.get(name)], dtype=np.float64)
+                for name in computed_styles
+                if name.startswith('margin-') or name.startswith('border-') or name.startswith('padding-') or name == 'font-size'
+            }
+        self.opacities = np.array([_parse_float(value, 1.0) for value in self.styles.get('opacity')], dtype=np.float64)
+
+        # the element that is found by a hit test on the layout box, text
+        # nodes and pseudo elements are replaced by their parent element and
+        # nodes in shadow trees by their host
+        self.hit_elements = np.full(layout_count, -1, dtype=np.int64)
+        for layout_index, node in enumerate(self.layout_nodes):
+            while node >= 0 and (self.node_types[node] != NODE_TYPE_ELEMENT or not self.in_tree[node]):
+                node = self.parents[node]
+            self.hit_elements[layout_index] = node
+        hittable = (self.hit_elements >= 0) \
+                & (np.array(self.styles.get('visibility')) == 'visible') \
+                & (np.array(self.styles.get('pointer-events')) != 'none')
+
+        # the boxes for hit tests: text is hit on its line boxes, because the
+        # bounds of text that wraps over several lines cover other elements
+        text_boxes = document.get('textBoxes', {})
+        text_box_layout_indexes = np.array(text_boxes.get('layoutIndex', []), dtype=np.int64)
+        is_text_layout = self.node_types[self.layout_nodes] == NODE_TYPE_TEXT
+        box_layout_indexes = np.concatenate([np.flatnonzero(~is_text_layout), text_box_layout_indexes])
+        self.box_bounds = np.concatenate([
+                self.bounds[~is_text_layout],
+                np.array(text_boxes.get('bounds', []), dtype=np.float64).reshape(len(text_box_layout_indexes), 4)])
+        box_hittable = hittable[box_layout_indexes]
+        self.box_bounds = self.box_bounds[box_hittable]
+        self.box_layout_indexes = box_layout_indexes[box_hittable]
+
+        self.scroll_x = document.get('scrollOffsetX', 0)
+        self.scroll_y = document.get('scrollOffsetY', 0)
+        self.viewport_width, self.viewport_height = self._get_viewport_size(document)
+
+        # the elements by their classes and attributes, built on first use,
+        # and the number of elements that match a combination of them
+        self._class_index = None
+        self._attribute_index = None
+        self._combination_counts = {}
+
+    def _get_string(self, index):
+        return self.strings[index] if index is not None and index >= 0 else None
+
+    def _get_rects(self, rects, layout_count):
+        # rects are missing for nodes that are not elements
+        result = np.full((layout_count, 4), np.nan, dtype=np.float64)
+        for layout_index, rect in enumerate(rects or []):
+            if len(rect) == 4:
+                result[layout_index] = rect
+        return result
+
+    def _get_viewport_size(self, document):
+        # the size of the viewport is the client size of the html element
+        # like `document.documentElement.clientWidth`
+        layout_index = self.layout_indexes[self.document_element] if self.document_element is not None else -1
+        if layout_index >= 0 and not np.isnan(self.client_rects[layout_index][2]):
+            return self.client_rects[layout_index][2], self.client_rects[layout_index][3]
+        return document.get('contentWidth', 0), document.get('contentHeight', 0)
+
+    def _iter_subtree(self, node):
+        """Iterates over the node and its descendants in document order."""
+        stack = [node]
+        while len(stack) > 0:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(self.children[node]))
+
+    def _iter_ancestors(self, node):
+        """Iterates over the node and its ancestors."""
+        while node >= 0:
+            yield node
+            node = self.parents[node]
+
+    def get_backend_node_id(self, node):
+        return int(self.backend_node_ids[node])
+
+    def get_style(self, node, name):
+        layout_index = self.layout_indexes[node]
+        return self.styles.get(name)[layout_index] if layout_index >= 0 else None
+
+    def _get_numeric_style(self, node, name):
+        layout_index = self.layout_indexes[node]
+        return self.numeric_styles.get(name)[layout_index] if layout_index >= 0 else 0
+
+    def _get_rect(self, node, rects):
+        layout_index = self.layout_indexes[node]
+        return rects[layout_index] if layout_index >= 0 else np.zeros(4)
+
+    def _get_bounding_client_rect(self, node):
+        rect = self._get_rect(node, self.bounds)
+        return rect[0] - self.scroll_x, rect[1] - self.scroll_y, rect[2], rect[3]
+
+    def _get_offset_size(self, node):
+        # elements without offset size (e.g. svg elements) use their bounds
+        layout_index = self.layout_indexes[node]
+        if layout_index < 0:
+            return 0, 0
+        rect = self.offset_rects[layout_index]
+        if np.isnan(rect[2]):
+            rect = self.bounds[layout_index]
+        return rect[2], rect[3]
+
+    def _get_client_size(self, node):
+        rect = self._get_rect(node, self.client_rects)
+        return (0, 0) if np.isnan(rect[2]) else (rect[2], rect[3])
+
+    def _get_attribute(self, node, name):
+        return next((value for attribute_name, value in self.attributes[node] if attribute_name == name), None)
+
+    def _has_attribute(self, node, name):
+        return any(attribute_name == name for attribute_name, value in self.attributes[node])
+
+    def _get_class_list(self, node):
+        return list(dict.fromkeys((self._get_attribute(node, 'class') or '').split()))
+
+    def _contains(self, ancestor, node):
+        return any(ancestor == node for node in self._iter_ancestors(node))
+
+    def element_from_point(self, x, y):
+        """Returns the topmost element at the point like `document.elementFromPoint`."""
+        if x < 0 or y < 0 or x >= self.viewport_width or y >= self.viewport_height:
+            return None
+        x = x + self.scroll_x
+        y = y + self.scroll_y
+        hits = (self.box_bounds[:, 0] <= x) & (x < self.box_bounds[:, 0] + self.box_bounds[:, 2]) \
+                & (self.box_bounds[:, 1] <= y) & (y < self.box_bounds[:, 1] + self.box_bounds[:, 3])
+        hit_layout_indexes = self.box_layout_indexes[hits]
+        if len(hit_layout_indexes) == 0:
+            return self.document_element
+
+        # boxes with the same paint order are painted in document order
+        topmost = hit_layout_indexes[np.lexsort((hit_layout_indexes, self.paint_orders[hit_layout_indexes]))[-1]]
+        return int(self.hit_elements[topmost])
+
+    def is_visible(self, node, visibility_cache=None):
+        """Returns the node or a visible descendant if it is visible, otherwise `None`."""
+        if visibility_cache is None:
+            visibility_cache = {}
+        if self.node_types[node] != NODE_TYPE_ELEMENT:
+            return None
+        if node not in visibility_cache:
+            visibility_cache[node] = self._check_visibility(node, visibility_cache)
+        return visibility_cache.get(node)
+
+    def _check_visibility(self, node, visibility_cache):
+        visible = True
+
+        # nodes without layout cannot be visible themselves, but the child
+        # nodes of elements with `display: contents` might be
+        if self.layout_indexes[node] >= 0:
+            # for these rules the childs cannot be visible, directly return
+            layout_index = self.layout_indexes[node]
+            if self.opacities[layout_index] < 0.1:
+                return None
+            if self.styles.get('visibility')[layout_index] != 'visible':
+                return None
+        else:
+            visible = False
+
+        # for these rules a child element might still be visible,
+        # we need to also look at the childs, no direct return
+        left, top, width, height = self._get_bounding_client_rect(node)
+        offset_width, offset_height = self._get_offset_size(node)
+        if offset_width + offset_height + width + height == 0:
+            visible = False
+        if offset_width < 10 or offset_height < 10:
+            visible = False
+        center_x = left + offset_width / 2
+        center_y = top + offset_height / 2
+        if center_x < 0 or center_x > self.viewport_width or center_y < 0 or center_y > self.viewport_height:
+            visible = False
+
+        if visible:
+            font_size = self._get_numeric_style(node, 'font-size')
+            for y in [center_y, center_y - font_size / 2]:
+                point_container = self.element_from_point(center_x, y)
+                if point_container is not None and self._contains(node, point_container):
+                    return node
+            return None
+
+        # check the child nodes
+        for child in self.children[node]:
+            visible_child = self.is_visible(child, visibility_cache)
+            if visible_child is not None:
+                return visible_child
+        return None
+
+    def search_for_strings(self, string_matcher):
+        """Returns the elements in the body that contain one of the strings of the matcher in a text node."""
+        elems = {}
+        for node in np.flatnonzero((self.node_types == NODE_TYPE_TEXT) & self.in_body):
+            elem = int(self.parents[node])
+            if elem == self.body or self.node_types[elem] != NODE_TYPE_ELEMENT or elem in elems:
+                continue
+            if self.node_names[elem] in ['script', 'style', 'noscript']:
+                continue
+            if string_matcher.matches(self.node_values[node]):
+                elems[elem] = True
+        return list(elems)
+
+    def find_closest_block_element(self, node):
+        while node >= 0 and node != self.body and self.get_style(node, 'display') == 'inline':
+            node = int(self.parents[node])
+        return node if node >= 0 else None
+
+    def find_fixed_parent(self, node):
+        while node >= 0 and self.parents[node] != 0:
+            if self.get_style(node, 'position') == 'fixed':
+                return node
+            node = int(self.parents[node])
+        return node # html node
+
+    def find_full_width_parent(self, node):
+        def get_height(node):
+            return self._get_client_size(node)[1] + \
+                self._get_numeric_style(node, 'border-top-width') + self._get_numeric_style(node, 'border-bottom-width') + \
+                self._get_numeric_style(node, 'margin-top') + self._get_numeric_style(node, 'margin-bottom')
+
+        def get_width(node):
+            return self._get_client_size(node)[0] + \
+                self._get_numeric_style(node, 'border-left-width') + self._get_numeric_style(node, 'border-right-width') + \
+                self._get_numeric_style(node, 'margin-left') + self._get_numeric_style(node, 'margin-right')
+
+        def get_vertical_spacing(node):
+            return self._get_numeric_style(node, 'padding-top') + self._get_numeric_style(node, 'padding-bottom') + \
+                self._get_numeric_style(node, 'border-top-width') + self._get_numeric_style(node, 'border-bottom-width') + \
+                self._get_numeric_style(node, 'margin-top') + self._get_numeric_style(node, 'margin-bottom')
+
+        def is_parent_higher_than_its_spacing(outer_node, inner_node):
+            allowed_increase = max(0.25 * get_height(inner_node), 20)
+            return get_height(outer_node) - get_height(inner_node) > get_vertical_spacing(outer_node) + allowed_increase
+
+        def is_parent_moved_more_than_its_spacing(outer_node, inner_node):
+            allowed_increase = max(0.25 * get_height(inner_node), 20)
+            position_diff = abs(self._get_bounding_client_rect(outer_node)[1] - self._get_bounding_client_rect(inner_node)[1])
+            position_spacing = self._get_numeric_style(inner_node, 'margin-top') + \
+                self._get_numeric_style(outer_node, 'padding-top') + self._get_numeric_style(outer_node, 'border-top-width')
+            return position_diff > position_spacing + allowed_increase
+
+        while node != self.body:
+            # the document itself has no style
+            parent = int(self.parents[node])
+            if parent <= 0:
+                break
+            if is_parent_higher_than_its_spacing(parent, node) or is_parent_moved_more_than_its_spacing(parent, node):
+                break
+            node = parent
+
+        allowed_increase = 18 # for scrollbar issues
+        if self.viewport_width <= get_width(node) + allowed_increase:
+            return node
+        return None
+
+    def find_clickables_in_element(self, node, max_clickables=MAX_CLICKABLES):
+        """Returns the outermost links and buttons in the element and whether
+        some of them were left out because there are more than `max_clickables`.
+
+        The clickables that are most likely to accept or reject cookies are
+        kept: those whose text or attributes contain one of the
+        `CLICKABLE_KEYWORDS`, then buttons before links.
+        """
+        def is_clickable(node):
+            if self.node_types[node] != NODE_TYPE_ELEMENT:
+                return False
+            if self.node_names[node] in ['a', 'button']:
+                return True
+            if self.node_names[node] == 'input' and (self._get_attribute(node, 'type') or '').lower() in ['button', 'submit']:
+                return True
+            return self._get_attribute(node, 'role') in ['button', 'link']
+
+        clickables = []
+        stack = list(reversed(self.children[node]))
+        while len(stack) > 0:
+            node = stack.pop()
+            if is_clickable(node):
+                clickables.append(node)
+            else:
+                stack.extend(reversed(self.children[node]))
+
+        is_truncated = max_clickables > 0 and len(clickables) > max_clickables
+        if is_truncated:
+            scores = {clickable: self._get_clickable_score(clickable) for clickable in clickables}
+            kept_clickables = set(sorted(clickables, key=lambda clickable: -scores.get(clickable))[:max_clickables])
+            clickables = [clickable for clickable in clickables if clickable in kept_clickables]
+        return clickables, is_truncated
+
+    def _get_clickable_score(self, node):
+        label = ' '.join([self.get_text_content(node)] + [
+                self._get_attribute(node, name) or ''
+                for name in ['value', 'aria-label', 'title', 'id', 'class']
+            ]).lower()
+        score = 2 if any(keyword in label for keyword in CLICKABLE_KEYWORDS) else 0
+        if self.node_names[node] != 'a' and self._get_attribute(node, 'role') != 'link':
+            score += 1
+        return score
+
+    def get_text_content(self, node):
+        texts = []
+        stack = [node]
+        while len(stack) > 0:
+            node = stack.pop()
+            if self.node_types[node] == NODE_TYPE_TEXT:
+                texts.append(self.node_values[node])
+            else:
+                stack.extend(reversed(self.children[node]))
+        return ''.join(texts)
+
+    def get_properties_of_clickable(self, node, max_length):
+        truncated_properties = []
+        offset_width, offset_height = self._get_offset_size(node)
+        left, top, width, height = self._get_bounding_client_rect(node)
+        if self.node_names[node] == 'a' or self._get_attribute(node, 'role') == 'link':
+            clickable_type = 'link'
+        else:
+            clickable_type = 'button'
+
+        return {
+            'html': _truncate('html', self.get_outer_html(node), max_length, truncated_properties),
+            'node': self.node_names[node],
+            'type': clickable_type,
+            'text': _truncate('text', self.get_inner_text(node), max_length, truncated_properties),
+            'value': self._get_attribute(node, 'value'),
+            'fontsize': self.get_style(node, 'font-size'),
+            'width': int(offset_width),
+            'height': int(offset_height),
+            'x': float(left),
+            'y': float(top),
+            'truncated_properties': truncated_properties,
+        }
+
+    def get_cookie_notice_properties(self, node, max_length, max_combination_size=MAX_COMBINATION_SIZE,
+                                     max_combination_queries=MAX_COMBINATION_QUERIES):
+        truncated_properties = []
+        unique_class_combinations = self._get_unique_class_combinations(
+                node, max_combination_size, max_combination_queries, truncated_properties)
+        unique_attribute_combinations = self._get_unique_attribute_combinations(
+                node, max_combination_size, max_combination_queries, truncated_properties)
+        offset_width, offset_height = self._get_offset_size(node)
+        left, top, width, height = self._get_bounding_client_rect(node)
+        return {
+            'html': _truncate('html', self.get_outer_html(node), max_length, truncated_properties),
+            'has_id': self._has_attribute(node, 'id'),
+            'has_class': self._has_attribute(node, 'class'),
+            'unique_class_combinations': unique_class_combinations,
+            'unique_attribute_combinations': unique_attribute_combinations,
+            'id': self._get_attribute(node, 'id'),
+            'class': self._get_class_list(node),
+            'text': _truncate('text', self.get_inner_text(node), max_length, truncated_properties),
+            'fontsize': self.get_style(node, 'font-size'),
+            'width': 'full' if offset_width >= self.viewport_width else int(offset_width),
+            'height': 'full' if offset_height >= self.viewport_height else int(offset_height),
+            'x': float(left),
+            'y': float(top),
+            'truncated_properties': truncated_properties,
+        }
+
+    def _get_elements(self):
+        return [node for node in np.flatnonzero(self.in_tree & (self.node_types == NODE_TYPE_ELEMENT))]
+
+    def _get_unique_class_combinations(self, node, max_size, max_queries, truncated_properties):
+        if self._class_index is None:
+            self._class_index = {}
+            for elem in self._get_elements():
+                for class_name in self._get_class_list(elem):
+                    self._class_index.setdefault(class_name, set()).add(elem)
+
+        def count_elements(class_combination):
+            key = ('class',) + tuple(sorted(class_combination))
+            if key not in self._combination_counts:
+                self._combination_counts[key] = len(set.intersection(
+                        *[self._class_index.get(class_name) for class_name in class_combination]))
+            return self._combination_counts.get(key)
+
+        result, is_truncated = _get_unique_combinations(self._get_class_list(node), count_elements, max_size, max_queries)
+        if is_truncated:
+            truncated_properties.append('unique_class_combinations')
+        return [' '.join(class_combination) for class_combination in result]
+
+    def _get_unique_attribute_combinations(self, node, max_size, max_queries, truncated_properties):
+        if self._attribute_index is None:
+            self._attribute_index = {}
+            for elem in self._get_elements():
+                for attribute in self.attributes[elem]:
+                    self._attribute_index.setdefault(attribute, set()).add(elem)
+
+        def count_elements(attribute_combination):
+            key = ('attribute',) + attribute_combination
+            if key not in self._combination_counts:
+                self._combination_counts[key] = len(set.intersection(
+                        *[self._attribute_index.get(attribute) for attribute in attribute_combination]))
+            return self._combination_counts.get(key)
+
+        attributes = [attribute for attribute in self.attributes[node] if attribute[0] not in ['id', 'class', 'style']]
+        result, is_truncated = _get_unique_combinations(attributes, count_elements, max_size, max_queries)
+        if is_truncated:
+            truncated_properties.append('unique_attribute_combinations')
+        return [' '.join(name for name, value in attribute_combination) for attribute_combination in result]
+
+    def is_page_modal(self, cookie_notice=None):
+        margin = 5
+        viewport_width = self.viewport_width
+        viewport_height = self.viewport_height
+        viewport_vertical_center = viewport_height / 2
+
+        # the same positions as in `JS_IS_PAGE_MODAL`
+        test_positions = [
+            {'x': margin, 'y': margin},
+            {'x': margin, 'y': viewport_vertical_center},
+            {'x': margin, 'y': viewport_height - margin},
+            {'x': viewport_vertical_center, 'y': margin},
+            {'x': viewport_vertical_center, 'y': viewport_height - margin},
+            {'x': viewport_width - margin, 'y': margin},
+            {'x': viewport_width - margin, 'y': viewport_vertical_center},
+            {'x': viewport_width - margin, 'y': viewport_height - margin},
+        ]
+
+        if cookie_notice and cookie_notice.get('x') is not None and cookie_notice.get('y') is not None:
+            width = viewport_width if cookie_notice.get('width') == 'full' else cookie_notice.get('width')
+            height = viewport_height if cookie_notice.get('height') == 'full' else cookie_notice.get('height')
+            # the position after a removed position is skipped like in the
+            # JavaScript function
+            index = 0
+            while index < len(test_positions):
+                test_position = test_positions[index]
+                if cookie_notice.get('x') <= test_position.get('x') <= cookie_notice.get('x') + width and \
+                        cookie_notice.get('y') <= test_position.get('y') <= cookie_notice.get('y') + height:
+                    test_positions.pop(index)
+                index += 1
+
+        if len(test_positions) == 0:
+            return None
+        containers = [self.element_from_point(test_position.get('x'), test_position.get('y')) for test_position in test_positions]
+        return all(container == containers[0] for container in containers)
+
+    def get_outer_html(self, node):
+        """Serializes the node like `outerHTML`."""
+        def escape(text, is_attribute):
+            text = text.replace('&', '&amp;').replace('\xa0', '&nbsp;')
+            if is_attribute:
+                return text.replace('"', '&quot;')
+            return text.replace('<', '&lt;').replace('>', '&gt;')
+
+        parts = []
+        # the stack contains nodes and the end tags of elements
+        stack = [node]
+        while len(stack) > 0:
+            node = stack.pop()
+            if isinstance(node, str):
+                parts.append(node)
+                continue
+
+            node_type = self.node_types[node]
+            if node_type == NODE_TYPE_ELEMENT:
+                name = self.node_names[node]
+                parts.append('<' + name)
+                for attribute_name, attribute_value in self.attributes[node]:
+                    parts.append(f' {attribute_name}="{escape(attribute_value or "", True)}"')
+                parts.append('>')
+                if name in HTML_VOID_ELEMENTS:
+                    continue
+                stack.append(f'</{name}>')
+                stack.extend(reversed(self.children[node]))
+            elif node_type == NODE_TYPE_TEXT:
+                parent = self.parents[node]
+                if parent >= 0 and self.node_names[parent] in HTML_RAW_TEXT_ELEMENTS:
+                    parts.append(self.node_values[node])
+                else:
+                    parts.append(escape(self.node_values[node], False))
+            elif node_type == NODE_TYPE_COMMENT:
+                parts.append(f'<!--{self.node_values[node]}-->')
+            elif node_type == NODE_TYPE_DOCUMENT_TYPE:
+                parts.append(f'<!DOCTYPE {self.node_names[node]}>')
+            else:
+                stack.extend(reversed(self.children[node]))
+        return ''.join(parts)
+
+    def get_inner_text(self, node):
+        """Returns the rendered text of the node similar to `innerText`.
+
+        The rendered text of the text nodes is joined, text in different
+        block elements is separated by a line break.
+        """
+        parts = []
+        previous_block = None
+        for descendant in self._iter_subtree(node):
+            layout_index = self.layout_indexes[descendant]
+            if self.node_types[descendant] != NODE_TYPE_TEXT or layout_index < 0 or not self.layout_texts[layout_index]:
+                continue
+
+            block = int(self.parents[descendant])
+            while block != node and self.get_style(block, 'display') in INLINE_DISPLAY_VALUES:
+                block = int(self.parents[block])
+
+            # whitespace is collapsed like in elements with `white-space: normal`,
+            # whitespace between block elements is not rendered
+            text = re.sub(r'[ \t\r\n\f]+', ' ', self.layout_texts[layout_index])
+            if block != previous_block and text.strip() == '':
+                continue
+            if previous_block is not None and block != previous_block:
+                # paragraphs are separated by an empty line
+                if self.node_names[block] == 'p' or self.node_names[previous_block] == 'p':
+                    parts.append('\n\n')
+                else:
+                    parts.append('\n')
+            parts.append(text)
+            previous_block = block
+        return '\n'.join(re.sub(' +', ' ', line).strip() for line in ''.join(parts).split('\n'))
+
+
+############################################################################
+# JAVASCRIPT
+############################################################################
+
+# The functions are part of the library of the scanner (see `JS_LIBRARY`).
+# Functions for single elements take the element as first argument.
+
+# the name of the library on the `window` object
+JS_LIBRARY_NAME = '__cookieNoticeScanner'
+
+# the error message if the library is called before it was installed
+JS_LIBRARY_MISSING = 'cookie notice scanner library is not installed'
+
+JS_TRUNCATE_STRING = """
+    function truncateString(value, maxLength) {
+        // the length counts UTF-16 code units, a surrogate pair that would
+        // be cut in half is removed because a lone surrogate cannot be
+        // encoded in the results
+        let truncated = value.slice(0, maxLength);
+        let lastCode = truncated.charCodeAt(truncated.length - 1);
+        if (lastCode >= 0xd800 && lastCode <= 0xdbff) {
+            truncated = truncated.slice(0, -1);
+        }
+        return truncated;
+    }"""
+
+JS_GET_COOKIE_NOTICE_PROPERTIES = """
+    // the number of elements that match a class or attribute combination,
+    // the counts are kept until the document changes
+    let combinationCounts = new Map();
+    let combinationCountsObserver = null;
+    function getCombinationCount(key, countElements) {
+        if (!combinationCountsObserver) {
+            combinationCountsObserver = new MutationObserver(function() {
+                combinationCounts.clear();
+                combinationCountsObserver.disconnect();
+                combinationCountsObserver = null;
+            });
+            combinationCountsObserver.observe(document, {'subtree': true, 'childList': true, 'attributes': true});
+        }
+        if (!combinationCounts.has(key)) {
+            combinationCounts.set(key, countElements());
+        }
+        return combinationCounts.get(key);
+    }
+
+    function getCookieNoticeProperties(elem, maxLength, maxCombinationSize, maxCombinationQueries) {
+        if (!elem) elem = this;
+        if (maxCombinationSize === undefined) maxCombinationSize = """ + str(MAX_COMBINATION_SIZE) + """;
+        if (maxCombinationQueries === undefined) maxCombinationQueries = """ + str(MAX_COMBINATION_QUERIES) + """;
+        const style = getComputedStyle(elem);
+
+        // long values (e.g. the html of full-page notices) are truncated
+        let truncatedProperties = [];
+        function truncate(name, value) {
+            if (maxLength && value && value.length > maxLength) {
+                truncatedProperties.push(name);
+                return truncateString(value, maxLength);
+            }
+            return value;
+        }
+
+        // the combinations are checked smallest first, supersets of unique
+        // combinations are skipped, see `_get_unique_combinations`
+        function getUniqueCombinations(name, items, countElements) {
+            let result = [];
+            let queries = 0;
+            for (let size = 1; size <= Math.min(maxCombinationSize, items.length); size++) {
+                let indexes = Array.from(Array(size).keys());
+                while (true) {
+                    let combination = indexes.map(function(index) { return items[index]; });
+                    let isSuperset = result.some(function(uniqueCombination) {
+                        return uniqueCombination.every(function(item) { return combination.includes(item); });
+                    });
+                    if (!isSuperset) {
+                        if (queries >= maxCombinationQueries) {
+                            truncatedProperties.push(name);
+                            return result.map(function(uniqueCombination) { return uniqueCombination.join(' '); });
+                        }
+                        queries++;
+                        if (countElements(combination) == 1) {
+                            result.push(combination);
+                        }
+                    }
+
+                    // the next combination of the same size
+                    let i = size - 1;
+                    while (i >= 0 && indexes[i] == items.length - size + i) {
+                        i--;
+                    }
+                    if (i < 0) {
+                        break;
+                    }
+                    indexes[i]++;
+                    for (let j = i + 1; j < size; j++) {
+                        indexes[j] = indexes[j - 1] + 1;
+                    }
+                }
+            }
+            return result.map(function(uniqueCombination) { return uniqueCombination.join(' '); });
+        }
+
+        function getUniqueClassCombinations(elem) {
+            return getUniqueCombinations('unique_class_combinations', Array.from(elem.classList), function(classCombination) {
+                let classNames = classCombination.slice().sort().join(' ');
+                return getCombinationCount('class:' + classNames, function() {
+                    return document.getElementsByClassName(classNames).length;
+                });
+            });
+        }
+
+        function getUniqueAttributeCombinations(elem) {
+            let attributeNames = [];
+            for (const attribute of elem.attributes) {
+                if (attribute.localName == 'id' || attribute.localName == 'class' || attribute.localName == 'style') {
+                    continue;
+                }
+                attributeNames.push(attribute.localName);
+            }
+
+            return getUniqueCombinations('unique_attribute_combinations', attributeNames, function(attributeCombination) {
+                let selector = '';
+                for (const attributeName of attributeCombination) {
+                    selector += '[' + CSS.escape(attributeName) + '="' + CSS.escape(elem.getAttribute(attributeName)) + '"]';
+                }
+                return getCombinationCount('attribute:' + selector, function() {
+                    return document.querySelectorAll(selector).length;
+                });
+            });
+        }
+
+        let width = elem.offsetWidth;
+        if (width >= document.documentElement.clientWidth) {
+            width = 'full';
+        }
+        let height = elem.offsetHeight;
+        if (height >= document.documentElement.clientHeight) {
+            height = 'full';
+        }
+
+        return {
+            'html': truncate('html', elem.outerHTML),
+            'has_id': elem.hasAttribute('id'),
+            'has_class': elem.hasAttribute('class'),
+            'unique_class_combinations': getUniqueClassCombinations(elem),
+            'unique_attribute_combinations': getUniqueAttributeCombinations(elem),
+            'id': elem.getAttribute('id'),
+            'class': Array.from(elem.classList),
+            'text': truncate('text', elem.innerText),
+            'fontsize': style.fontSize,
+            'width': width,
+            'height': height,
+            'x': elem.getBoundingClientRect().left,
+            'y': elem.getBoundingClientRect().top,
+            'truncated_properties': truncatedProperties,
+        };
+    }"""
+
+JS_FIND_CLOSEST_BLOCK_ELEMENT = """
+    function findClosestBlockElement(elem) {
+        function isInlineElement(elem) {
+            const style = getComputedStyle(elem);
+            return style.display == 'inline';
+        }
+
+        if (!elem) elem = this;
+        while(elem && elem !== document.body && isInlineElement(elem)) {
+            elem = elem.parentNode;
+        }
+        return elem;
+    }"""
+
+JS_FIND_FULL_WIDTH_PARENT = """
+    function findFullWidthParent(elem) {
+        function parseValue(value) {
+            var parsedValue = parseInt(value);
+            if (isNaN(parsedValue)) {
+                return 0;
+            } else {
+                return parsedValue;
+            }
+        }
+
+        function getWidth(elem) {
+            const style = getComputedStyle(elem);
+            return elem.clientWidth +
+                parseValue(style.borderLeftWidth) + parseValue(style.borderRightWidth) +
+                parseValue(style.marginLeft) + parseValue(style.marginRight);
+        }
+
+        function getHeight(elem) {
+            const style = getComputedStyle(elem);
+            return elem.clientHeight +
+                parseValue(style.borderTopWidth) + parseValue(style.borderBottomWidth) +
+                parseValue(style.marginTop) + parseValue(style.marginBottom);
+        }
+
+        function getVerticalSpacing(elem) {
+            const style = getComputedStyle(elem);
+            return parseValue(style.paddingTop) + parseValue(style.paddingBottom) +
+                parseValue(style.borderTopWidth) + parseValue(style.borderBottomWidth) +
+                parseValue(style.marginTop) + parseValue(style.marginBottom);
+        }
+
+        function getHeightDiff(outerElem, innerElem) {
+            return getHeight(outerElem) - getHeight(innerElem);
+        }
+
+        function isParentHigherThanItsSpacing(outerElem, innerElem) {
+            let allowedIncrease = Math.max(0.25*getHeight(innerElem), 20);
+            return getHeightDiff(outerElem, innerElem) > (getVerticalSpacing(outerElem) + allowedIncrease);
+        }
+
+        function getPosition(elem) {
+            return elem.getBoundingClientRect().top;
+        }
+
+        function getPositionDiff(outerElem, innerElem) {
+            return Math.abs(getPosition(outerElem) - getPosition(innerElem));
+        }
+
+        function getPositionSpacing(outerElem, innerElem) {
+            const outerStyle = getComputedStyle(outerElem);
+            const innerStyle = getComputedStyle(innerElem);
+            return parseValue(innerStyle.marginTop) +
+                parseValue(outerStyle.paddingTop) + parseValue(outerStyle.borderTopWidth)
+        }
+
+        function isParentMovedMoreThanItsSpacing(outerElem, innerElem) {
+            let allowedIncrease = Math.max(0.25*getHeight(innerElem), 20);
+            return getPositionDiff(outerElem, innerElem) > (getPositionSpacing(outerElem, innerElem) + allowedIncrease);
+        }
+
+        if (!elem) elem = this;
+        while(elem && elem !== document.body) {
+            let parent = elem.parentNode;
+            if (isParentHigherThanItsSpacing(parent, elem) || isParentMovedMoreThanItsSpacing(parent, elem)) {
+                break;
+            }
+            elem = parent;
+        }
+
+        let allowedIncrease = 18; // for scrollbar issues
+        if (document.documentElement.clientWidth <= (getWidth(elem) + allowedIncrease)) {
+            return elem;
+        } else {
+            return false;
+        }
+    }"""
+
+JS_FIND_FIXED_PARENT = """
+    function findFixedParent(elem) {
+        if (!elem) elem = this;
+        while(elem && elem.parentNode !== document) {
+            let style = getComputedStyle(elem);
+            if (style.position === 'fixed') {
+                return elem;
+            }
+            elem = elem.parentNode;
+        }
+        return elem; // html node
+    }"""
+
+JS_FIND_CLICKABLES_IN_ELEMENT = """
+    function findClickablesInElement(elem, maxClickables) {
+        if (!elem) elem = this;
+
+        // the outermost clickables are found in one walk over the tree, the
+        // filter rejects clickables so that their descendants are skipped and
+        // skips all other elements, so `nextNode` never returns a node
+        let clickables = [];
+        let walker = elem.ownerDocument.createTreeWalker(elem, NodeFilter.SHOW_ELEMENT, {
+            'acceptNode': function(node) {
+                if (node.matches('a, button, input[type="button"], input[type="submit"], [role="button"], [role="link"]')) {
+                    clickables.push(node);
+                    return NodeFilter.FILTER_REJECT;
+                }
+                return NodeFilter.FILTER_SKIP;
+            },
+        });
+        while (walker.nextNode()) {}
+
+        // the most likely accept and reject controls are kept if there are
+        // too many clickables, see `SnapshotDocument.find_clickables_in_element`
+        let isTruncated = maxClickables > 0 && clickables.length > maxClickables;
+        if (isTruncated) {
+            const keywords = """ + json.dumps(CLICKABLE_KEYWORDS) + """;
+            let scores = new Map();
+            for (const clickable of clickables) {
+                let label = [
+                    clickable.textContent,
+                    clickable.getAttribute('value'),
+                    clickable.getAttribute('aria-label'),
+                    clickable.getAttribute('title'),
+                    clickable.getAttribute('id'),
+                    clickable.getAttribute('class'),
+                ].join(' ').toLowerCase();
+                let score = keywords.some(function(keyword) { return label.includes(keyword); }) ? 2 : 0;
+                if (clickable.localName != 'a' && clickable.getAttribute('role') != 'link') {
+                    score += 1;
+                }
+                scores.set(clickable, score);
+            }
+            let keptClickables = new Set(clickables.slice().sort(function(a, b) {
+                return scores.get(b) - scores.get(a);
+            }).slice(0, maxClickables));
+            clickables = clickables.filter(function(clickable) { return keptClickables.has(clickable); });
+        }
+        return {'clickables': clickables, 'is_truncated': isTruncated};
+    }"""
+
+JS_GET_PROPERTIES_OF_CLICKABLE = """
+    function getPropertiesOfClickable(elem, maxLength) {
+        if (!elem) elem = this;
+
+        // long values are truncated
+        let truncatedProperties = [];
+        function truncate(name, value) {
+            if (maxLength && value && value.length > maxLength) {
+                truncatedProperties.push(name);
+                return truncateString(value, maxLength);
+            }
+            return value;
+        }
+
+        const style = getComputedStyle(elem);
+
+        let clickable_type;
+        if (elem.localName == 'a' || elem.getAttribute('role') == 'link') {
+            clickable_type = 'link';
+        } else {
+            clickable_type = 'button';
+        }
+
+        return {
+            'html': truncate('html', elem.outerHTML),
+            'node': elem.localName,
+            'type': clickable_type,
+            'text': truncate('text', elem.innerText),
+            'value': elem.getAttribute('value'),
+            'fontsize': style.fontSize,
+            'width': elem.offsetWidth,
+            'height': elem.offsetHeight,
+            'x': elem.getBoundingClientRect().left,
+            'y': elem.getBoundingClientRect().top,
+            'truncated_properties': truncatedProperties,
+        };
+    }"""
+
+JS_CLICK_NODE = """
+    function clickNode(elem) {
+        if (!elem) elem = this;
+        elem.click();
+    }"""
+
+JS_IS_VISIBLE = """
+    function isVisible(elem, visibilityCache) {
+        function parseValue(value) {
+            var parsedValue = parseInt(value);
+            if (isNaN(parsedValue)) {
+                return 0;
+            } else {
+                return parsedValue;
+            }
+        }
+
+        // the results can be shared between several calls as the child nodes
+        // of elements are checked as well, every element is only checked once
+        if (!visibilityCache) visibilityCache = new Map();
+        const viewportWidth = document.documentElement.clientWidth || window.innerWidth;
+        const viewportHeight = document.documentElement.clientHeight || window.innerHeight;
+
+        function isElementVisible(elem) {
+            if (!(elem instanceof Element)) return false;
+            if (!visibilityCache.has(elem)) {
+                visibilityCache.set(elem, checkElement(elem));
+            }
+            return visibilityCache.get(elem);
+        }
+
+        function checkElement(elem) {
+            let visible = true;
+            const style = getComputedStyle(elem);
+
+            // for these rules the childs cannot be visible, directly return
+            if (style.display === 'none') return false;
+            if (style.opacity < 0.1) return false;
+            if (style.visibility !== 'visible') return false;
+
+            // for these rules a child element might still be visible,
+            // we need to also look at the childs, no direct return
+            const rect = elem.getBoundingClientRect();
+            const offsetWidth = elem.offsetWidth;
+            const offsetHeight = elem.offsetHeight;
+            if (offsetWidth + offsetHeight + rect.height + rect.width === 0) {
+                visible = false;
+            }
+            if (offsetWidth < 10 || offsetHeight < 10) {
+                visible = false;
+            }
+            const elemCenter = {
+                x: rect.left + offsetWidth / 2,
+                y: rect.top + offsetHeight / 2
+            };
+            if (elemCenter.x < 0) visible = false;
+            if (elemCenter.x > viewportWidth) visible = false;
+            if (elemCenter.y < 0) visible = false;
+            if (elemCenter.y > viewportHeight) visible = false;
+
+            if (visible) {
+                let pointContainer = document.elementFromPoint(elemCenter.x, elemCenter.y);
+                do {
+                    if (pointContainer === elem) return elem;
+                    if (!pointContainer) break;
+                } while (pointContainer = pointContainer.parentNode);
+
+                pointContainer = document.elementFromPoint(elemCenter.x, elemCenter.y - (parseValue(style.fontSize)/2));
+                do {
+                    if (pointContainer === elem) return elem;
+                    if (!pointContainer) break;
+                } while (pointContainer = pointContainer.parentNode);
+            }
+
+            // check the child nodes
+            if (!visible) {
+                let childrenCount = elem.childNodes.length;
+                for (var i = 0; i < childrenCount; i++) {
+                    let isChildVisible = isElementVisible(elem.childNodes[i]);
+                    if (isChildVisible) {
+                        return isChildVisible;
+                    }
+                }
+            }
+
+            return false;
+        }
+
+        if (!elem) elem = this;
+        return isElementVisible(elem);
+    }"""
+
+JS_ARE_VISIBLE = """
+    function areVisible() {
+        // the elements are passed as arguments, the visibility of elements is
+        // checked only once even if they are nested
+        let elems = Array.prototype.slice.call(arguments);
+        let visibilityCache = new Map();
+        let substitutes = [];
+        let visibilities = elems.map(function(elem) {
+            let visibleElem = isVisible(elem, visibilityCache);
+            if (!visibleElem) {
+                return {'is_visible': false, 'visible_element': null};
+            }
+            if (visibleElem === elem) {
+                return {'is_visible': true, 'visible_element': null};
+            }
+
+            // a descendant is visible instead of the element itself
+            substitutes.push(visibleElem);
+            return {'is_visible': true, 'visible_element': substitutes.length - 1};
+        });
+        return [JSON.stringify(visibilities)].concat(substitutes);
+    }"""
+
+JS_SEARCH_FOR_STRINGS = """
+    function searchForStrings(searchStrings) {
+        // the automaton of the Aho-Corasick algorithm finds all search
+        // strings in one pass over the text
+        let states = [{'next': new Map(), 'fail': 0, 'isMatch': false}];
+        searchStrings.forEach(function(searchString) {
+            let state = 0;
+            for (const character of searchString.toLowerCase()) {
+                if (!states[state].next.has(character)) {
+                    states[state].next.set(character, states.length);
+                    states.push({'next': new Map(), 'fail': 0, 'isMatch': false});
+                }
+                state = states[state].next.get(character);
+            }
+            states[state].isMatch = true;
+        });
+
+        // the fail state is the state of the longest proper suffix, the
+        // states are processed breadth-first
+        let queue = Array.from(states[0].next.values());
+        while (queue.length > 0) {
+            let state = queue.shift();
+            states[state].next.forEach(function(nextState, character) {
+                let fail = states[state].fail;
+                while (fail > 0 && !states[fail].next.has(character)) {
+                    fail = states[fail].fail;
+                }
+                if (states[fail].next.has(character) && states[fail].next.get(character) !== nextState) {
+                    states[nextState].fail = states[fail].next.get(character);
+                }
+                states[nextState].isMatch = states[nextState].isMatch || states[states[nextState].fail].isMatch;
+                queue.push(nextState);
+            });
+        }
+
+        function containsSearchString(text) {
+            let state = 0;
+            for (const character of text.toLowerCase()) {
+                while (state > 0 && !states[state].next.has(character)) {
+                    state = states[state].fail;
+                }
+                state = states[state].next.get(character) || 0;
+                if (states[state].isMatch) {
+                    return true;
+                }
+            }
+            return false;
+        }
+
+        // the text node needs to be in an element inside of the body, this
+        // is the same as the XPath `//body//*/text()`
+        let elems = new Set();
+        if (!document.body || searchStrings.length == 0) {
+            return [];
+        }
+        let walker = document.createTreeWalker(document.body, NodeFilter.SHOW_TEXT);
+        let textNode;
+        while (textNode = walker.nextNode()) {
+            let elem = textNode.parentNode;
+            if (elem === document.body || elem.nodeType !== Node.ELEMENT_NODE || elems.has(elem)) {
+                continue;
+            }
+            if (elem.localName == 'script' || elem.localName == 'style' || elem.localName == 'noscript') {
+                continue;
+            }
+            if (containsSearchString(textNode.nodeValue)) {
+                elems.add(elem);
+            }
+        }
+        return Array.from(elems);
+    }"""
+
+JS_GET_LANGUAGE_SAMPLE = """
+    function getLanguageSample(maxLength) {
+        // the text of the body up to `maxLength` characters, whitespace is
+        // collapsed like in `innerText` but no layout is needed
+        let sample = '';
+        if (!document.body) {
+            return sample;
+        }
+        let walker = document.createTreeWalker(document.body, NodeFilter.SHOW_TEXT);
+        let textNode;
+        while (sample.length < maxLength && (textNode = walker.nextNode())) {
+            let elem = textNode.parentNode;
+            if (elem.localName == 'script' || elem.localName == 'style' || elem.localName == 'noscript') {
+                continue;
+            }
+            let text = textNode.nodeValue.replace(/\\s+/g, ' ').trim();
+            if (text.length > 0) {
+                sample += text + ' ';
+            }
+        }
+        return truncateString(sample, maxLength).trim();
+    }"""
+
+JS_QUERY_RULES = """
+    function queryRules(rules, groupSize) {
+        let cookie_notices = [];
+        let invalid_rules = [];
+
+        function queryRuleGroup(rules) {
+            let elements;
+            try {
+                elements = document.querySelectorAll(rules.join(', '));
+            } catch (e) {
+                if (rules.length == 1) {
+                    invalid_rules.push(rules[0]);
+                } else {
+                    let middle = Math.floor(rules.length / 2);
+                    queryRuleGroup(rules.slice(0, middle));
+                    queryRuleGroup(rules.slice(middle));
+                }
+                return;
+            }
+            elements.forEach(function(element) {
+                cookie_notices.push(element);
+            });
+        }
+
+        for (var i = 0; i < rules.length; i += groupSize) {
+            queryRuleGroup(rules.slice(i, i + groupSize));
+        }
+
+        return {
+            'cookie_notices': cookie_notices,
+            'invalid_rules': invalid_rules,
+        };
+    }"""
+
+JS_GET_PAGE_TOKENS = """
+    function getPageTokens() {
+        let tokens = new Set();
+        document.querySelectorAll('[id], [class]').forEach(function(element) {
+            let id = element.getAttribute('id');
+            if (id) {
+                tokens.add('#' + id.toLowerCase());
+            }
+            element.classList.forEach(function(className) {
+                tokens.add('.' + className.toLowerCase());
+            });
+        });
+        return Array.from(tokens);
+    }"""
+
+JS_IS_PAGE_MODAL = """
+    function isPageModal(cookieNotice) {
+        let margin = 5;
+
+        let viewportWidth = document.documentElement.clientWidth;
+        let viewportHeight = document.documentElement.clientHeight;
+        let viewportHorizontalCenter = viewportWidth / 2;
+        let viewportVerticalCenter = viewportHeight / 2;
+
+        let testPositions = [
+            {'x': margin, 'y': margin},
+            {'x': margin, 'y': viewportVerticalCenter},
+            {'x': margin, 'y': viewportHeight - margin},
+            {'x': viewportVerticalCenter, 'y': margin},
+            {'x': viewportVerticalCenter, 'y': viewportHeight - margin},
+            {'x': viewportWidth - margin, 'y': margin},
+            {'x': viewportWidth - margin, 'y': viewportVerticalCenter},
+            {'x': viewportWidth - margin, 'y': viewportHeight - margin},
+        ];
+
+        if (cookieNotice) {
+            if (cookieNotice.width == 'full') {
+                cookieNotice.width = viewportWidth;
+            }
+            if (cookieNotice.height == 'full') {
+                cookieNotice.height = viewportHeight;
+            }
+            for (var i = 0; i < testPositions.length; i++) {
+                let testPosition = testPositions[i];
+                if ((testPosition.x >= cookieNotice.x && testPosition.x <= (cookieNotice.x + cookieNotice.width)) &&
+                        (testPosition.y >= cookieNotice.y && testPosition.y <= (cookieNotice.y + cookieNotice.height))) {
+                    let index = testPositions.indexOf(testPosition);
+                    testPositions.splice(index, 1);
+                }
+            }
+        }
+
+        let previousContainer = document.elementFromPoint(testPositions[0].x, testPositions[0].y);
+        for (var i = 1; i < testPositions.length; i++) {
+            let testPosition = testPositions[i];
+            let testContainer = document.elementFromPoint(testPosition.x, testPosition.y);
+            if (previousContainer !== testContainer) {
+                return false;
+            }
+            previousContainer = testContainer;
+        }
+        return true;
+    }"""
+
+
+JS_DETECT_COOKIE_NOTICES = """
+    function detectCookieNotices(config) {
+        // the owners of child frames that contain text but no fixed element,
+        // they are passed as additional arguments
+        let frameOwners = Array.prototype.slice.call(arguments, 1);
+
+        // elements of the result are referenced by their index, their node
+        // ids are requested afterwards
+        let elements = [];
+        let elementIndexes = new Map();
+        let noticeIndexes = new Map();
+
+        // the page is not changed during the detection, therefore the
+        // visibility of every element only needs to be checked once
+        let visibilityCache = new Map();
+        let result = {
+            'techniques': {},
+            'notices': [],
+            'invalid_rules': {},
+            'frame_owner_is_fixed_parent': false,
+            'warnings': [],
+        };
+
+        function tryCall(method, f, fallback) {
+            try {
+                return f();
+            } catch (e) {
+                result.warnings.push({
+                    'message': String(e),
+                    'exception': e.name,
+                    'method': method,
+                });
+                return fallback;
+            }
+        }
+
+        function getElementIndex(elem) {
+            if (!elementIndexes.has(elem)) {
+                elementIndexes.set(elem, elements.length);
+                elements.push(elem);
+            }
+            return elementIndexes.get(elem);
+        }
+
+        function unique(elems) {
+            return Array.from(new Set(elems)).filter(function(elem) { return elem; });
+        }
+
+        function filterVisible(elems) {
+            return elems.filter(function(elem) {
+                return tryCall('isVisible', function() { return isVisible(elem, visibilityCache); }, false);
+            });
+        }
+
+        function getClickable(elem) {
+            let clickable = tryCall('getPropertiesOfClickable', function() {
+                let clickable = getPropertiesOfClickable(elem, config.max_property_length);
+                clickable['is_visible'] = Boolean(isVisible(elem, visibilityCache));
+                return clickable;
+            }, {});
+            clickable['element'] = getElementIndex(elem);
+            return clickable;
+        }
+
+        function getNoticeIndex(elem) {
+            if (noticeIndexes.has(elem)) {
+                return noticeIndexes.get(elem);
+            }
+
+            let notice = tryCall('getCookieNoticeProperties', function() {
+                let foundClickables = findClickablesInElement(elem, config.max_clickables);
+                let clickables = foundClickables.clickables.map(getClickable);
+                let notice = getCookieNoticeProperties(elem, config.max_property_length, config.max_combination_size, config.max_combination_queries);
+                notice['clickables'] = clickables;
+                if (foundClickables.is_truncated) {
+                    notice['truncated_properties'].push('clickables');
+                }
+
+                // the modality is checked for the root frame, this is done
+                // afterwards for notices in child frames
+                if (config.is_root_frame) {
+                    notice['is_page_modal'] = isPageModal({
+                        'x': notice['x'],
+                        'y': notice['y'],
+                        'width': notice['width'],
+                        'height': notice['height'],
+                    });
+                }
+                return notice;
+            }, {'clickables': []});
+            notice['element'] = getElementIndex(elem);
+
+            // the visible element is highlighted on screenshots
+            let visibleElem = tryCall('isVisible', function() { return isVisible(elem, visibilityCache); }, false);
+            notice['visible_element'] = visibleElem ? getElementIndex(visibleElem) : null;
+
+            noticeIndexes.set(elem, result.notices.length);
+            result.notices.push(notice);
+            return noticeIndexes.get(elem);
+        }
+
+        function addCookieNotices(detectionTechnique, elems) {
+            result.techniques[detectionTechnique] = elems.map(getNoticeIndex);
+        }
+
+        // find cookie notice by using AdblockPlus rules
+        for (let filterName in config.rules) {
+            let queryResult = queryRules(config.rules[filterName], config.group_size);
+            result.invalid_rules[filterName] = queryResult.invalid_rules;
+            addCookieNotices(filterName, filterVisible(unique(queryResult.cookie_notices)));
+        }
+
+        // find the search strings in nodes and take the closest parent block element
+        let cookieElems = filterVisible(searchForStrings(config.search_strings));
+        cookieElems = unique(cookieElems.map(function(elem) {
+            return tryCall('findClosestBlockElement', function() { return findClosestBlockElement(elem); }, null);
+        }));
+
+        // find fixed parent elements, if there is none the frame might be
+        // the fixed element in its parent frame
+        let fixedElems = frameOwners.slice();
+        cookieElems.forEach(function(elem) {
+            let fixedElem = tryCall('findFixedParent', function() { return findFixedParent(elem); }, null);
+            if (fixedElem === document.documentElement) {
+                result.frame_owner_is_fixed_parent = !config.is_root_frame;
+            } else if (fixedElem) {
+                fixedElems.push(fixedElem);
+            }
+        });
+        addCookieNotices('fixed_parent', filterVisible(unique(fixedElems)));
+
+        // find full-width parent elements
+        let fullWidthElems = cookieElems.map(function(elem) {
+            return tryCall('findFullWidthParent', function() { return findFullWidthParent(elem); }, false);
+        });
+        addCookieNotices('full_width_parent', filterVisible(unique(fullWidthElems)));
+
+        return [JSON.stringify(result)].concat(elements);
+    }"""
+
+# The library is installed once per document (see `_setup_tab`) and holds
+# all functions of the scanner, they are called via `JS_LIBRARY_CALL`.
+JS_LIBRARY = """
+    (function() {
+        if (window.""" + JS_LIBRARY_NAME + """) {
+            return;
+        }
+        """ + JS_TRUNCATE_STRING + """
+        """ + JS_IS_VISIBLE + """
+        """ + JS_ARE_VISIBLE + """
+        """ + JS_FIND_CLOSEST_BLOCK_ELEMENT + """
+        """ + JS_FIND_FIXED_PARENT + """
+        """ + JS_FIND_FULL_WIDTH_PARENT + """
+        """ + JS_FIND_CLICKABLES_IN_ELEMENT + """
+        """ + JS_GET_PROPERTIES_OF_CLICKABLE + """
+        """ + JS_GET_COOKIE_NOTICE_PROPERTIES + """
+        """ + JS_CLICK_NODE + """
+        """ + JS_IS_PAGE_MODAL + """
+        """ + JS_SEARCH_FOR_STRINGS + """
+        """ + JS_GET_LANGUAGE_SAMPLE + """
+        """ + JS_QUERY_RULES + """
+        """ + JS_GET_PAGE_TOKENS + """
+        """ + JS_DETECT_COOKIE_NOTICES + """
+
+        // the library cannot be changed or removed by the page
+        Object.defineProperty(window, '""" + JS_LIBRARY_NAME + """', {
+            'value': Object.freeze({
+                'isVisible': isVisible,
+                'areVisible': areVisible,
+                'findClosestBlockElement': findClosestBlockElement,
+                'findFixedParent': findFixedParent,
+                'findFullWidthParent': findFullWidthParent,
+                'findClickablesInElement': findClickablesInElement,
+                'getPropertiesOfClickable': getPropertiesOfClickable,
+                'getCookieNoticeProperties': getCookieNoticeProperties,
+                'clickNode': clickNode,
+                'isPageModal': isPageModal,
+                'searchForStrings': searchForStrings,
+                'getLanguageSample': getLanguageSample,
+                'queryRules': queryRules,
+                'getPageTokens': getPageTokens,
+                'detectCookieNotices': detectCookieNotices,
+            }),
+        });
+    })();"""
+
+# the name of the binding that is called when the DOM changes
+JS_MUTATION_BINDING_NAME = '__cookieNoticeScannerMutation'
+
+# Reports changes of the DOM to the scanner (see `_wait_for_settle`), the
+# binding is called at most every 50 milliseconds.
+JS_OBSERVE_MUTATIONS = """
+    (function() {
+        const binding = window['""" + JS_MUTATION_BINDING_NAME + """'];
+        if (typeof binding !== 'function') {
+            return;
+        }
+        let lastReport = 0;
+        new MutationObserver(function() {
+            let now = performance.now();
+            if (now - lastReport >= 50) {
+                lastReport = now;
+                binding('');
+            }
+        }).observe(document, {'subtree': true, 'childList': true, 'attributes': true, 'characterData': true});
+    })();"""
+
+# Calls the library function with the name given as first argument,
+# the other arguments are passed to the library function.
+JS_LIBRARY_CALL = """
+    function(name) {
+        if (!window.""" + JS_LIBRARY_NAME + """) {
+            throw new Error('""" + JS_LIBRARY_MISSING + """');
+        }
+        return window.""" + JS_LIBRARY_NAME + """[name].apply(this, Array.prototype.slice.call(arguments, 1));
+    }"""
+
+
 class WebpageScanner:
-    def __init__(self, tab, abp_filters, webpage):
+    _snapshot_executor_lock = threading.Lock()
+    _snapshot_executor = None
+
+    def __init__(self, tab, abp_filters, webpage, prefilter_rules=False, detection_engine=DETECTION_ENGINE_CDP,
+                 max_property_length=MAX_PROPERTY_LENGTH, search_keywords=SEARCH_KEYWORDS,
+                 max_combination_size=MAX_COMBINATION_SIZE, max_combination_queries=MAX_COMBINATION_QUERIES,
+                 max_clickables=MAX_CLICKABLES, language_detector=None, settle_timeout=SETTLE_TIMEOUT,
+                 settle_quiet_time=SETTLE_QUIET_TIME, blocked_resources=(), large_image_size=LARGE_IMAGE_SIZE,
+                 response_store=None, response_store_mode=RESPONSE_STORE_RECORD, save_dom_snapshot=False):
         self.tab = tab
         self.abp_filters = abp_filters
         self.webpage = webpage
+        self.prefilter_rules = prefilter_rules
+        self.detection_engine = detection_engine
+        self.max_property_length = max_property_length
+        self.search_keywords = [search_keyword.lower() for search_keyword in search_keywords]
+        self.max_combination_size = max_combination_size
+        self.max_combination_queries = max_combination_queries
+        self.max_clickables = max_clickables
+        self.language_detector = language_detector or LanguageDetector()
+        self.settle_timeout = settle_timeout
+        self.settle_quiet_time = settle_quiet_time
+        self.large_image_size = large_image_size
+        self.save_dom_snapshot = save_dom_snapshot
         self.result = WebpageResult(webpage)
+        for abp_filter in abp_filters.values():
+            for warning in abp_filter.warnings:
+                self.result.add_warning(warning)
         self.click_result = ClickResult()
         self.loaded_urls = []
-
-    def scan(self, take_screenshots=True, click=None):
+        self.node_fact_cache = NodeFactCache()
+        self._language_future = None
+
+        # the execution contexts of the isolated world by frame id, they are
+        # reused until they are destroyed (see `_get_isolated_context_id`)
+        self._isolated_context_ids = {}
+        self._isolated_context_ids_lock = threading.Lock()
+
+        # requests of the blocked resource types are aborted before they are
+        # sent, images are only checked for their size if they are not all
+        # blocked (see `_event_request_paused`)
+        self.blocked_resource_types = {
+                BLOCKABLE_RESOURCE_CLASSES.get(blocked_resource)
+                for blocked_resource in blocked_resources
+                if blocked_resource != RESOURCE_CLASS_LARGE_IMAGE
+            }
+        self.block_large_images = RESOURCE_CLASS_LARGE_IMAGE in blocked_resources and 'Image' not in self.blocked_resource_types
+
+        # the responses of the page are added to the response store or the
+        # requests are served from it (see `_event_request_paused`)
+        self.response_store = response_store
+        self.is_recording_responses = response_store is not None and response_store_mode == RESPONSE_STORE_RECORD
+        self.is_replaying_responses = response_store is not None and response_store_mode in [RESPONSE_STORE_REPLAY, RESPONSE_STORE_REPLAY_ONLY]
+        self.is_replaying_responses_only = response_store is not None and response_store_mode == RESPONSE_STORE_REPLAY_ONLY
+
+        # the event callbacks change the state of the page while holding
+        # this condition and notify the waits (see `_wait_for`)
+        self._page_state_changed = threading.Condition()
+        self.cancelled = False
+
+    def scan(self, take_screenshots=True, click=None, clear_browser=True, on_navigation_committed=None):
+        """Scans the page.
+
+        The browser is cleared before the navigation and after the scan
+        unless `clear_browser` is false. If `on_navigation_committed` is given, it is called when the
+        navigation committed and the scan is cancelled if it returns false.
+        """
         self._setup()
         
         try:
             # open url and wait for load event and js
-            self._navigate_and_wait()
+            self._navigate_and_wait(clear_browser, on_navigation_committed)
             if self.result.failed:
                 return self.result
 
             # get root node of document, is needed to be sure that the DOM is loaded
             self.root_node = self.tab.DOM.getDocument().get('root')
+            self.node_fact_cache.add_nodes(None, [self.root_node])
 
             # store html of page
             self.result.set_html(self._get_html_of_node(self.root_node.get('nodeId')))
 
-            # detect language and cookie notices
-            self.detect_language()
+            # detect language and cookie notices, the language is not needed
+            # for clicks
+            if click is None:
+                self.detect_language()
             self.detect_cookie_notices(take_screenshots=take_screenshots)
 
             # get all cookies
@@ -352,16 +3799,34 @@ class WebpageScanner:
             # do the click if necessary
             self.do_click(click)
         except Exception as e:
+            if self.cancelled:
+                return self.result
             self.result.set_failed(str(e), type(e).__name__, traceback.format_exc())
 
+        # the bodies of the recorded responses are fetched once the scan is
+        # done, while the tab is still open
+        if self.is_recording_responses and not self.cancelled:
+            self._record_finished_responses()
+
+        # a page that is only partly in the archive is not replayed as it was
+        # recorded
+        if self.is_replaying_responses_only and len(self.result.unreplayed_requests) > 0:
+            self.result.add_warning({
+                    'message': f'{len(self.result.unreplayed_requests)} requests are not in the archive and failed',
+                    'exception': 'NotArchived',
+                    'method': '_event_request_paused',
+                })
+        self.click_result.set_unreplayed_requests(self.result.unreplayed_requests)
+
+        self.result.set_node_fact_cache_statistics(self.node_fact_cache.get_statistics())
+
         # stop the browser from executing javascript
         self.tab.Emulation.setScriptExecutionDisabled(value=True)
-        self.tab.wait(0.1)
 
         try:
             # clear the browser
-            self._clear_browser()
-            self.tab.wait(0.1)
+            if clear_browser:
+                self._clear_browser()
         except Exception as e:
             print(type(e).__name__)
             print(traceback.format_exc())
@@ -370,7 +3835,20 @@ class WebpageScanner:
         # stop the tab
         self.tab.stop()
 
+    def cancel(self):
+        """Cancels the scan from another thread, calls to the tab are aborted."""
+        with self._page_state_changed:
+            self.cancelled = True
+            self.result.set_failed(FAILED_REASON_CANCELLED)
+            self._page_state_changed.notify_all()
+        try:
+            self.tab.stop()
+        except pychrome.exceptions.RuntimeException:
+            # the tab was not started yet
+            pass
+
     def get_result(self):
+        self._resolve_language()
         return self.result
 
     def get_click_result(self):
@@ -393,54 +3871,157 @@ class WebpageScanner:
         self.requestId = None
         self.frameId = None
 
+        # the requests in flight and the time of the last network activity
+        # and DOM change, they tell whether the page settled
+        self._requests_in_flight = set()
+        self._last_network_activity = time.monotonic()
+        self._last_mutation = time.monotonic()
+
+        # the indices of the requests in `result.requests` by their id, to
+        # flag requests that are blocked after they were sent
+        self._request_indices = {}
+
+        # the urls, responses and full response headers of the recorded GET
+        # requests by their id until they finished loading, then their bodies
+        # are fetched by the scan (see `_record_finished_responses`)
+        self._recorded_requests = {}
+        self._recorded_responses = {}
+        self._recorded_response_headers = {}
+        self._finished_recorded_responses = collections.deque()
+
         # setup the tab
         self._setup_tab()
-        self.tab.wait(0.1)
 
         # deny permissions because they might pop-up and block detection
         #self._deny_permissions() # problems with ubuntu
 
     def _setup_tab(self):
         # set callbacks for request and response logging
-        self.tab.Network.requestWillBeSent = self._event_request_will_be_sent
-        self.tab.Network.responseReceived = self._event_response_received
-        self.tab.Network.loadingFailed = self._event_loading_failed
-        self.tab.Page.loadEventFired = self._event_load_event_fired
-        self.tab.Page.frameRequestedNavigation = self._event_frame_requested_navigation
-        self.tab.Page.frameStartedLoading = self._event_frame_started_loading
-        self.tab.Page.navigatedWithinDocument = self._event_navigated_within_document
-        self.tab.Page.windowOpen = self._event_window_open
-        self.tab.Page.javascriptDialogOpening = self._event_javascript_dialog_opening
+        self.tab.Network.requestWillBeSent = self._record_errors(self._event_request_will_be_sent)
+        self.tab.Network.responseReceived = self._record_errors(self._event_response_received)
+        self.tab.Network.loadingFinished = self._record_errors(self._event_loading_finished)
+        self.tab.Network.loadingFailed = self._record_errors(self._event_loading_failed)
+        self.tab.Page.loadEventFired = self._record_errors(self._event_load_event_fired)
+        self.tab.Page.frameRequestedNavigation = self._record_errors(self._event_frame_requested_navigation)
+        self.tab.Page.frameStartedLoading = self._record_errors(self._event_frame_started_loading)
+        self.tab.Page.navigatedWithinDocument = self._record_errors(self._event_navigated_within_document)
+        self.tab.Page.windowOpen = self._record_errors(self._event_window_open)
+        self.tab.Page.javascriptDialogOpening = self._record_errors(self._event_javascript_dialog_opening)
+        self.tab.Fetch.requestPaused = self._record_errors(self._event_request_paused)
+        if self.is_recording_responses:
+            self.tab.Network.responseReceivedExtraInfo = self._record_errors(self._event_response_received_extra_info)
+
+        # set callbacks to invalidate the cached facts about nodes
+        self.tab.DOM.documentUpdated = self._record_errors(self._event_document_updated)
+        self.tab.DOM.setChildNodes = self._record_errors(self._event_set_child_nodes)
+        self.tab.DOM.childNodeRemoved = self._record_errors(self._event_child_node_removed)
+        self.tab.DOM.childNodeInserted = self._record_errors(self._event_child_node_inserted)
+        self.tab.DOM.attributeModified = self._record_errors(self._event_attribute_modified)
+        self.tab.DOM.attributeRemoved = self._record_errors(self._event_attribute_modified)
+        self.tab.Runtime.executionContextCreated = self._record_errors(self._event_execution_context_created)
+        self.tab.Runtime.executionContextDestroyed = self._record_errors(self._event_execution_context_destroyed)
+        self.tab.Runtime.executionContextsCleared = self._record_errors(self._event_execution_contexts_cleared)
+
+        # set callback to know when the DOM changed for the last time
+        self.tab.Runtime.bindingCalled = self._record_errors(self._event_binding_called)
         
         # start our tab after callbacks have been registered
         self.tab.start()
         
+        # the calls of the setup do not depend on each other's results, they
+        # are sent at once if the tab supports it (see `_call_methods`)
+        setup_calls = []
+
         # enable network notifications for all request/response so our
         # callbacks actually receive some data
-        self.tab.Network.enable()
+        if self.is_recording_responses:
+            setup_calls.append(('Network.enable', {
+                    'maxTotalBufferSize': RESPONSE_STORE_BROWSER_BUFFER_SIZE,
+                    'maxResourceBufferSize': RESPONSE_STORE_BROWSER_RESOURCE_BUFFER_SIZE,
+                }))
+        else:
+            setup_calls.append(('Network.enable', {}))
+
+        # intercept the requests of blocked resource types (or all requests if
+        # they are served from the response store) and the responses of images
+        # whose size needs to be checked
+        fetch_patterns = [
+                {'resourceType': resource_type, 'requestStage': 'Request'}
+                for resource_type in sorted(self.blocked_resource_types)
+            ]
+        if self.is_replaying_responses:
+            fetch_patterns = [{'urlPattern': '*', 'requestStage': 'Request'}]
+        if self.block_large_images:
+            fetch_patterns.append({'resourceType': 'Image', 'requestStage': 'Response'})
+        if len(fetch_patterns) > 0:
+            setup_calls.append(('Fetch.enable', {'patterns': fetch_patterns}))
 
         # enable page domain notifications so our load_event_fired
         # callback is called when the page is loaded
-        self.tab.Page.enable()
+        setup_calls.append(('Page.enable', {}))
+
+        # install the JavaScript library of the scanner once in every new
+        # document, it only exists in an isolated world, so that the page can
+        # neither see nor change it
+        setup_calls.append(('Page.addScriptToEvaluateOnNewDocument', {'source': JS_LIBRARY, 'worldName': ISOLATED_WORLD_NAME}))
 
         # enable DOM, Runtime and Overlay
-        self.tab.DOM.enable()
-        self.tab.Runtime.enable()
-        self.tab.Overlay.enable()
+        setup_calls.append(('DOM.enable', {}))
+        setup_calls.append(('Runtime.enable', {}))
+        setup_calls.append(('Overlay.enable', {}))
+
+        # report changes of the DOM in every new document
+        setup_calls.append(('Runtime.addBinding', {'name': JS_MUTATION_BINDING_NAME, 'executionContextName': ISOLATED_WORLD_NAME}))
+        setup_calls.append(('Page.addScriptToEvaluateOnNewDocument', {'source': JS_OBSERVE_MUTATIONS, 'worldName': ISOLATED_WORLD_NAME}))
 
-    def _navigate_and_wait(self):
+        self._call_methods(setup_calls)
+
+    def _record_errors(self, event_callback):
+        """Returns the event callback, its exceptions are added as warnings to
+        the result instead of being lost in the thread of the tab."""
+        def callback(**kwargs):
+            try:
+                event_callback(**kwargs)
+            except Exception as e:
+                self.result.add_warning({
+                    'message': str(e),
+                    'exception': type(e).__name__,
+                    'traceback': traceback.format_exc().splitlines(),
+                    'method': event_callback.__name__,
+                })
+        return callback
+
+    def _call_methods(self, calls):
+        """Calls the methods, a list of methods and their parameters, in order
+        and returns their results. A `CdpTab` sends them without waiting for
+        the previous ones, the browser still runs them in order."""
+        if isinstance(self.tab, CdpTab):
+            return self.tab.call_methods(calls)
+        return [self.tab.call_method(method, **params) for method, params in calls]
+
+    def _navigate_and_wait(self, clear_browser=True, on_navigation_committed=None):
         try:
             # open url
-            self._clear_browser()
+            if clear_browser:
+                self._clear_browser()
             #self.tab.Page.bringToFront()
-            self.tab.Page.navigate(url=self.webpage.url, _timeout=15)
+            if self.cancelled:
+                return
+            navigation = self.tab.Page.navigate(url=self.webpage.url, _timeout=15)
+            if 'errorText' in navigation and not self.result.failed:
+                self.result.set_failed(FAILED_REASON_LOADING, navigation.get('errorText'))
 
             # return if failed to load page
             if self.result.failed:
                 return
 
-            # we wait for load event and JavaScript
-            self._wait_for_load_event_and_js()
+            # stop if another scan committed its navigation first
+            if on_navigation_committed is not None and not on_navigation_committed():
+                self.cancel()
+                return
+
+            # we wait for load event and until the page settled
+            self._wait_for_load_event_and_settle()
         except pychrome.exceptions.TimeoutException as e:
             self.result.set_failed(FAILED_REASON_TIMEOUT, type(e).__name__)
 
@@ -476,23 +4057,54 @@ class WebpageScanner:
         permission_descriptor = {'name': permission}
         self.tab.Browser.setPermission(permission=permission_descriptor, setting=value)
 
-    def _wait_for_load_event_and_js(self, load_event_timeout=30, js_timeout=5):
+    def _wait_for_load_event_and_settle(self, load_event_timeout=30):
         self._wait_for_load_event(load_event_timeout)
 
         # wait for JavaScript code to be run, after the page has been loaded
-        self.tab.wait(js_timeout)
+        self._wait_for_settle()
+
+    def _wait_for_settle(self):
+        """Waits until no requests are in flight and the DOM did not change
+        for `settle_quiet_time` seconds, but at most `settle_timeout` seconds."""
+        start = time.monotonic()
+        is_quiet = self._wait_for(self._is_page_quiet, self.settle_timeout)
+        self.result.set_settled(round(time.monotonic() - start, 3), SETTLE_REASON_QUIET if is_quiet else SETTLE_REASON_TIMEOUT)
+
+    def _is_page_quiet(self):
+        """Returns whether the page is quiet or else the time when it can be
+        quiet at the earliest, `None` while requests are in flight."""
+        if len(self._requests_in_flight) > 0:
+            return None
+        quiet_time = max(self._last_network_activity, self._last_mutation) + self.settle_quiet_time
+        return True if time.monotonic() >= quiet_time else quiet_time
 
     def _wait_for_load_event(self, load_event_timeout):
         # we wait for the load event to be fired (see `_event_load_event_fired`)
-        waited = 0
-        while not self._is_loaded and waited < load_event_timeout:
-            self.tab.wait(0.1)
-            waited += 0.1
-
-        if waited >= load_event_timeout:
+        if not self._wait_for(lambda: self._is_loaded, load_event_timeout):
             self.result.set_stopped_waiting('load event')
             self.tab.Page.stopLoading()
 
+    def _wait_for(self, condition, timeout):
+        """Waits until the condition is true, but at most `timeout` seconds,
+        and returns whether it is true.
+
+        The condition is checked whenever an event callback changed the state
+        of the page. It can also return the time (of `time.monotonic`) when
+        it needs to be checked again without an event.
+        """
+        deadline = time.monotonic() + timeout
+        with self._page_state_changed:
+            while not self.cancelled:
+                result = condition()
+                if result is True:
+                    return True
+                now = time.monotonic()
+                if now >= deadline:
+                    return False
+                wake_up = min(deadline, result) if isinstance(result, float) else deadline
+                self._page_state_changed.wait(wake_up - now)
+            return False
+
 
     ############################################################################
     # EVENTS
@@ -502,13 +4114,31 @@ class WebpageScanner:
         """Will be called when a request is about to be sent.
 
         Those requests can still be blocked or intercepted and modified.
-        This example script does not use any blocking or intercepting.
+        Requests of the blocked resource types are flagged as blocked (see
+        `_event_request_paused`).
 
         Note: It does not say anything about the request being successful,
         there can still be connection issues.
         """
         url = request['url']
-        self.result.add_request(request_url=url)
+        self._request_indices[requestId] = len(self.result.requests)
+        self.result.add_request(request_url=url, blocked=kwargs.get('type') in self.blocked_resource_types)
+
+        if self.is_recording_responses:
+            # a redirect is stored without body if the redirected request is a
+            # recorded GET request, the request keeps its id
+            redirect_response = kwargs.get('redirectResponse')
+            if redirect_response is not None and requestId in self._recorded_requests:
+                self.response_store.add('GET', self._recorded_requests.pop(requestId), redirect_response.get('status'),
+                                        self._get_header_list(redirect_response.get('headers')), b'')
+            if request.get('method') == 'GET':
+                self._recorded_requests[requestId] = url
+
+        if kwargs.get('type') not in SETTLE_IGNORED_RESOURCE_TYPES:
+            with self._page_state_changed:
+                self._requests_in_flight.add(requestId)
+                self._last_network_activity = time.monotonic()
+                self._page_state_changed.notify_all()
 
         # the request id of the first request is stored to be able to detect failures
         if self.requestId == None:
@@ -534,14 +4164,145 @@ class WebpageScanner:
         if requestId == self.requestId and (str(status).startswith('4') or str(status).startswith('5')):
             self.result.set_failed(FAILED_REASON_STATUS_CODE, str(status))
 
+        if requestId in self._recorded_requests:
+            self._recorded_responses[requestId] = (self._recorded_requests.pop(requestId), status, headers, mime_type)
+
+    def _event_response_received_extra_info(self, requestId, headers, **kwargs):
+        """Will be called with the raw response headers, which include the
+        cookies, if the responses are recorded."""
+        self._recorded_response_headers[requestId] = headers
+
+    def _event_loading_finished(self, requestId, **kwargs):
+        # the body is fetched later, the events of the other requests would
+        # wait for it otherwise
+        if requestId in self._recorded_responses:
+            self._finished_recorded_responses.append((requestId, self._recorded_responses.pop(requestId)))
+
+        with self._page_state_changed:
+            self._requests_in_flight.discard(requestId)
+            self._last_network_activity = time.monotonic()
+            self._page_state_changed.notify_all()
+
     def _event_loading_failed(self, requestId, errorText, **kwargs):
+        with self._page_state_changed:
+            self._requests_in_flight.discard(requestId)
+            self._last_network_activity = time.monotonic()
+            self._page_state_changed.notify_all()
+
         if requestId == self.requestId:
             self.result.set_failed(FAILED_REASON_LOADING, errorText)
 
+    def _event_request_paused(self, requestId, resourceType, request=None, responseHeaders=None, networkId=None, **kwargs):
+        """Will be called when an intercepted request is paused.
+
+        Requests of the blocked resource types are paused before they are
+        sent and aborted. If the responses are replayed, the stored response
+        is served instead of sending the request, other requests fail if
+        only the stored responses are replayed. Images are paused when
+        their response headers are received and aborted if they are larger
+        than `large_image_size`.
+        """
+        if responseHeaders is None:
+            if resourceType in self.blocked_resource_types:
+                self.tab.Fetch.failRequest(requestId=requestId, errorReason='BlockedByClient')
+            elif not self.is_replaying_responses or not self._replay_response(requestId, request):
+                # the requests that are not stored are listed in the result,
+                # the page is only partly replayed
+                if self.is_replaying_responses and request is not None:
+                    self.result.add_unreplayed_request(request.get('method'), request.get('url'))
+                if self.is_replaying_responses_only:
+                    self.tab.Fetch.failRequest(requestId=requestId, errorReason='InternetDisconnected')
+                else:
+                    self.tab.Fetch.continueRequest(requestId=requestId)
+            return
+
+        content_length = next((
+                _parse_int(header.get('value'))
+                for header in responseHeaders
+                if header.get('name', '').lower() == 'content-length'
+            ), 0)
+        if content_length > self.large_image_size:
+            self.tab.Fetch.failRequest(requestId=requestId, errorReason='BlockedByClient')
+            if networkId in self._request_indices:
+                self.result.set_request_blocked(self._request_indices.get(networkId))
+        else:
+            self.tab.Fetch.continueRequest(requestId=requestId)
+
+    def _record_finished_responses(self):
+        """Adds the responses that finished loading with their bodies to the
+        response store."""
+        while len(self._finished_recorded_responses) > 0:
+            request_id, (url, status, headers, mime_type) = self._finished_recorded_responses.popleft()
+            self._record_response(request_id, url, status, headers, mime_type)
+
+    def _record_response(self, request_id, url, status, headers, mime_type):
+        headers = self._recorded_response_headers.pop(request_id, headers)
+        try:
+            response_body = self.tab.Network.getResponseBody(requestId=request_id)
+        except pychrome.exceptions.PyChromeException:
+            # the body is not available, e.g. the page navigated away
+            return
+        header_list = self._get_header_list(headers)
+        if response_body.get('base64Encoded'):
+            body = base64.b64decode(response_body.get('body'))
+        else:
+            # text bodies are decoded by the browser and stored as utf-8
+            body = response_body.get('body').encode('utf8')
+            self._set_utf8_charset(header_list, mime_type)
+        self.response_store.add('GET', url, status, header_list, body)
+
+    def _set_utf8_charset(self, header_list, mime_type):
+        """Sets the charset of the content type in the list of headers to
+        utf-8, the content type is added with the mime type of the response if
+        the headers do not have one."""
+        content_types = [header for header in header_list if header.get('name').lower() == 'content-type']
+        if len(content_types) == 0:
+            if not mime_type:
+                return
+            content_types = [{'name': 'Content-Type', 'value': mime_type}]
+            header_list.extend(content_types)
+        for content_type in content_types:
+            parameters = [parameter.strip() for parameter in content_type.get('value').split(';')]
+            parameters = parameters[:1] + [
+                    parameter
+                    for parameter in parameters[1:]
+                    if parameter and parameter.split('=')[0].strip().lower() != 'charset'
+                ]
+            content_type['value'] = '; '.join(parameters + ['charset=utf-8'])
+
+    def _replay_response(self, request_id, request):
+        """Serves the stored response to the paused GET request and returns
+        whether it was stored."""
+        if request is None or request.get('method') != 'GET':
+            return False
+        stored_response = self.response_store.get('GET', request.get('url'))
+        if stored_response is None:
+            return False
+
+        status, headers, body = stored_response
+        self.tab.Fetch.fulfillRequest(requestId=request_id, responseCode=status, body=base64.b64encode(body).decode('ascii'),
+                                      responseHeaders=[
+                                          header for header in headers
+                                          if header.get('name').lower() not in RESPONSE_STORE_EXCLUDED_HEADERS
+                                      ])
+        return True
+
+    def _get_header_list(self, headers):
+        """Returns the headers as a list of names and values, the values of
+        repeated headers (e.g. `Set-Cookie`) are separated by newlines."""
+        return [
+                {'name': name, 'value': value}
+                for name, values in (headers or {}).items()
+                if not name.startswith(':')
+                for value in str(values).split('\n')
+            ]
+
     def _event_frame_started_loading(self, frameId, **kwargs):
         if self.recordNewPagesForClick and frameId == self.frameId:
-            self._is_loaded = False
-            self.waitForNavigatedEvent = True
+            with self._page_state_changed:
+                self._is_loaded = False
+                self.waitForNavigatedEvent = True
+                self._page_state_changed.notify_all()
 
     def _event_frame_requested_navigation(self, url, frameId, **kwargs):
         is_root_frame = (self.frameId == frameId)
@@ -565,8 +4326,55 @@ class WebpageScanner:
         Note that this only means that all resources are loaded, the
         page may still process some JavaScript.
         """
-        self._is_loaded = True
-        self.recordRedirects = False
+        with self._page_state_changed:
+            self._is_loaded = True
+            self.recordRedirects = False
+            self._page_state_changed.notify_all()
+
+    def _event_document_updated(self, **kwargs):
+        # all node ids are invalid
+        self.node_fact_cache.clear()
+
+    def _event_set_child_nodes(self, parentId, nodes, **kwargs):
+        self.node_fact_cache.add_nodes(parentId, nodes)
+
+    def _event_child_node_removed(self, parentNodeId, nodeId, **kwargs):
+        self.node_fact_cache.invalidate_node(nodeId, parentNodeId)
+
+    def _event_child_node_inserted(self, parentNodeId, node, **kwargs):
+        self.node_fact_cache.add_nodes(parentNodeId, [node])
+        self.node_fact_cache.invalidate_layout()
+
+    def _event_attribute_modified(self, nodeId, **kwargs):
+        self.node_fact_cache.invalidate_layout()
+
+    def _event_execution_context_created(self, context, **kwargs):
+        # the isolated worlds of new documents are created by the browser
+        # (see `_setup_tab`)
+        frame_id = context.get('auxData', {}).get('frameId')
+        if context.get('name') == ISOLATED_WORLD_NAME and frame_id is not None:
+            with self._isolated_context_ids_lock:
+                self._isolated_context_ids.setdefault(frame_id, context.get('id'))
+
+    def _event_execution_context_destroyed(self, executionContextId, **kwargs):
+        with self._isolated_context_ids_lock:
+            for frame_id, context_id in list(self._isolated_context_ids.items()):
+                if context_id == executionContextId:
+                    del self._isolated_context_ids[frame_id]
+
+        # the remote objects of the context cannot be used anymore
+        self.node_fact_cache.invalidate_fact('remote_object_id')
+
+    def _event_execution_contexts_cleared(self, **kwargs):
+        with self._isolated_context_ids_lock:
+            self._isolated_context_ids = {}
+        self.node_fact_cache.invalidate_fact('remote_object_id')
+
+    def _event_binding_called(self, name, **kwargs):
+        if name == JS_MUTATION_BINDING_NAME:
+            with self._page_state_changed:
+                self._last_mutation = time.monotonic()
+                self._page_state_changed.notify_all()
 
     def _event_javascript_dialog_opening(self, message, type, **kwargs):
         if type == 'alert':
@@ -594,7 +4402,10 @@ class WebpageScanner:
                 clickable = clickables[click.clickable_index]
                 self.recordNewPagesForClick = True
                 self._click_node(clickable.get('node_id'))
-                self.tab.wait(1)
+                self._wait_for_click()
+
+                # the click might change the layout without changing the DOM
+                self.node_fact_cache.invalidate_layout()
 
                 # if the frame started loading a new page, we wait
                 if self.waitForNavigatedEvent:
@@ -630,16 +4441,29 @@ class WebpageScanner:
         is_cmp_defined = self.is_cmp_function_defined()
         self.result.set_cmp_defined(is_cmp_defined)
 
+        # find rules that can match the ids and classes of the page
+        # if prefiltering is enabled
+        page_tokens = self.get_page_tokens() if self.prefilter_rules else None
+
+        if self.detection_engine == DETECTION_ENGINE_BUNDLE:
+            self.detect_cookie_notices_by_bundle(page_tokens=page_tokens, take_screenshots=take_screenshots)
+        elif self.detection_engine == DETECTION_ENGINE_SNAPSHOT:
+            self.detect_cookie_notices_by_snapshot(page_tokens=page_tokens, take_screenshots=take_screenshots)
+        else:
+            self._detect_cookie_notices_by_cdp(page_tokens=page_tokens, take_screenshots=take_screenshots)
+
+    def _detect_cookie_notices_by_cdp(self, page_tokens=None, take_screenshots=True):
+        """Detects the cookie notices with separate protocol calls for every step and node."""
         # find cookie notice by using AdblockPlus rules
         cookie_notice_filters = {}
         for abp_filter_name, abp_filter in self.abp_filters.items():
-            cookie_notice_rule_node_ids = set(self.find_cookie_notices_by_rules(abp_filter))
+            cookie_notice_rule_node_ids = set(self.find_cookie_notices_by_rules(abp_filter, page_tokens=page_tokens))
             cookie_notice_rule_node_ids = self._filter_visible_nodes(cookie_notice_rule_node_ids)
             self.result.add_cookie_notices(abp_filter_name, self.get_properties_of_cookie_notices(cookie_notice_rule_node_ids))
             cookie_notice_filters[abp_filter_name] = cookie_notice_rule_node_ids
 
-        # find string `cookie` in nodes and store the closest parent block element
-        cookie_node_ids = self.search_for_string('cookie')
+        # find the keywords (e.g. `cookie`) in nodes and store the closest parent block element
+        cookie_node_ids = self.search_for_strings(self.search_keywords)
         cookie_node_ids = self._filter_visible_nodes(cookie_node_ids)
         cookie_node_ids = set([self.find_parent_block_element(node_id) for node_id in cookie_node_ids])
         cookie_node_ids = [cookie_node_id for cookie_node_id in cookie_node_ids if cookie_node_id is not None]
@@ -666,113 +4490,17 @@ class WebpageScanner:
         return [self._get_properties_of_cookie_notice(node_id) for node_id in node_ids]
 
     def _get_properties_of_cookie_notice(self, node_id):
-        js_function = """
-            function getCookieNoticeProperties(elem) {
-                if (!elem) elem = this;
-                const style = getComputedStyle(elem);
-
-                // Source: https://codereview.stackexchange.com/a/141854
-                function powerset(l) {
-                    return (function ps(list) {
-                        if (list.length === 0) {
-                            return [[]];
-                        }
-                        var head = list.pop();
-                        var tailPS = ps(list);
-                        return tailPS.concat(tailPS.map(function(e) { return [head].concat(e); }));
-                    })(l.slice());
-                }
-
-                function getUniqueClassCombinations(elem) {
-                    let result = [];
-                    let classCombinations = powerset(Array.from(elem.classList));
-                    for (var i = 0; i < classCombinations.length; i++) {
-                        let classCombination = classCombinations[i];
-                        if (classCombination.length == 0) {
-                            continue;
-                        }
-                        if (document.getElementsByClassName(classCombination.join(' ')).length == 1) {
-                            result.push(classCombination.join(' '));
-                        }
-                    }
-                    return result;
-                }
-
-                function getUniqueAttributeCombinations(elem) {
-                    function removeFromArray(array, item) {
-                        const index = array.indexOf(item);
-                        if (index > -1) {
-                            array.splice(index, 1);
-                        }
-                    }
-
-                    let attributes = Array.from(elem.attributes);
-                    let attributeNames = [];
-                    for (var i = 0; i < attributes.length; i++) {
-                        let attributeName = attributes[i].localName;
-                        if (attributeName == 'id' || attributeName == 'class' || attributeName == 'style') {
-                            continue;
-                        }
-                        attributeNames.push(attributeName);
-                    }
-
-                    let result = [];
-                    let attributeCombinations = powerset(attributeNames);
-                    for (var i = 0; i < attributeCombinations.length; i++) {
-                        let attributeCombination = attributeCombinations[i];
-                        if (attributeCombination.length == 0) {
-                            continue;
-                        }
-
-                        let selector = '';
-                        for (var j = 0; j < attributeCombination.length; j++) {
-                            let attributeName = attributeCombination[j];
-                            let attributeValue = elem.getAttribute(attributeName);
-                            selector += '[' + attributeName + '="' + attributeValue.replace(/"/g, '\\\\"') + '"]';
-                        }
-                        console.log(selector);
-                        if (document.querySelectorAll(selector).length == 1) {
-                            result.push(attributeCombination.join(' '));
-                        }
-                    }
-                    return result;
-                }
-
-                let width = elem.offsetWidth;
-                if (width >= document.documentElement.clientWidth) {
-                    width = 'full';
-                }
-                let height = elem.offsetHeight;
-                if (height >= document.documentElement.clientHeight) {
-                    height = 'full';
-                }
-
-                return {
-                    'html': elem.outerHTML,
-                    'has_id': elem.hasAttribute('id'),
-                    'has_class': elem.hasAttribute('class'),
-                    'unique_class_combinations': getUniqueClassCombinations(elem),
-                    'unique_attribute_combinations': getUniqueAttributeCombinations(elem),
-                    'id': elem.getAttribute('id'),
-                    'class': Array.from(elem.classList),
-                    'text': elem.innerText,
-                    'fontsize': style.fontSize,
-                    'width': width,
-                    'height': height,
-                    'x': elem.getBoundingClientRect().left,
-                    'y': elem.getBoundingClientRect().top,
-                };
-            }"""
-
         try:
-            clickables = self.find_clickables_in_node(node_id)
+            clickables, are_clickables_truncated = self.find_clickables_in_node(node_id)
             clickables_properties = self.get_properties_of_clickables(clickables)
 
             remote_object_id = self._get_remote_object_id_by_node_id(node_id)
-            result = self.tab.Runtime.callFunctionOn(functionDeclaration=js_function, objectId=remote_object_id, silent=True).get('result')
-            cookie_notice_properties = self._get_object_for_remote_object(result.get('objectId'))
+            cookie_notice_properties = self._get_value_of_library_function('getCookieNoticeProperties', remote_object_id, [
+                    self.max_property_length, self.max_combination_size, self.max_combination_queries])
             cookie_notice_properties['node_id'] = node_id
             cookie_notice_properties['clickables'] = clickables_properties
+            if are_clickables_truncated:
+                cookie_notice_properties.get('truncated_properties').append('clickables')
             cookie_notice_properties['is_page_modal'] = self.is_page_modal({
                     'x': cookie_notice_properties.get('x'),
                     'y': cookie_notice_properties.get('y'),
@@ -790,21 +4518,296 @@ class WebpageScanner:
             cookie_notice_properties = dict.fromkeys([
                     'html', 'has_id', 'has_class', 'unique_class_combinations',
                     'unique_attribute_combinations', 'id', 'class', 'text',
-                    'fontsize', 'width', 'height', 'x', 'y', 'node_id', 'clickables',
-                    'is_page_modal'])
+                    'fontsize', 'width', 'height', 'x', 'y', 'truncated_properties',
+                    'node_id', 'clickables', 'is_page_modal'])
             cookie_notice_properties['clickables'] = []
             return cookie_notice_properties
 
 
+    ############################################################################
+    # COOKIE NOTICE DETECTION: BUNDLE
+    ############################################################################
+
+    def detect_cookie_notices_by_bundle(self, page_tokens=None, take_screenshots=True):
+        """Detects the cookie notices with all techniques in one call per frame.
+
+        The detection bundle runs the same steps as the separate protocol
+        calls (rules, string search, visibility, parent elements and
+        properties) inside the page. Node ids are only requested for the
+        resulting cookie notices and their clickables.
+        """
+        config = {
+            'rules': {
+                abp_filter_name: abp_filter.get_applicable_rules(self.webpage.domain, page_tokens=page_tokens)
+                for abp_filter_name, abp_filter in self.abp_filters.items()
+            },
+            'group_size': RULES_GROUP_SIZE,
+            'search_strings': self.search_keywords,
+            'max_property_length': self.max_property_length,
+            'max_combination_size': self.max_combination_size,
+            'max_combination_queries': self.max_combination_queries,
+            'max_clickables': self.max_clickables,
+        }
+        frame_results = self._run_detection_bundle(self.tab.Page.getFrameTree().get('frameTree'), config)
+
+        # merge the results of all frames, the root frame first
+        detection_techniques = list(self.abp_filters.keys()) + ['fixed_parent', 'full_width_parent']
+        cookie_notices = {detection_technique: [] for detection_technique in detection_techniques}
+        visible_node_ids = {detection_technique: [] for detection_technique in detection_techniques}
+        for frame_result in frame_results:
+            for warning in frame_result.get('warnings'):
+                self.result.add_warning(warning)
+            for abp_filter_name, invalid_rules in frame_result.get('invalid_rules').items():
+                self._add_invalid_rules(self.abp_filters.get(abp_filter_name), invalid_rules)
+            for detection_technique, notice_indexes in frame_result.get('techniques').items():
+                for notice_index in notice_indexes:
+                    cookie_notice = frame_result.get('notices')[notice_index]
+                    cookie_notices[detection_technique].append(copy.deepcopy(cookie_notice.get('properties')))
+                    if cookie_notice.get('visible_node_id') is not None:
+                        visible_node_ids[detection_technique].append(cookie_notice.get('visible_node_id'))
+
+        for detection_technique in detection_techniques:
+            self.result.add_cookie_notices(detection_technique, cookie_notices.get(detection_technique))
+
+        if take_screenshots:
+            self.take_screenshot('original')
+            for abp_filter_name in self.abp_filters.keys():
+                self.take_screenshots_of_nodes(visible_node_ids.get(abp_filter_name), f'filter-{abp_filter_name}')
+            self.take_screenshots_of_nodes(visible_node_ids.get('fixed_parent'), 'fixed_parent')
+            self.take_screenshots_of_nodes(visible_node_ids.get('full_width_parent'), 'full_width_parent')
+
+    def _run_detection_bundle(self, frame_tree, config, is_root_frame=True):
+        """Runs the detection bundle in the frame and its child frames.
+
+        Child frames are processed first: if a child frame contains the
+        search string outside of a fixed element, its frame owner is passed
+        to the parent frame as fixed parent.
+        Returns the results of the frames, the given frame first.
+        """
+        child_frame_results = []
+        frame_owner_backend_node_ids = []
+        for child_frame_tree in frame_tree.get('childFrames', []):
+            frame_results = self._run_detection_bundle(child_frame_tree, config, is_root_frame=False)
+            if len(frame_results) > 0 and frame_results[0].get('frame_owner_is_fixed_parent'):
+                try:
+                    frame_owner = self.tab.DOM.getFrameOwner(frameId=child_frame_tree.get('frame').get('id'))
+                    frame_owner_backend_node_ids.append(frame_owner.get('backendNodeId'))
+                except pychrome.exceptions.CallMethodException as e:
+                    self.result.add_warning({
+                        'message': str(e),
+                        'exception': type(e).__name__,
+                        'traceback': traceback.format_exc().splitlines(),
+                        'method': '_run_detection_bundle',
+                    })
+            child_frame_results.extend(frame_results)
+
+        # rules are only applied to the root frame
+        frame_config = dict(config, is_root_frame=is_root_frame)
+        if not is_root_frame:
+            frame_config['rules'] = {}
+
+        try:
+            # the bundle runs in an isolated world, so that the page cannot
+            # interfere with the detection
+            execution_context_id = self._get_isolated_context_id(frame_tree.get('frame').get('id'))
+            arguments = [{'value': frame_config}]
+            for backend_node_id in frame_owner_backend_node_ids:
+                frame_owner = self.tab.DOM.resolveNode(backendNodeId=backend_node_id, executionContextId=execution_context_id)
+                arguments.append({'objectId': frame_owner.get('object').get('objectId')})
+
+            response = self._call_library_function('detectCookieNotices', execution_context_id=execution_context_id, arguments=arguments)
+            if 'exceptionDetails' in response:
+                raise Exception(response.get('exceptionDetails').get('exception', {}).get('description'))
+            frame_result = self._get_frame_result_of_detection_bundle(response.get('result').get('objectId'))
+
+            # the modality of notices in child frames is checked in the root frame
+            if not is_root_frame:
+                for notice in frame_result.get('notices'):
+                    properties = notice.get('properties')
+                    properties['is_page_modal'] = self.is_page_modal({
+                            'x': properties.get('x'),
+                            'y': properties.get('y'),
+                            'width': properties.get('width'),
+                            'height': properties.get('height'),
+                        })
+        except Exception as e:
+            self.result.add_warning({
+                'message': str(e),
+                'exception': type(e).__name__,
+                'traceback': traceback.format_exc().splitlines(),
+                'method': '_run_detection_bundle',
+            })
+            return child_frame_results
+
+        return [frame_result] + child_frame_results
+
+    def _get_frame_result_of_detection_bundle(self, remote_object_id):
+        """Parses the result of the detection bundle and replaces the element indexes by node ids."""
+        frame_result, node_ids = self._get_result_and_node_ids_for_remote_array(remote_object_id, '_get_frame_result_of_detection_bundle')
+
+        notices = []
+        for notice in frame_result.get('notices'):
+            properties = {key: notice.get(key) for key in [
+                    'html', 'has_id', 'has_class', 'unique_class_combinations',
+                    'unique_attribute_combinations', 'id', 'class', 'text',
+                    'fontsize', 'width', 'height', 'x', 'y', 'truncated_properties']}
+            properties['node_id'] = node_ids.get(notice.get('element'))
+            properties['clickables'] = []
+            for clickable in notice.get('clickables'):
+                clickable_properties = {key: clickable.get(key) for key in [
+                        'html', 'node', 'type', 'text', 'value', 'fontsize', 'width', 'height', 'x', 'y',
+                        'truncated_properties']}
+                clickable_properties['node_id'] = node_ids.get(clickable.get('element'))
+                clickable_properties['is_visible'] = clickable.get('is_visible')
+                properties['clickables'].append(clickable_properties)
+            properties['is_page_modal'] = notice.get('is_page_modal')
+            notices.append({
+                'properties': properties,
+                'visible_node_id': node_ids.get(notice.get('visible_element')),
+            })
+        frame_result['notices'] = notices
+        return frame_result
+
+
+    ############################################################################
+    # COOKIE NOTICE DETECTION: SNAPSHOT
+    ############################################################################
+
+    def detect_cookie_notices_by_snapshot(self, page_tokens=None, take_screenshots=True):
+        """Detects the cookie notices on a snapshot of the page.
+
+        The browser is only needed to query the rules and to capture the
+        snapshot, the other steps run in python in a pool of worker threads
+        (see `DomSnapshot`). If the snapshot is saved, it is added to the
+        result, so that the detection can be repeated later without browser.
+        """
+        dom_snapshot = self.take_dom_snapshot(page_tokens=page_tokens)
+        if self.save_dom_snapshot:
+            self.result.set_dom_snapshot(dom_snapshot)
+        with WebpageScanner._snapshot_executor_lock:
+            if WebpageScanner._snapshot_executor is None:
+                WebpageScanner._snapshot_executor = ThreadPoolExecutor(max_workers=SNAPSHOT_DETECTION_WORKERS)
+            detection_future = WebpageScanner._snapshot_executor.submit(
+                    detect_cookie_notices_in_snapshot,
+                    dom_snapshot, search_strings=self.search_keywords, max_property_length=self.max_property_length,
+                    max_combination_size=self.max_combination_size, max_combination_queries=self.max_combination_queries,
+                    max_clickables=self.max_clickables)
+
+        # the screenshot of the page does not depend on the detection
+        if take_screenshots:
+            self.take_screenshot('original')
+
+        detection_result = detection_future.result()
+        for warning in detection_result.get('warnings'):
+            self.result.add_warning(warning)
+
+        # the nodes of the snapshot are identified by their backend node ids
+        backend_node_ids = []
+        for notice in detection_result.get('notices'):
+            backend_node_ids.append(notice.get('properties').get('backend_node_id'))
+            backend_node_ids.append(notice.get('visible_backend_node_id'))
+            backend_node_ids.extend(clickable.get('backend_node_id') for clickable in notice.get('properties').get('clickables'))
+        node_ids = self._get_node_ids_for_backend_node_ids(backend_node_ids)
+
+        notices = []
+        for notice in detection_result.get('notices'):
+            properties = notice.get('properties')
+            properties['node_id'] = node_ids.get(properties.pop('backend_node_id'))
+            for clickable in properties.get('clickables'):
+                clickable['node_id'] = node_ids.get(clickable.pop('backend_node_id'))
+            notices.append({
+                'properties': properties,
+                'visible_node_id': node_ids.get(notice.get('visible_backend_node_id')),
+            })
+
+        for detection_technique, notice_indexes in detection_result.get('techniques').items():
+            self.result.add_cookie_notices(detection_technique, [copy.deepcopy(notices[notice_index].get('properties')) for notice_index in notice_indexes])
+
+        if take_screenshots:
+            for detection_technique, notice_indexes in detection_result.get('techniques').items():
+                visible_node_ids = [notices[notice_index].get('visible_node_id') for notice_index in notice_indexes]
+                name = f'filter-{detection_technique}' if detection_technique in self.abp_filters else detection_technique
+                self.take_screenshots_of_nodes([node_id for node_id in visible_node_ids if node_id is not None], name)
+
+    def take_dom_snapshot(self, page_tokens=None):
+        """Returns a snapshot of the page with the layout and the computed styles of all frames.
+
+        The elements that match the rules of the filters are stored with
+        their backend node ids, because the snapshot does not contain
+        enough information to match selectors.
+        """
+        # stop execution of scripts to ensure that the page does not change
+        # between querying the rules and capturing the snapshot
+        self.tab.Emulation.setScriptExecutionDisabled(value=True)
+        try:
+            rule_matches = {}
+            for abp_filter_name, abp_filter in self.abp_filters.items():
+                remote_object_id = self._query_rules(abp_filter, page_tokens=page_tokens)
+                rule_matches[abp_filter_name] = self._get_array_of_backend_node_ids_for_remote_object(remote_object_id)
+
+            capture = self.tab.DOMSnapshot.captureSnapshot(
+                    computedStyles=SNAPSHOT_COMPUTED_STYLES,
+                    includeDOMRects=True,
+                    includePaintOrder=True)
+        finally:
+            # resume execution of scripts
+            self.tab.Emulation.setScriptExecutionDisabled(value=False)
+
+        return {
+            'version': DOM_SNAPSHOT_VERSION,
+            'url': self.webpage.url,
+            'computed_styles': SNAPSHOT_COMPUTED_STYLES,
+            'rule_matches': rule_matches,
+            'capture': capture,
+        }
+
+    def _get_node_ids_for_backend_node_ids(self, backend_node_ids):
+        """Returns the node ids by backend node id, nodes that do not exist anymore are missing."""
+        backend_node_ids = list(dict.fromkeys(backend_node_id for backend_node_id in backend_node_ids if backend_node_id is not None))
+        if len(backend_node_ids) == 0:
+            return {}
+        try:
+            node_ids = self.tab.DOM.pushNodesByBackendIdsToFrontend(backendNodeIds=backend_node_ids).get('nodeIds')
+        except pychrome.exceptions.CallMethodException as e:
+            self.result.add_warning({
+                'message': str(e),
+                'exception': type(e).__name__,
+                'traceback': traceback.format_exc().splitlines(),
+                'method': '_get_node_ids_for_backend_node_ids',
+            })
+            return {}
+        return {
+                backend_node_id: node_id
+                for backend_node_id, node_id in zip(backend_node_ids, node_ids)
+                if node_id != 0
+            }
+
+
     ############################################################################
     # GENERAL
     ############################################################################
 
     def detect_language(self):
+        """Takes a sample of the text of the page and starts to detect its
+        language, the result is set by `get_result`."""
+        try:
+            response = self._call_library_function('getLanguageSample', arguments=[{'value': LANGUAGE_SAMPLE_LENGTH}], return_by_value=True)
+            if 'exceptionDetails' in response:
+                raise pychrome.exceptions.CallMethodException(response.get('exceptionDetails').get('text'))
+            self._language_future = self.language_detector.detect(response.get('result').get('value'))
+        except Exception as e:
+            self.result.add_warning({
+                'message': str(e),
+                'exception': type(e).__name__,
+                'traceback': traceback.format_exc().splitlines(),
+                'method': 'detect_language',
+            })
+
+    def _resolve_language(self):
+        if self._language_future is None:
+            return
         try:
-            result = self.tab.Runtime.evaluate(expression='document.body.innerText').get('result')
-            language = detect(result.get('value'))
-            self.result.set_language(language)
+            self.result.set_language(self._language_future.result())
         except Exception as e:
             self.result.add_warning({
                 'message': str(e),
@@ -812,59 +4815,54 @@ class WebpageScanner:
                 'traceback': traceback.format_exc().splitlines(),
                 'method': 'detect_language',
             })
+        self._language_future = None
 
-    def search_for_string(self, search_string):
-        """Searches the DOM for the given string and returns all found nodes."""
+    def search_for_strings(self, search_strings):
+        """Searches the text of all frames for the strings and returns the
+        elements that contain one of them.
 
+        The strings are matched case-insensitively in one pass over the text
+        nodes of a frame, text in `script`, `style` and `noscript` elements
+        is skipped.
+        """
         # stop execution of scripts to ensure that results do not change during search
         self.tab.Emulation.setScriptExecutionDisabled(value=True)
 
-        # search for the string in a text node
-        # take the parent of the text node (the element that contains the text)
-        # this is necessary if an element contains more than one text node!
-        # see for explanation:
-        # - https://stackoverflow.com/a/2994336
-        # - https://stackoverflow.com/a/11744783
-        search_object = self.tab.DOM.performSearch(
-                query="//body//*/text()[contains(translate(., 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), '" + search_string + "')]/parent::*")
-
         node_ids = []
-        if search_object.get('resultCount') != 0:
-            search_results = self.tab.DOM.getSearchResults(
-                    searchId=search_object.get('searchId'),
-                    fromIndex=0,
-                    toIndex=int(search_object.get('resultCount')))
-            node_ids = search_results.get('nodeIds')
-
-        # remove script and style nodes
-        node_ids = [node_id for node_id in node_ids if not self._is_script_or_style_node(node_id)]
+        for frame_id in self._get_frame_ids(self.tab.Page.getFrameTree().get('frameTree')):
+            try:
+                # the search runs in an isolated world, so that the page cannot
+                # interfere with it
+                execution_context_id = self._get_isolated_context_id(frame_id)
+                response = self._call_library_function('searchForStrings', execution_context_id=execution_context_id, arguments=[{'value': search_strings}])
+                if 'exceptionDetails' in response:
+                    raise pychrome.exceptions.CallMethodException(response.get('exceptionDetails').get('text'))
+                node_ids.extend(self._get_array_of_node_ids_for_remote_object(response.get('result').get('objectId')))
+            except pychrome.exceptions.CallMethodException as e:
+                self.result.add_warning({
+                    'message': str(e),
+                    'exception': type(e).__name__,
+                    'traceback': traceback.format_exc().splitlines(),
+                    'method': 'search_for_strings',
+                })
 
         # resume execution of scripts
         self.tab.Emulation.setScriptExecutionDisabled(value=False)
 
-        # return nodes
-        return node_ids
+        return list(dict.fromkeys(node_ids))
+
+    def _get_frame_ids(self, frame_tree):
+        frame_ids = [frame_tree.get('frame').get('id')]
+        for child_frame_tree in frame_tree.get('childFrames', []):
+            frame_ids.extend(self._get_frame_ids(child_frame_tree))
+        return frame_ids
 
     def find_parent_block_element(self, node_id):
         """Returns the nearest parent block element or the element itself if it is a block element."""
 
-        js_function = """
-            function findClosestBlockElement(elem) {
-                function isInlineElement(elem) {
-                    const style = getComputedStyle(elem);
-                    return style.display == 'inline';
-                }
-
-                if (!elem) elem = this;
-                while(elem && elem !== document.body && isInlineElement(elem)) {
-                    elem = elem.parentNode;
-                }
-                return elem;
-            }"""
-
         try:
             remote_object_id = self._get_remote_object_id_by_node_id(node_id)
-            result = self.tab.Runtime.callFunctionOn(functionDeclaration=js_function, objectId=remote_object_id, silent=True).get('result')
+            result = self._call_library_function_on_object('findClosestBlockElement', remote_object_id).get('result')
             return self._get_node_id_for_remote_object(result.get('objectId'))
         except pychrome.exceptions.CallMethodException as e:
             self.result.add_warning({
@@ -889,87 +4887,9 @@ class WebpageScanner:
         return cookie_notice_full_width_node_ids
 
     def _find_full_width_parent(self, node_id):
-        js_function = """
-            function findFullWidthParent(elem) {
-                function parseValue(value) {
-                    var parsedValue = parseInt(value);
-                    if (isNaN(parsedValue)) {
-                        return 0;
-                    } else {
-                        return parsedValue;
-                    }
-                }
-
-                function getWidth(elem) {
-                    const style = getComputedStyle(elem);
-                    return elem.clientWidth +
-                        parseValue(style.borderLeftWidth) + parseValue(style.borderRightWidth) +
-                        parseValue(style.marginLeft) + parseValue(style.marginRight);
-                }
-
-                function getHeight(elem) {
-                    const style = getComputedStyle(elem);
-                    return elem.clientHeight +
-                        parseValue(style.borderTopWidth) + parseValue(style.borderBottomWidth) +
-                        parseValue(style.marginTop) + parseValue(style.marginBottom);
-                }
-
-                function getVerticalSpacing(elem) {
-                    const style = getComputedStyle(elem);
-                    return parseValue(style.paddingTop) + parseValue(style.paddingBottom) +
-                        parseValue(style.borderTopWidth) + parseValue(style.borderBottomWidth) +
-                        parseValue(style.marginTop) + parseValue(style.marginBottom);
-                }
-
-                function getHeightDiff(outerElem, innerElem) {
-                    return getHeight(outerElem) - getHeight(innerElem);
-                }
-
-                function isParentHigherThanItsSpacing(outerElem, innerElem) {
-                    let allowedIncrease = Math.max(0.25*getHeight(innerElem), 20);
-                    return getHeightDiff(outerElem, innerElem) > (getVerticalSpacing(outerElem) + allowedIncrease);
-                }
-
-                function getPosition(elem) {
-                    return elem.getBoundingClientRect().top;
-                }
-
-                function getPositionDiff(outerElem, innerElem) {
-                    return Math.abs(getPosition(outerElem) - getPosition(innerElem));
-                }
-
-                function getPositionSpacing(outerElem, innerElem) {
-                    const outerStyle = getComputedStyle(outerElem);
-                    const innerStyle = getComputedStyle(innerElem);
-                    return parseValue(innerStyle.marginTop) +
-                        parseValue(outerStyle.paddingTop) + parseValue(outerStyle.borderTopWidth)
-                }
-
-                function isParentMovedMoreThanItsSpacing(outerElem, innerElem) {
-                    let allowedIncrease = Math.max(0.25*getHeight(innerElem), 20);
-                    return getPositionDiff(outerElem, innerElem) > (getPositionSpacing(outerElem, innerElem) + allowedIncrease);
-                }
-
-                if (!elem) elem = this;
-                while(elem && elem !== document.body) {
-                    parent = elem.parentNode;
-                    if (isParentHigherThanItsSpacing(parent, elem) || isParentMovedMoreThanItsSpacing(parent, elem)) {
-                        break;
-                    }
-                    elem = parent;
-                }
-
-                let allowedIncrease = 18; // for scrollbar issues
-                if (document.documentElement.clientWidth <= (getWidth(elem) + allowedIncrease)) {
-                    return elem;
-                } else {
-                    return false;
-                }
-            }"""
-
         try:
             remote_object_id = self._get_remote_object_id_by_node_id(node_id)
-            result = self.tab.Runtime.callFunctionOn(functionDeclaration=js_function, objectId=remote_object_id, silent=True).get('result')
+            result = self._call_library_function_on_object('findFullWidthParent', remote_object_id).get('result')
 
             # if a boolean is returned, we did not find a full-width small parent
             if result.get('type') == 'boolean':
@@ -1009,22 +4929,9 @@ class WebpageScanner:
         return cookie_notice_fixed_node_ids
 
     def _find_fixed_parent(self, node_id):
-        js_function = """
-            function findFixedParent(elem) {
-                if (!elem) elem = this;
-                while(elem && elem.parentNode !== document) {
-                    let style = getComputedStyle(elem);
-                    if (style.position === 'fixed') {
-                        return elem;
-                    }
-                    elem = elem.parentNode;
-                }
-                return elem; // html node
-            }"""
-
         try:
             remote_object_id = self._get_remote_object_id_by_node_id(node_id)
-            result = self.tab.Runtime.callFunctionOn(functionDeclaration=js_function, objectId=remote_object_id, silent=True).get('result')
+            result = self._call_library_function_on_object('findFixedParent', remote_object_id).get('result')
             result_node_id = self._get_node_id_for_remote_object(result.get('objectId'))
 
             # if the returned parent element is an html element,
@@ -1070,33 +4977,58 @@ class WebpageScanner:
     # COOKIE NOTICE DETECTION: RULES
     ############################################################################
 
-    def find_cookie_notices_by_rules(self, abp_filter):
+    def find_cookie_notices_by_rules(self, abp_filter, page_tokens=None):
         """Returns the node ids of the found cookie notices.
 
         The function uses the AdblockPlus ruleset of the browser plugin
         `I DON'T CARE ABOUT COOKIES`.
         See: https://www.i-dont-care-about-cookies.eu/
+
+        The rules are queried in groups to reduce the number of passes over
+        the DOM. If a group contains an invalid rule, the group is bisected
+        until the invalid rule is found. Invalid rules are reported to the
+        filter, so they are skipped on the following pages.
+
+        If the ids and classes of the page are given, only rules that can
+        match are queried (see `get_page_tokens`).
         """
-        rules = [rule.selector.get('value') for rule in abp_filter.get_applicable_rules(self.webpage.domain)]
-        rules_js = json.dumps(rules)
-
-        js_function = """
-            (function() {
-                let rules = """ + rules_js + """;
-                let cookie_notices = [];
-
-                rules.forEach(function(rule) {
-                    let elements = document.querySelectorAll(rule);
-                    elements.forEach(function(element) {
-                        cookie_notices.push(element);
-                    });
-                });
+        remote_object_id = self._query_rules(abp_filter, page_tokens=page_tokens)
+        return self._get_array_of_node_ids_for_remote_object(remote_object_id)
+
+    def _query_rules(self, abp_filter, page_tokens=None):
+        """Queries the rules and returns the remote object id of the array of found elements."""
+        rules = abp_filter.get_applicable_rules(self.webpage.domain, page_tokens=page_tokens)
+        query_result = self._call_library_function('queryRules', arguments=[{'value': rules}, {'value': RULES_GROUP_SIZE}]).get('result')
+        query_attributes = {
+                attribute.get('name'): attribute.get('value').get('objectId')
+                for attribute in self._get_properties_of_remote_object(query_result.get('objectId'))
+            }
+
+        invalid_rules = self._get_array_for_remote_object(query_attributes.get('invalid_rules'))
+        self._add_invalid_rules(abp_filter, invalid_rules)
+
+        return query_attributes.get('cookie_notices')
+
+    def _add_invalid_rules(self, abp_filter, invalid_rules):
+        """Reports invalid rules to the filter, so they are skipped on the following pages."""
+        if len(invalid_rules) == 0:
+            return
+        abp_filter.add_invalid_rules(invalid_rules)
+        self.result.add_warning({
+            'message': f'{len(invalid_rules)} invalid rules were skipped',
+            'exception': 'InvalidRules',
+            'rules': invalid_rules,
+            'method': 'find_cookie_notices_by_rules',
+        })
 
-                return cookie_notices;
-            })();"""
+    def get_page_tokens(self):
+        """Returns the ids and classes used on the page, e.g. `#cookie-banner` and `.cc-window`.
 
-        query_result = self.tab.Runtime.evaluate(expression=js_function).get('result')
-        return self._get_array_of_node_ids_for_remote_object(query_result.get('objectId'))
+        The tokens are in lowercase, because ids and classes are matched
+        case-insensitively in quirks mode.
+        """
+        result = self._call_library_function('getPageTokens', return_by_value=True).get('result')
+        return set(result.get('value'))
 
 
     ############################################################################
@@ -1114,37 +5046,20 @@ class WebpageScanner:
     ############################################################################
 
     def find_clickables_in_node(self, node_id):
+        """Returns the outermost clickables in the node and whether some of
+        them were left out because there are more than `max_clickables`."""
         # getEventListeners()
         # https://developers.google.com/web/tools/chrome-devtools/console/utilities?utm_campaign=2016q3&utm_medium=redirect&utm_source=dcc#geteventlistenersobject
 
-        js_function = """
-            function findClickablesInElement(elem) {
-                function findCoveringNodes(nodes) {
-                    let covering_nodes = Array.from(nodes);
-
-                    for (var i = 0; i < nodes.length; i++) {
-                        let node1 = nodes[i];
-                        for (var j = 0; j < nodes.length; j++) {
-                            let node2 = nodes[j];
-                            // check whether node2 is contained in node1, if yes remove
-                            if (node1 !== node2 && node1.contains(node2)) {
-                                const index = covering_nodes.indexOf(node2);
-                                covering_nodes.splice(index, 1);
-                            }
-                        }
-                    }
-                    return covering_nodes;
-                }
-
-                if (!elem) elem = this;
-                let nodes = elem.querySelectorAll('a, button, input[type="button"], input[type="submit"], [role="button"], [role="link"]');
-                return findCoveringNodes(nodes);
-            }"""
-
         try:
             remote_object_id = self._get_remote_object_id_by_node_id(node_id)
-            result = self.tab.Runtime.callFunctionOn(functionDeclaration=js_function, objectId=remote_object_id, silent=True).get('result')
-            return self._get_array_of_node_ids_for_remote_object(result.get('objectId'))
+            result = self._call_library_function_on_object('findClickablesInElement', remote_object_id, [{'value': self.max_clickables}]).get('result')
+            properties = {
+                    remote_property.get('name'): remote_property.get('value')
+                    for remote_property in self._get_properties_of_remote_object(result.get('objectId'))
+                }
+            clickables = self._get_array_of_node_ids_for_remote_object(properties.get('clickables').get('objectId'))
+            return clickables, properties.get('is_truncated').get('value')
         except pychrome.exceptions.CallMethodException as e:
             self.result.add_warning({
                 'message': str(e),
@@ -1152,45 +5067,18 @@ class WebpageScanner:
                 'traceback': traceback.format_exc().splitlines(),
                 'method': 'find_clickables_in_node',
             })
-            return []
+            return [], False
 
     def get_properties_of_clickables(self, node_ids):
-        return [self._get_properties_of_clickable(node_id) for node_id in node_ids]
-
-    def _get_properties_of_clickable(self, node_id):
-        js_function = """
-            function getPropertiesOfClickable(elem) {
-                if (!elem) elem = this;
-
-                const style = getComputedStyle(elem);
-
-                let clickable_type;
-                if (elem.localName == 'a' || elem.getAttribute('role') == 'link') {
-                    clickable_type = 'link';
-                } else {
-                    clickable_type = 'button';
-                }
-
-                return {
-                    'html': elem.outerHTML,
-                    'node': elem.localName,
-                    'type': clickable_type,
-                    'text': elem.innerText,
-                    'value': elem.getAttribute('value'),
-                    'fontsize': style.fontSize,
-                    'width': elem.offsetWidth,
-                    'height': elem.offsetHeight,
-                    'x': elem.getBoundingClientRect().left,
-                    'y': elem.getBoundingClientRect().top,
-                };
-            }"""
+        visibilities = self.are_nodes_visible(node_ids)
+        return [self._get_properties_of_clickable(node_id, visibilities.get(node_id).get('is_visible')) for node_id in node_ids]
 
+    def _get_properties_of_clickable(self, node_id, is_visible):
         try:
             remote_object_id = self._get_remote_object_id_by_node_id(node_id)
-            result = self.tab.Runtime.callFunctionOn(functionDeclaration=js_function, objectId=remote_object_id, silent=True).get('result')
-            properties_of_clickable = self._get_object_for_remote_object(result.get('objectId'))
+            properties_of_clickable = self._get_value_of_library_function('getPropertiesOfClickable', remote_object_id, [self.max_property_length])
             properties_of_clickable['node_id'] = node_id
-            properties_of_clickable['is_visible'] = self.is_node_visible(node_id).get('is_visible')
+            properties_of_clickable['is_visible'] = is_visible
             return properties_of_clickable
         except pychrome.exceptions.CallMethodException as e:
             self.result.add_warning({
@@ -1201,18 +5089,20 @@ class WebpageScanner:
             })
             return dict.fromkeys([
                 'html', 'node', 'type', 'text', 'value', 'fontsize', 'width', 'height', 'x', 'y',
-                'node_id', 'is_visible'])
+                'truncated_properties', 'node_id', 'is_visible'])
 
-    def _click_node(self, node_id):
-        js_function = """
-            function clickNode(elem) {
-                if (!elem) elem = this;
-                elem.click();
-            }"""
+    def _wait_for_click(self):
+        """Waits until the click started a navigation or the page is quiet
+        for `settle_quiet_time` seconds after the click, but at most
+        `CLICK_TIMEOUT` seconds."""
+        with self._page_state_changed:
+            self._last_mutation = time.monotonic()
+        self._wait_for(lambda: self.waitForNavigatedEvent or self._is_page_quiet(), CLICK_TIMEOUT)
 
+    def _click_node(self, node_id):
         try:
             remote_object_id = self._get_remote_object_id_by_node_id(node_id)
-            self.tab.Runtime.callFunctionOn(functionDeclaration=js_function, objectId=remote_object_id, silent=True).get('result')
+            self._call_library_function_on_object('clickNode', remote_object_id)
             return True
         except pychrome.exceptions.CallMethodException as e:
             self.result.add_warning({
@@ -1229,88 +5119,82 @@ class WebpageScanner:
     ############################################################################
 
     def _filter_visible_nodes(self, node_ids):
-        return [node_id for node_id in node_ids if self.is_node_visible(node_id).get('is_visible')]
+        node_ids = list(node_ids)
+        visibilities = self.are_nodes_visible(node_ids)
+        return [node_id for node_id in node_ids if visibilities.get(node_id).get('is_visible')]
 
-    def is_node_visible(self, node_id):
-        # Source: https://stackoverflow.com/a/41698614
-        # adapted to also look at child nodes (especially important for fixed 
-        # elements as they might not be "visible" themselves when they have no 
-        # width or height)
-        js_function = """
-            function isVisible(elem) {
-                function parseValue(value) {
-                    var parsedValue = parseInt(value);
-                    if (isNaN(parsedValue)) {
-                        return 0;
-                    } else {
-                        return parsedValue;
-                    }
-                }
+    def are_nodes_visible(self, node_ids):
+        """Checks the visibility of all nodes with a single call per document.
 
-                if (!elem) elem = this;
-                if (!(elem instanceof Element)) return false;
-                let visible = true;
-                const style = getComputedStyle(elem);
-
-                // for these rules the childs cannot be visible, directly return
-                if (style.display === 'none') return false;
-                if (style.opacity < 0.1) return false;
-                if (style.visibility !== 'visible') return false;
-
-                // for these rules a child element might still be visible,
-                // we need to also look at the childs, no direct return
-                if (elem.offsetWidth + elem.offsetHeight + elem.getBoundingClientRect().height +
-                    elem.getBoundingClientRect().width === 0) {
-                    visible = false;
-                }
-                if (elem.offsetWidth < 10 || elem.offsetHeight < 10) {
-                    visible = false;
-                }
-                const elemCenter = {
-                    x: elem.getBoundingClientRect().left + elem.offsetWidth / 2,
-                    y: elem.getBoundingClientRect().top + elem.offsetHeight / 2
-                };
-                if (elemCenter.x < 0) visible = false;
-                if (elemCenter.x > (document.documentElement.clientWidth || window.innerWidth)) visible = false;
-                if (elemCenter.y < 0) visible = false;
-                if (elemCenter.y > (document.documentElement.clientHeight || window.innerHeight)) visible = false;
-
-                if (visible) {
-                    let pointContainer = document.elementFromPoint(elemCenter.x, elemCenter.y);
-                    do {
-                        if (pointContainer === elem) return elem;
-                        if (!pointContainer) break;
-                    } while (pointContainer = pointContainer.parentNode);
-
-                    pointContainer = document.elementFromPoint(elemCenter.x, elemCenter.y - (parseValue(style.fontSize)/2));
-                    do {
-                        if (pointContainer === elem) return elem;
-                        if (!pointContainer) break;
-                    } while (pointContainer = pointContainer.parentNode);
-                }
+        Returns the visibility by node id, the visible node is either the
+        node itself or a visible descendant.
+        """
+        return self.node_fact_cache.get_many('visibility', node_ids, self._get_visibility_of_nodes)
+
+    def _get_visibility_of_nodes(self, node_ids):
+        visibilities = {}
+        remote_object_ids = {}
+        for node_id in node_ids:
+            if node_id in visibilities or node_id in remote_object_ids:
+                continue
+            remote_object_id = self._get_remote_object_id_by_node_id(node_id)
+            if remote_object_id is None:
+                # the single check adds the warning
+                visibilities[node_id] = self._is_node_visible(node_id)
+            else:
+                remote_object_ids[node_id] = remote_object_id
 
-                // check the child nodes
-                if (!visible) {
-                    let childrenCount = elem.childNodes.length;
-                    for (var i = 0; i < childrenCount; i++) {
-                        let isChildVisible = isVisible(elem.childNodes[i]);
-                        if (isChildVisible) {
-                            return isChildVisible;
-                        }
-                    }
-                }
+        visibilities.update(self._are_nodes_visible(list(remote_object_ids.items())))
+        return visibilities
 
-                return false;
-            }"""
+    def _are_nodes_visible(self, remote_object_ids):
+        """Checks the visibility of the remote objects in one call.
+
+        The elements have to be in the same document, if the call fails,
+        the nodes are split in halves which are checked separately.
+        """
+        if len(remote_object_ids) == 0:
+            return {}
+
+        try:
+            call_arguments = [{'objectId': remote_object_id} for node_id, remote_object_id in remote_object_ids[1:]]
+            response = self._call_library_function_on_object('areVisible', remote_object_ids[0][1], arguments=call_arguments)
+            if 'exceptionDetails' in response:
+                raise pychrome.exceptions.CallMethodException(response.get('exceptionDetails').get('text'))
+        except pychrome.exceptions.CallMethodException:
+            if len(remote_object_ids) == 1:
+                return {node_id: self._is_node_visible(node_id) for node_id, remote_object_id in remote_object_ids}
+            middle = len(remote_object_ids) // 2
+            visibilities = self._are_nodes_visible(remote_object_ids[:middle])
+            visibilities.update(self._are_nodes_visible(remote_object_ids[middle:]))
+            return visibilities
+
+        results, substitute_node_ids = self._get_result_and_node_ids_for_remote_array(
+                response.get('result').get('objectId'), 'are_nodes_visible')
+        visibilities = {}
+        for (node_id, remote_object_id), result in zip(remote_object_ids, results):
+            if result.get('visible_element') is None:
+                visible_node_id = node_id if result.get('is_visible') else None
+            else:
+                visible_node_id = substitute_node_ids.get(result.get('visible_element'))
+            visibilities[node_id] = {
+                'is_visible': result.get('is_visible'),
+                'visible_node': visible_node_id,
+            }
+        return visibilities
 
-        # the function `isVisible` is calling itself recursively, 
-        # therefore it needs to be defined beforehand
-        self.tab.Runtime.evaluate(expression=js_function)
+    def is_node_visible(self, node_id):
+        return self.node_fact_cache.get('visibility', node_id, self._is_node_visible)
 
+    def _is_node_visible(self, node_id):
+        # Source: https://stackoverflow.com/a/41698614
+        # adapted to also look at child nodes (especially important for fixed 
+        # elements as they might not be "visible" themselves when they have no 
+        # width or height)
         try:
             # call the function `isVisible` on the node
             remote_object_id = self._get_remote_object_id_by_node_id(node_id)
-            result = self.tab.Runtime.callFunctionOn(functionDeclaration=js_function, objectId=remote_object_id, silent=True).get('result')
+            result = self._call_library_function_on_object('isVisible', remote_object_id).get('result')
 
             # if a boolean is returned, the object is not visible
             if result.get('type') == 'boolean':
@@ -1342,59 +5226,7 @@ class WebpageScanner:
     ############################################################################
 
     def is_page_modal(self, cookie_notice=None):
-        cookie_notice_js = json.dumps(cookie_notice)
-
-        js_function = """
-            (function modal() {
-                let margin = 5;
-                let cookieNotice = """ + cookie_notice_js + """;
-
-                let viewportWidth = document.documentElement.clientWidth;
-                let viewportHeight = document.documentElement.clientHeight;
-                let viewportHorizontalCenter = viewportWidth / 2;
-                let viewportVerticalCenter = viewportHeight / 2;
-
-                let testPositions = [
-                    {'x': margin, 'y': margin},
-                    {'x': margin, 'y': viewportVerticalCenter},
-                    {'x': margin, 'y': viewportHeight - margin},
-                    {'x': viewportVerticalCenter, 'y': margin},
-                    {'x': viewportVerticalCenter, 'y': viewportHeight - margin},
-                    {'x': viewportWidth - margin, 'y': margin},
-                    {'x': viewportWidth - margin, 'y': viewportVerticalCenter},
-                    {'x': viewportWidth - margin, 'y': viewportHeight - margin},
-                ];
-
-                if (cookieNotice) {
-                    if (cookieNotice.width == 'full') {
-                        cookieNotice.width = viewportWidth;
-                    }
-                    if (cookieNotice.height == 'full') {
-                        cookieNotice.height = viewportHeight;
-                    }
-                    for (var i = 0; i < testPositions.length; i++) {
-                        let testPosition = testPositions[i];
-                        if ((testPosition.x >= cookieNotice.x && testPosition.x <= (cookieNotice.x + cookieNotice.width)) &&
-                                (testPosition.y >= cookieNotice.y && testPosition.y <= (cookieNotice.y + cookieNotice.height))) {
-                            let index = testPositions.indexOf(testPosition);
-                            testPositions.splice(index, 1);
-                        }
-                    }
-                }
-
-                let previousContainer = document.elementFromPoint(testPositions[0].x, testPositions[0].y);
-                for (var i = 1; i < testPositions.length; i++) {
-                    let testPosition = testPositions[i];
-                    let testContainer = document.elementFromPoint(testPosition.x, testPosition.y);
-                    if (previousContainer !== testContainer) {
-                        return false;
-                    }
-                    previousContainer = testContainer;
-                }
-                return true;
-            })();"""
-
-        result = self.tab.Runtime.evaluate(expression=js_function).get('result')
+        result = self._call_library_function('isPageModal', arguments=[{'value': cookie_notice}]).get('result')
         return result.get('value')
 
 
@@ -1405,8 +5237,10 @@ class WebpageScanner:
     def take_screenshots_of_visible_nodes(self, node_ids, name):
         # filter only visible nodes
         # and replace the original node_id with their visible children if the node itself is not visible
-        node_ids = [visibility.get('visible_node') for visibility in (self.is_node_visible(node_id) for node_id in node_ids) 
-                    if visibility and visibility.get('is_visible')]
+        node_ids = list(node_ids)
+        visibilities = self.are_nodes_visible(node_ids)
+        node_ids = [visibilities.get(node_id).get('visible_node') for node_id in node_ids
+                    if visibilities.get(node_id).get('visible_node') is not None]
         self.take_screenshots_of_nodes(node_ids, name)
 
     def take_screenshots_of_nodes(self, node_ids, name):
@@ -1445,6 +5279,74 @@ class WebpageScanner:
     # REMOTE OBJECTS
     ############################################################################
 
+    def _get_isolated_context_id(self, frame_id):
+        """Returns the execution context of the isolated world in the frame.
+
+        The context is created once per document and reused until the browser
+        reports that it is destroyed.
+        """
+        with self._isolated_context_ids_lock:
+            execution_context_id = self._isolated_context_ids.get(frame_id)
+        if execution_context_id is not None:
+            return execution_context_id
+
+        execution_context_id = self.tab.Page.createIsolatedWorld(frameId=frame_id, worldName=ISOLATED_WORLD_NAME).get('executionContextId')
+        with self._isolated_context_ids_lock:
+            return self._isolated_context_ids.setdefault(frame_id, execution_context_id)
+
+    def _call_library_function(self, function_name, arguments=(), execution_context_id=None, return_by_value=False):
+        """Calls a function of the JavaScript library and returns the response.
+
+        The function runs in the given execution context or in the isolated
+        world of the root frame.
+        """
+        if execution_context_id is None:
+            execution_context_id = self._get_isolated_context_id(self._get_root_frame_id())
+        call_arguments = [{'value': function_name}] + list(arguments)
+        return self._call_library(call_arguments, {'executionContextId': execution_context_id}, return_by_value)
+
+    def _call_library_function_on_object(self, function_name, remote_object_id, arguments=(), return_by_value=False):
+        """Calls a function of the JavaScript library with the remote object as first argument."""
+        if remote_object_id is None:
+            raise pychrome.exceptions.CallMethodException(f'no remote object to call `{function_name}` on')
+        call_arguments = [{'value': function_name}, {'objectId': remote_object_id}] + list(arguments)
+        return self._call_library(call_arguments, {'objectId': remote_object_id}, return_by_value)
+
+    def _call_library(self, call_arguments, target, return_by_value):
+        """Calls the library in the target and installs it first if necessary.
+
+        The library is installed in every new document (see `_setup_tab`),
+        documents that existed before get it on the first call.
+        """
+        response = self._call_library_in_target(call_arguments, target, return_by_value)
+        if JS_LIBRARY_MISSING in response.get('exceptionDetails', {}).get('exception', {}).get('description', ''):
+            self.tab.Runtime.callFunctionOn(functionDeclaration='function() {' + JS_LIBRARY + '}', silent=True, **target)
+            response = self._call_library_in_target(call_arguments, target, return_by_value)
+        return response
+
+    def _call_library_in_target(self, call_arguments, target, return_by_value):
+        return self.tab.Runtime.callFunctionOn(functionDeclaration=JS_LIBRARY_CALL, arguments=call_arguments,
+                                               returnByValue=return_by_value, silent=True, **target)
+
+    def _get_value_of_library_function(self, function_name, remote_object_id, arguments=()):
+        """Calls the library function for the remote object and returns the result as value.
+
+        If the result cannot be serialized, the returned remote object is
+        walked instead.
+        """
+        call_arguments = [{'value': argument} for argument in arguments]
+        try:
+            response = self._call_library_function_on_object(function_name, remote_object_id, arguments=call_arguments, return_by_value=True)
+        except pychrome.exceptions.CallMethodException:
+            response = self._call_library_function_on_object(function_name, remote_object_id, arguments=call_arguments)
+            if 'exceptionDetails' in response:
+                raise pychrome.exceptions.CallMethodException(response.get('exceptionDetails').get('text'))
+            return self._get_object_for_remote_object(response.get('result').get('objectId'))
+
+        if 'exceptionDetails' in response:
+            raise pychrome.exceptions.CallMethodException(response.get('exceptionDetails').get('text'))
+        return response.get('result').get('value')
+
     def _get_node_id_for_remote_object(self, remote_object_id):
         return self.tab.DOM.requestNode(objectId=remote_object_id).get('nodeId')
 
@@ -1464,6 +5366,48 @@ class WebpageScanner:
                 })
         return node_ids
 
+    def _get_result_and_node_ids_for_remote_array(self, remote_object_id, method):
+        """Parses an array whose first element is a result as json and whose
+        other elements are the elements that are referenced in the result.
+
+        Returns the result and the node ids by the index of the elements.
+        """
+        array_elements = {
+                array_element.get('name'): array_element.get('value')
+                for array_element in self._get_properties_of_remote_object(remote_object_id)
+                if array_element.get('enumerable')
+            }
+        result = json.loads(array_elements.pop('0').get('value'))
+
+        node_ids = {}
+        for name, array_element in array_elements.items():
+            try:
+                node_ids[int(name) - 1] = self._get_node_id_for_remote_object(array_element.get('objectId'))
+            except pychrome.exceptions.CallMethodException as e:
+                self.result.add_warning({
+                    'message': str(e),
+                    'exception': type(e).__name__,
+                    'traceback': traceback.format_exc().splitlines(),
+                    'method': method,
+                })
+        return result, node_ids
+
+    def _get_array_of_backend_node_ids_for_remote_object(self, remote_object_id):
+        array_attributes = self._get_properties_of_remote_object(remote_object_id)
+        remote_object_ids = [array_element.get('value').get('objectId') for array_element in array_attributes if array_element.get('enumerable')]
+        backend_node_ids = []
+        for remote_object_id in remote_object_ids:
+            try:
+                backend_node_ids.append(self.tab.DOM.describeNode(objectId=remote_object_id).get('node').get('backendNodeId'))
+            except pychrome.exceptions.CallMethodException as e:
+                self.result.add_warning({
+                    'message': str(e),
+                    'exception': type(e).__name__,
+                    'traceback': traceback.format_exc().splitlines(),
+                    'method': '_get_array_of_backend_node_ids_for_remote_object',
+                })
+        return backend_node_ids
+
     def _get_object_for_remote_object(self, remote_object_id):
         object_attributes = self._get_properties_of_remote_object(remote_object_id)
         result = {
@@ -1516,8 +5460,15 @@ class WebpageScanner:
         return self.tab.Runtime.getProperties(objectId=remote_object_id, ownProperties=True).get('result')
 
     def _get_remote_object_id_by_node_id(self, node_id):
+        return self.node_fact_cache.get('remote_object_id', node_id, self._resolve_remote_object_id)
+
+    def _resolve_remote_object_id(self, node_id):
+        # the node is resolved in the isolated world of its frame, where the
+        # library is installed
         try:
-            return self.tab.DOM.resolveNode(nodeId=node_id).get('object').get('objectId')
+            frame_id = self.node_fact_cache.get_frame_id(node_id) or self._get_root_frame_id()
+            execution_context_id = self._get_isolated_context_id(frame_id)
+            return self.tab.DOM.resolveNode(nodeId=node_id, executionContextId=execution_context_id).get('object').get('objectId')
         except Exception:
             return None
 
@@ -1540,6 +5491,9 @@ class WebpageScanner:
         return self.tab.DOM.getOuterHTML(nodeId=node_id).get('outerHTML')
 
     def _get_node_name(self, node_id):
+        return self.node_fact_cache.get('node_name', node_id, self._describe_node_name)
+
+    def _describe_node_name(self, node_id):
         try:
             return self.tab.DOM.describeNode(nodeId=node_id).get('node').get('nodeName').lower()
         except pychrome.exceptions.CallMethodException as e:
@@ -1551,10 +5505,6 @@ class WebpageScanner:
             })
             return None
 
-    def _is_script_or_style_node(self, node_id):
-        node_name = self._get_node_name(node_id)
-        return node_name == 'script' or node_name == 'style'
-
     def _is_html_node(self, node_id):
         return self._get_node_name(node_id) == 'html'
 
@@ -1606,9 +5556,128 @@ if __name__ == '__main__':
                         help='whether links and buttons in the detected cookie notices should be ' +
                              'clicked and analyzed or not ' +
                              '(default: false)')
+    parser.add_argument('--click-concurrency', dest='click_concurrency', nargs='?', type=int, default=CLICK_CONCURRENCY,
+                        help='the maximum number of clicks on the clickables of a page that are done at once, ' +
+                             'each in its own browser context if more than one ' +
+                             f'(default: {CLICK_CONCURRENCY})')
+    parser.add_argument('--cache-clicks', dest='cache_click_responses', action='store_true',
+                        help='store the responses of the scan of a page and serve them to the reloads of its clicks, ' +
+                             'only requests that were not stored go to the network')
+    archive_group = parser.add_mutually_exclusive_group()
+    archive_group.add_argument('--record', dest='record_directory', nargs='?', default=None, const='archives',
+                               help='record the responses of every page into an archive file per domain in the given ' +
+                                    'directory (default: `archives`)')
+    archive_group.add_argument('--replay', dest='replay_directory', nargs='?', default=None, const='archives',
+                               help='replay the responses of every page from its archive file in the given directory ' +
+                                    'without network, pages without archive fail (default: `archives`)')
+    parser.add_argument('--filter-cache', dest='filter_cache_directory', nargs='?', default='filter-cache',
+                        help='the directory to store the compiled filter lists in ' +
+                             '(default: `filter-cache`)')
+    parser.add_argument('--prefilter-rules', dest='prefilter_rules', action="store_true",
+                        help='whether only filter rules whose id or class exists on the page ' +
+                             'should be queried ' +
+                             '(default: false)')
+    parser.add_argument('--engine', dest='detection_engine', choices=DETECTION_ENGINES, default=DETECTION_ENGINE_CDP,
+                        help='the engine to detect cookie notices with: ' +
+                             f'`{DETECTION_ENGINE_CDP}` for separate protocol calls for every node, ' +
+                             f'`{DETECTION_ENGINE_BUNDLE}` for one script per frame that runs inside the page, ' +
+                             f'`{DETECTION_ENGINE_SNAPSHOT}` for a snapshot of the page that is processed in python ' +
+                             f'(default: `{DETECTION_ENGINE_CDP}`)')
+    parser.add_argument('--save-snapshots', dest='save_dom_snapshots', action="store_true",
+                        help='whether the snapshots of the pages should be stored in the results directory, ' +
+                             f'only with engine `{DETECTION_ENGINE_SNAPSHOT}` ' +
+                             '(default: false)')
+    parser.add_argument('--keywords', dest='search_keywords', nargs='?', default='cookie',
+                        help='the keywords to find cookie notices by their text: ' +
+                             'a preset (' + ', '.join(f'`{preset}`' for preset in SEARCH_KEYWORD_PRESETS) + ') ' +
+                             'or a comma-separated list of keywords ' +
+                             '(default: `cookie`)')
+    parser.add_argument('--max-property-length', dest='max_property_length', nargs='?', type=int, default=MAX_PROPERTY_LENGTH,
+                        help='the maximum length of the html and text of cookie notices and clickables, ' +
+                             'longer values are truncated, 0 for no limit ' +
+                             f'(default: {MAX_PROPERTY_LENGTH})')
+
+    parser.add_argument('--max-combination-size', dest='max_combination_size', nargs='?', type=int, default=MAX_COMBINATION_SIZE,
+                        help='the maximum number of classes or attributes in the unique combinations of cookie notices ' +
+                             f'(default: {MAX_COMBINATION_SIZE})')
+    parser.add_argument('--max-combination-queries', dest='max_combination_queries', nargs='?', type=int, default=MAX_COMBINATION_QUERIES,
+                        help='the maximum number of class or attribute combinations that are checked for uniqueness, ' +
+                             'the property is listed in `truncated_properties` if the search stops early ' +
+                             f'(default: {MAX_COMBINATION_QUERIES})')
+
+    parser.add_argument('--max-clickables', dest='max_clickables', nargs='?', type=int, default=MAX_CLICKABLES,
+                        help='the maximum number of clickables of a cookie notice, if there are more, ' +
+                             'the most likely accept and reject controls are kept, 0 for no limit ' +
+                             f'(default: {MAX_CLICKABLES})')
+
+    parser.add_argument('--settle-timeout', dest='settle_timeout', nargs='?', type=float, default=SETTLE_TIMEOUT,
+                        help='the maximum number of seconds to wait after the load event until the page settled ' +
+                             f'(default: {SETTLE_TIMEOUT})')
+    parser.add_argument('--settle-quiet-time', dest='settle_quiet_time', nargs='?', type=float, default=SETTLE_QUIET_TIME,
+                        help='the number of seconds without requests and DOM changes after which the page settled ' +
+                             f'(default: {SETTLE_QUIET_TIME})')
+
+    parser.add_argument('--race-fallbacks', dest='race_fallbacks', action='store_true',
+                        help='start the protocol and subdomain fallbacks of a page concurrently with a head start, ' +
+                             'each in its own browser context, and continue with the first one that loads')
+    parser.add_argument('--fallback-head-start', dest='fallback_head_start', nargs='?', type=float, default=FALLBACK_HEAD_START,
+                        help='the number of seconds that a fallback waits for the previous one if they are raced ' +
+                             f'(default: {FALLBACK_HEAD_START})')
+    parser.add_argument('--fallback-grace-period', dest='fallback_grace_period', nargs='?', type=float, default=FALLBACK_GRACE_PERIOD,
+                        help='the number of seconds that a raced fallback which loaded waits for the previous ones ' +
+                             'that are still loading, the first one in the order of the fallbacks is preferred ' +
+                             f'(default: {FALLBACK_GRACE_PERIOD})')
+
+    parser.add_argument('--preflight', dest='preflight', action='store_true',
+                        help='check which protocol and subdomain variants of the pages are reachable before scanning ' +
+                             'and only scan those')
+    parser.add_argument('--preflight-head', dest='preflight_head', action='store_true',
+                        help='send a HEAD request in the pre-flight check')
+    parser.add_argument('--preflight-timeout', dest='preflight_timeout', nargs='?', type=float, default=PREFLIGHT_TIMEOUT,
+                        help='the number of seconds after which a step of the pre-flight check fails ' +
+                             f'(default: {PREFLIGHT_TIMEOUT})')
+    parser.add_argument('--preflight-concurrency', dest='preflight_concurrency', nargs='?', type=int, default=PREFLIGHT_CONCURRENCY,
+                        help='the maximum number of concurrent resolutions and connections of the pre-flight check ' +
+                             f'(default: {PREFLIGHT_CONCURRENCY})')
+
+    parser.add_argument('--block-resources', dest='blocked_resources', nargs='?', default='',
+                        help='a comma-separated list of resource classes whose requests are aborted: ' +
+                             ', '.join(f'`{resource_class}`' for resource_class in BLOCKABLE_RESOURCE_CLASSES) + ', ' +
+                             'blocked requests are flagged in the results ' +
+                             '(default: none)')
+    parser.add_argument('--large-image-size', dest='large_image_size', nargs='?', type=int, default=LARGE_IMAGE_SIZE,
+                        help=f'the number of bytes above which an image of the class `{RESOURCE_CLASS_LARGE_IMAGE}` is blocked ' +
+                             f'(default: {LARGE_IMAGE_SIZE})')
+
+    parser.add_argument('--concurrency', dest='concurrency', nargs='?', type=int, default=1,
+                        help='the number of pages that are scanned at once, each in its own browser context ' +
+                             'if more than one ' +
+                             '(default: 1)')
+    parser.add_argument('--isolate-contexts', dest='isolate_contexts', action='store_true',
+                        help='scan every page in its own browser context instead of clearing the browser')
+
+    parser.add_argument('--cdp-client', dest='cdp_client', choices=CDP_CLIENTS, default=CDP_CLIENT_PYCHROME,
+                        help='the client for the DevTools protocol: ' +
+                             f'`{CDP_CLIENT_PYCHROME}` for a websocket and two threads per tab, ' +
+                             f'`{CDP_CLIENT_ASYNCIO}` for one websocket per browser on an event loop ' +
+                             f'(default: `{CDP_CLIENT_PYCHROME}`)')
+    parser.add_argument('--browsers', dest='browsers', nargs='?', type=int, default=0,
+                        help='the number of chromium instances that are launched and supervised by the scanner, ' +
+                             '0 to use the browser on port 9222 ' +
+                             '(default: 0)')
+    parser.add_argument('--headless', dest='headless', action='store_true',
+                        help='launch the chromium instances in headless mode')
+    parser.add_argument('--chromium-path', dest='chromium_path', nargs='?', default=None,
+                        help='the executable of chromium that is launched ' +
+                             '(default: the first one of ' + ', '.join(f'`{chromium_path}`' for chromium_path in CHROMIUM_PATHS) + ')')
 
     # load the correct dataset
     args = parser.parse_args()
+    search_keywords = SEARCH_KEYWORD_PRESETS.get(args.search_keywords, args.search_keywords.split(','))
+    blocked_resources = [blocked_resource.strip() for blocked_resource in args.blocked_resources.split(',') if blocked_resource.strip()]
+    for blocked_resource in blocked_resources:
+        if blocked_resource not in BLOCKABLE_RESOURCE_CLASSES:
+            parser.error(f'unknown resource class `{blocked_resource}`')
     if args.dataset == ARG_TOP_2000:
         tranco = Tranco(cache=True, cache_dir='tranco')
         tranco_list = tranco.list(date='2020-03-01')
@@ -1618,25 +5687,63 @@ if __name__ == '__main__':
         with open('resources/sampled-domains.txt') as f:
             domains = [line.strip() for line in f]
 
-    # create multiprocessor pool:
-    # currently only one tab is processed at a time -> not parallel
-    pool = mp.Pool(1)
-
-    # create the browser and a helper function to scan pages
-    browser = Browser(abp_filter_filenames=['resources/easylist-cookie.txt', 'resources/i-dont-care-about-cookies.txt'])
-    f_scan_page = partial(Browser.scan_page, browser)
+    # the options of the browser and a helper function to scan pages
+    browser_options = dict(abp_filter_filenames=['resources/easylist-cookie.txt', 'resources/i-dont-care-about-cookies.txt'],
+                           abp_filter_cache_directory=args.filter_cache_directory,
+                           race_fallbacks=args.race_fallbacks,
+                           fallback_head_start=args.fallback_head_start,
+                           fallback_grace_period=args.fallback_grace_period,
+                           isolate_contexts=args.isolate_contexts or args.concurrency > 1,
+                           prefilter_rules=args.prefilter_rules,
+                           detection_engine=args.detection_engine,
+                           max_property_length=args.max_property_length,
+                           search_keywords=[search_keyword.strip() for search_keyword in search_keywords if search_keyword.strip()],
+                           max_combination_size=args.max_combination_size,
+                           max_combination_queries=args.max_combination_queries,
+                           max_clickables=args.max_clickables,
+                           settle_timeout=args.settle_timeout,
+                           settle_quiet_time=args.settle_quiet_time,
+                           cdp_client=args.cdp_client,
+                           click_concurrency=args.click_concurrency,
+                           cache_click_responses=args.cache_click_responses,
+                           record_directory=args.record_directory,
+                           replay_directory=args.replay_directory,
+                           blocked_resources=blocked_resources,
+                           large_image_size=args.large_image_size,
+                           save_dom_snapshot=args.save_dom_snapshots)
+
+    # create multiprocessor pool, every process scans one page at a time:
+    # the data of the pages is only separated if they are scanned in their
+    # own browser contexts
+    fleet = None
+    if args.browsers > 0:
+        # every chromium instance of the fleet is used by `concurrency` processes
+        fleet = BrowserFleet(args.browsers, chromium_path=args.chromium_path, headless=args.headless,
+                             slots_per_browser=args.concurrency)
+        pool = mp.Pool(len(fleet))
+        slots = fleet.start()
+        f_scan_page = partial(scan_page_in_fleet, slots, browser_options)
+    else:
+        pool = mp.Pool(args.concurrency)
+        browser = Browser(**browser_options)
+        f_scan_page = partial(Browser.scan_page, browser)
 
     # create results directory if necessary
     os.makedirs(args.results_directory, exist_ok=True)
+    if args.record_directory is not None:
+        os.makedirs(args.record_directory, exist_ok=True)
 
     # this is a callback function that is called when scanning a page finished
     def f_page_scanned(result):
-        # cookies are not correct if pages are scanned in parallel
+        # the cookies are correct because pages that are scanned in parallel
+        # have their own browser contexts
         #result.exclude_field_from_json('cookies')
 
         # save results and screenshots
         result.save_data(args.results_directory)
         result.save_screenshots(args.results_directory)
+        if args.save_dom_snapshots:
+            result.save_dom_snapshot(args.results_directory)
 
         # ocr with tesseract
         #subprocess.call(["tesseract", result.screenshot_filename, result.ocr_filename, "--oem", "1", "-l", "eng+deu"])
@@ -1644,19 +5751,32 @@ if __name__ == '__main__':
         print(f'#{str(result.rank)}: {result.url}')
         if result.stopped_waiting:
             print(f'-> stopped waiting for {result.stopped_waiting_reason}')
+        if args.replay_directory is not None and len(result.unreplayed_requests) > 0:
+            print(f'-> {len(result.unreplayed_requests)} requests not in the archive')
         if result.failed:
             print(f'-> failed: {result.failed_reason}' + (f' ({result.failed_exception})' if result.failed_exception is not None else ''))
             if result.failed_traceback is not None:
                 print(result.failed_traceback)
 
+    # skip everything that is not between start and end rank
+    webpages = [
+            Webpage(rank=rank, domain=domain)
+            for rank, domain in enumerate(domains, start=1)
+            if rank >= args.start_rank and (args.end_rank == -1 or rank <= args.end_rank)
+        ]
+
+    # check which variants of the pages are reachable
+    if args.preflight:
+        reachability_checker = ReachabilityChecker(timeout=args.preflight_timeout, concurrency=args.preflight_concurrency,
+                                                   head_request=args.preflight_head)
+        reachability_checker.check(webpages)
+
     # scan the pages
-    for rank, domain in enumerate(domains, start=1):
-        # skip everything that is not between start and end rank
-        if rank < args.start_rank or (args.end_rank != -1 and rank > args.end_rank):
-            continue
-        webpage = Webpage(rank=rank, domain=domain)
+    for webpage in webpages:
         pool.apply_async(f_scan_page, args=(webpage, args.do_click), callback=f_page_scanned)
 
     # close pool
     pool.close()
     pool.join()
+    if fleet is not None:
+        fleet.stop()
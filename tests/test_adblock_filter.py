@@ -0,0 +1,57 @@
+import os
+import pickle
+import sys
+import tempfile
+import unittest
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scan import AdblockPlusFilter
+
+
+class AdblockPlusFilterTest(unittest.TestCase):
+    """Checks that invalid rules are excluded by every filter of the same
+    filter list in a process."""
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.rules_filename = os.path.join(self.directory.name, 'cookie-rules.txt')
+
+        # the invalid rules are kept per process, a unique comment makes the
+        # filter list of every test a different one
+        with open(self.rules_filename, 'w') as filterlist:
+            filterlist.write(f'! {uuid.uuid4()}\n')
+            filterlist.write('##.cookie-banner\n')
+            filterlist.write('##div[[invalid\n')
+            filterlist.write('example.com##.cc-window\n')
+            filterlist.write('##div:-abp-has(.cookie)\n')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_applicable_rules(self):
+        abp_filter = AdblockPlusFilter(self.rules_filename)
+        self.assertEqual(abp_filter.get_applicable_rules('example.com'), ['.cookie-banner', 'div[[invalid', '.cc-window'])
+        self.assertEqual(abp_filter.get_applicable_rules('example.org'), ['.cookie-banner', 'div[[invalid'])
+
+    def test_invalid_rules_of_other_instance(self):
+        AdblockPlusFilter(self.rules_filename).add_invalid_rules(['div[[invalid'])
+        abp_filter = AdblockPlusFilter(self.rules_filename, cache_directory=os.path.join(self.directory.name, 'cache'))
+        self.assertEqual(abp_filter.get_applicable_rules('example.com'), ['.cookie-banner', '.cc-window'])
+
+    def test_invalid_rules_of_unpickled_copy(self):
+        abp_filter = AdblockPlusFilter(self.rules_filename)
+        copied_abp_filter = pickle.loads(pickle.dumps(abp_filter))
+        abp_filter.add_invalid_rules(['div[[invalid'])
+        self.assertEqual(copied_abp_filter.get_applicable_rules('example.org'), ['.cookie-banner'])
+
+    def test_invalid_rules_of_other_filter_list(self):
+        AdblockPlusFilter(self.rules_filename).add_invalid_rules(['div[[invalid'])
+        with open(self.rules_filename, 'a') as filterlist:
+            filterlist.write('##.consent\n')
+        abp_filter = AdblockPlusFilter(self.rules_filename)
+        self.assertEqual(abp_filter.get_applicable_rules('example.org'), ['.cookie-banner', 'div[[invalid', '.consent'])
+
+
+if __name__ == '__main__':
+    unittest.main()
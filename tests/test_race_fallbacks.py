@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scan
+from scan import Browser, Webpage, WebpageResult, FAILED_REASON_LOADING
+
+
+class FakeScanner:
+    """Commits the navigation of a webpage after the delay of its url or
+    fails to load it if the delay is `None`."""
+    delays = {}
+
+    def __init__(self, tab, webpage, **kwargs):
+        self.webpage = webpage
+        self.result = WebpageResult(webpage)
+        self.cancelled = False
+
+    def scan(self, clear_browser=True, on_navigation_committed=None):
+        delay = self.delays.get(self.webpage.url)
+        if delay is None:
+            self.result.set_failed(FAILED_REASON_LOADING, 'net::ERR_CONNECTION_REFUSED')
+            return self.result
+        time.sleep(delay)
+        if not on_navigation_committed():
+            self.cancel()
+        return self.result
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class RaceFallbacksTest(unittest.TestCase):
+    """Checks which fallback of a page wins the race."""
+    def setUp(self):
+        self.browser = Browser.__new__(Browser)
+        self.browser.abp_filters = {}
+        self.browser.language_detector = None
+        self.browser.scanner_options = {}
+        self.browser.fallback_head_start = 0.05
+        self.browser.fallback_grace_period = 0.5
+        self.browser._new_tab = lambda isolate_context=None: object()
+        self.browser._close_tab = lambda tab: None
+        self.webpages = Webpage(rank=1, domain='example.com').get_fallbacks()
+
+    def race(self, delays):
+        FakeScanner.delays = delays
+        with mock.patch.object(scan, 'WebpageScanner', FakeScanner):
+            webpage, page_scanner = self.browser._race_page(self.webpages)
+        return webpage.url
+
+    def test_earlier_fallback_within_grace_period(self):
+        url = self.race({'https://example.com': 0.2, 'https://www.example.com': 0.01, 'http://example.com': 0.01})
+        self.assertEqual(url, 'https://example.com')
+
+    def test_earlier_fallback_after_grace_period(self):
+        url = self.race({'https://example.com': 1, 'https://www.example.com': 0.01})
+        self.assertEqual(url, 'https://www.example.com')
+
+    def test_failed_earlier_fallback(self):
+        url = self.race({'https://example.com': None, 'https://www.example.com': None, 'http://example.com': 0.01})
+        self.assertEqual(url, 'http://example.com')
+
+    def test_all_failed(self):
+        url = self.race({})
+        self.assertEqual(url, 'http://www.example.com')
+
+
+if __name__ == '__main__':
+    unittest.main()
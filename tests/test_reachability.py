@@ -0,0 +1,90 @@
+import http.server
+import os
+import socket
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scan import ReachabilityChecker, Webpage
+
+
+class HeadRequestHandler(http.server.BaseHTTPRequestHandler):
+    def do_HEAD(self):
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def get_closed_port():
+    """Returns a port on which no server listens."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class ReachabilityCheckerTest(unittest.TestCase):
+    """Checks the variants of a webpage against a local resolver and HTTP server.
+
+    The resolver only knows `example.test`, `www.example.test` does not
+    exist. Plain HTTP is served on the port of `http`, the port of `https`
+    is given per test.
+    """
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), HeadRequestHandler)
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    async def resolve(self, host):
+        if host == 'example.test':
+            return ['127.0.0.1']
+        raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+
+    def check(self, https_port, head_request=False):
+        webpage = Webpage(rank=1, domain='example.test')
+        reachability_checker = ReachabilityChecker(timeout=2, head_request=head_request, resolver=self.resolve,
+                                                   ports={'http': self.server.server_port, 'https': https_port})
+        reachability_checker.check([webpage])
+        return {variant.get('url'): variant for variant in webpage.reachability}
+
+    def test_reachable(self):
+        for head_request in [False, True]:
+            reachability = self.check(get_closed_port(), head_request=head_request)
+            self.assertTrue(reachability.get('http://example.test').get('reachable'))
+            self.assertIsNone(reachability.get('http://example.test').get('error'))
+
+    def test_refused(self):
+        reachability = self.check(get_closed_port())
+        self.assertFalse(reachability.get('https://example.test').get('reachable'))
+        self.assertIn('ConnectionRefusedError', reachability.get('https://example.test').get('error'))
+
+    def test_nxdomain(self):
+        reachability = self.check(get_closed_port())
+        for url in ['https://www.example.test', 'http://www.example.test']:
+            self.assertFalse(reachability.get(url).get('reachable'))
+            self.assertIn('gaierror', reachability.get(url).get('error'))
+
+    def test_tls_failure(self):
+        # the https variant connects to the plain HTTP server
+        reachability = self.check(self.server.server_port)
+        self.assertFalse(reachability.get('https://example.test').get('reachable'))
+        self.assertIn('SSL', reachability.get('https://example.test').get('error'))
+        self.assertTrue(reachability.get('http://example.test').get('reachable'))
+
+    def test_fallbacks(self):
+        webpage = Webpage(rank=1, domain='example.test')
+        reachability_checker = ReachabilityChecker(timeout=2, resolver=self.resolve,
+                                                   ports={'http': self.server.server_port, 'https': get_closed_port()})
+        reachability_checker.check([webpage])
+        self.assertEqual([fallback.url for fallback in webpage.get_fallbacks()], ['http://example.test'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scan import ResponseArchive, ResponseStore, Webpage, WebpageScanner, RESPONSE_STORE_RECORD, RESPONSE_STORE_REPLAY_ONLY
+
+
+class FakeNetwork:
+    """Returns the body of every response and counts the calls."""
+    def __init__(self):
+        self.response_body_calls = 0
+
+    def getResponseBody(self, requestId):
+        self.response_body_calls += 1
+        return {'body': f'body of {requestId}', 'base64Encoded': False}
+
+
+class ResponseStoreTest(unittest.TestCase):
+    """Checks that the responses are stored by their method and url."""
+    def test_method(self):
+        response_store = ResponseStore()
+        response_store.add('GET', 'https://example.com/', 200, [], b'page')
+        self.assertEqual(response_store.get('GET', 'https://example.com/'), (200, [], b'page'))
+        self.assertIsNone(response_store.get('POST', 'https://example.com/'))
+
+    def test_archive_method(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'example.com.archive')
+            response_archive = ResponseArchive(filename, writable=True)
+            response_archive.add('GET', 'https://example.com/', 200, [], b'page')
+            response_archive.close()
+
+            response_archive = ResponseArchive(filename)
+            self.assertEqual(response_archive.get('GET', 'https://example.com/'), (200, [], b'page'))
+            self.assertIsNone(response_archive.get('POST', 'https://example.com/'))
+            response_archive.close()
+
+
+class RecordResponsesTest(unittest.TestCase):
+    """Checks which responses a scan records and that their bodies are
+    fetched after the events."""
+    def setUp(self):
+        self.response_store = ResponseStore()
+        self.network = FakeNetwork()
+        self.scanner = WebpageScanner(mock.Mock(Network=self.network), {}, Webpage(rank=1, domain='example.com'),
+                                      language_detector=object(), response_store=self.response_store,
+                                      response_store_mode=RESPONSE_STORE_RECORD)
+        with mock.patch.object(WebpageScanner, '_setup_tab'):
+            self.scanner._setup()
+
+    def load(self, request_id, method, url, status=200, redirect_response=None):
+        self.scanner._event_request_will_be_sent({'url': url, 'method': method}, request_id, type='Document',
+                                                 redirectResponse=redirect_response)
+        if status is not None:
+            self.scanner._event_response_received({'url': url, 'mimeType': 'text/html', 'status': status, 'headers': {}},
+                                                  request_id)
+            self.scanner._event_loading_finished(request_id)
+
+    def test_bodies_after_events(self):
+        self.load('1', 'GET', 'https://example.com/')
+        self.assertEqual(self.network.response_body_calls, 0)
+        self.scanner._record_finished_responses()
+        self.assertEqual(self.network.response_body_calls, 1)
+        status, headers, body = self.response_store.get('GET', 'https://example.com/')
+        self.assertEqual(body, b'body of 1')
+
+    def test_non_get(self):
+        self.load('1', 'POST', 'https://example.com/form')
+        self.scanner._record_finished_responses()
+        self.assertEqual(len(self.response_store), 0)
+        self.assertEqual(self.network.response_body_calls, 0)
+
+    def test_redirects(self):
+        # the redirect of the POST request is not stored, the one of the GET
+        # request that follows is
+        self.load('1', 'POST', 'https://example.com/form', status=None)
+        self.load('1', 'GET', 'https://example.com/sent', status=None,
+                  redirect_response={'url': 'https://example.com/form', 'status': 303, 'headers': {}})
+        self.load('1', 'GET', 'https://example.com/thanks',
+                  redirect_response={'url': 'https://example.com/sent', 'status': 302, 'headers': {}})
+        self.scanner._record_finished_responses()
+        self.assertIsNone(self.response_store.get('GET', 'https://example.com/form'))
+        self.assertIsNone(self.response_store.get('POST', 'https://example.com/form'))
+        self.assertEqual(self.response_store.get('GET', 'https://example.com/sent')[0], 302)
+        self.assertEqual(self.response_store.get('GET', 'https://example.com/thanks')[0], 200)
+
+
+class ReplayResponsesTest(unittest.TestCase):
+    """Checks that the requests which are not stored are listed when only
+    the stored responses are replayed."""
+    def setUp(self):
+        self.response_store = ResponseStore()
+        self.response_store.add('GET', 'https://example.com/', 200, [], b'page')
+        self.tab = mock.Mock()
+        self.scanner = WebpageScanner(self.tab, {}, Webpage(rank=1, domain='example.com'),
+                                      language_detector=object(), response_store=self.response_store,
+                                      response_store_mode=RESPONSE_STORE_REPLAY_ONLY)
+        with mock.patch.object(WebpageScanner, '_setup_tab'):
+            self.scanner._setup()
+
+    def test_unreplayed_requests(self):
+        self.scanner._event_request_paused('1', 'Document', request={'method': 'GET', 'url': 'https://example.com/'})
+        self.scanner._event_request_paused('2', 'Script', request={'method': 'GET', 'url': 'https://example.com/app.js'})
+        self.scanner._event_request_paused('3', 'XHR', request={'method': 'POST', 'url': 'https://example.com/'})
+        self.assertEqual(self.tab.Fetch.fulfillRequest.call_count, 1)
+        self.assertEqual(self.tab.Fetch.failRequest.call_count, 2)
+        self.assertEqual(self.scanner.result.unreplayed_requests, [
+                {'method': 'GET', 'url': 'https://example.com/app.js'},
+                {'method': 'POST', 'url': 'https://example.com/'},
+            ])
+
+
+if __name__ == '__main__':
+    unittest.main()